@@ -1,22 +1,60 @@
 from flask_cors import CORS
-from config import pt_timezone
+from config import (
+    admin_uids,
+    archive_after_days,
+    batch_workers,
+    change_feed_heartbeat_s,
+    change_feed_max_subscribers,
+    change_feed_max_subscribers_per_user,
+    change_feed_max_threaded_streams,
+    image_format,
+    image_max_size,
+    image_quality,
+    image_thumbnail_size,
+    image_upload_max_bytes,
+    image_upload_url_ttl_s,
+    image_workers,
+    invitation_ttl_days,
+    metrics_public,
+    metrics_token,
+    orphan_image_grace_hours,
+    profile_sample_every,
+    profile_slow_ms,
+    pt_timezone,
+)
+from concurrent.futures import ThreadPoolExecutor
+import contextvars
 from datetime import datetime, timedelta
 from functools import wraps
+import hashlib
 import json
 import requests
 import secrets
 import sys
-import uuid
+import threading
+import time
 import os
+from typing import Any, Callable, Dict
+from urllib.parse import urlsplit
 
 from absl import logging as log
 import firebase_admin
-import firebase_admin.messaging as messaging
 
-from firebase_admin import credentials, auth, firestore, storage
+from firebase_admin import credentials, auth, storage
 from firebase_admin.auth import InvalidIdTokenError, ExpiredIdTokenError
-from flask import Flask, jsonify, redirect, request, render_template
+from flask import (
+    Flask,
+    Response,
+    g,
+    jsonify,
+    redirect,
+    request,
+    render_template,
+    stream_with_context,
+)
 import flask_login
+from werkzeug.exceptions import HTTPException
+from werkzeug.test import EnvironBuilder
 from flask_login import (
     LoginManager,
     login_user,
@@ -25,14 +63,41 @@ from flask_login import (
 )
 from apscheduler.schedulers.background import BackgroundScheduler
 from auth_manager import AuthManager
+from barcode_index import BarcodeNameIndex
 from barcode_manager import BarcodeManager, Barcode
-from household_manager import Household, HouseholdManager
-from product_manager import ProductManager, Product
+from change_feed import ChangeSource, HouseholdChangeFeed, TooManySubscribersException
+import concurrency
+from deletion_manager import DeletionManager
+from household_manager import Household, HouseholdManager, HouseholdNotFoundException
+from image_processing import ImageProcessor, InvalidImageException
+from image_store import (
+    ImageStore,
+    UPLOAD_CONTENT_TYPES,
+    UploadNotFoundException,
+    UploadTooLargeException,
+    thumbnail_url,
+)
+import metrics
+from product_export import EXPORT_MIMETYPES, LINE_WRITERS, STATUS_FILTERS
+from product_import import ProductImporter, ROW_READERS
+from product_manager import (
+    ProductManager,
+    Product,
+    ProductConflictException,
+    ProductNotFoundException,
+)
+from profiling import RequestProfiler
 from recipe import RecipeGenerator
+import request_cache
+from request_cache import RequestCache
+import request_stats
+from request_stats import InstrumentedFirestore, RequestStats
+from search_index import ProductSearchIndex
 from secrets_manager import SecretsManager
 from shopping_list_manager import ShoppingListManager, ShoppingListItem
+from storage import create_document_store, uses_local_storage
 from user_manager import UserManager, User
-from timing import measure_time
+from timing import measure_time, startup_phase
 
 
 def set_logging_params(debug_logging_enabled: bool = False):
@@ -55,24 +120,80 @@ app.config.update(SESSION_COOKIE_SECURE=True)
 set_logging_params()
 secrets_mgr = SecretsManager()
 auth_mgr = AuthManager(secrets_mgr)
-json_data = json.loads(secrets_mgr.get_firebase_service_account_json())
-cred = credentials.Certificate(json_data)
-openai = secrets_mgr.get_openai_api_key()
-
-firebase_admin.initialize_app(
-    cred, {"storageBucket": "pantryguardian-f8381.appspot.com"}
-)
+with startup_phase("firebase"):
+    if uses_local_storage():
+        # No service account needed: the credentials are only resolved once a
+        # Google API (auth, storage) is actually called.
+        firebase_admin.initialize_app(
+            credentials.ApplicationDefault(),
+            {
+                "projectId": "pantryguardian-f8381",
+                "storageBucket": "pantryguardian-f8381.appspot.com",
+            },
+        )
+    else:
+        # Resolve the other secrets while waiting for the service account.
+        secrets_mgr.prefetch()
+        json_data = json.loads(secrets_mgr.get_firebase_service_account_json())
+        cred = credentials.Certificate(json_data)
+        firebase_admin.initialize_app(
+            cred, {"storageBucket": "pantryguardian-f8381.appspot.com"}
+        )
 
-firestore = firestore.client()
-barcodes = BarcodeManager(firestore)
-product_mgr = ProductManager(firestore)
-household_manager = HouseholdManager(firestore)
-shopping_list_mgr = ShoppingListManager(firestore)
+with startup_phase("instrumentation"):
+    request_stats.instrument_google_services()
+with startup_phase("document_store"):
+    # The Firestore client itself is created by the first call.
+    firestore = InstrumentedFirestore(create_document_store())
+with startup_phase("managers"):
+    barcodes = BarcodeManager(firestore)
+    product_mgr = ProductManager(firestore)
+    household_manager = HouseholdManager(firestore, invitation_ttl_days * 24 * 60 * 60)
+    shopping_list_mgr = ShoppingListManager(firestore)
+    search_index = ProductSearchIndex(product_mgr.get_household_products)
+    barcode_name_index = BarcodeNameIndex(barcodes.iter_names)
+    product_mgr.add_listener(search_index)
+    image_store = ImageStore(firestore, storage.bucket)
+    deletion_mgr = DeletionManager(firestore, image_store.release)
+
+_recipe_generator: RecipeGenerator | None = None
+
+
+def get_recipe_generator() -> RecipeGenerator:
+    # Created on first use, so the OpenAI key is not needed to start the app.
+    global _recipe_generator
+    if _recipe_generator is None:
+        _recipe_generator = RecipeGenerator(secrets_mgr)
+    return _recipe_generator
 
-# Create an instance of SendMail with the app and pt_timezone
-recipe_generator = RecipeGenerator(secrets_mgr)
 
 user_manager = UserManager()
+image_processor = ImageProcessor(
+    max_size=image_max_size,
+    thumbnail_size=image_thumbnail_size,
+    format=image_format,
+    quality=image_quality,
+    workers=image_workers,
+)
+request_profiler = RequestProfiler(profile_sample_every, profile_slow_ms)
+# Runs the sub-requests of /batch requests.
+batch_executor = ThreadPoolExecutor(max_workers=batch_workers, thread_name_prefix="batch")
+change_feed = HouseholdChangeFeed(
+    {
+        "product": ChangeSource(
+            product_mgr.household_products_query,
+            lambda doc: product_to_json(ProductManager.product_from_dict(doc)),
+        ),
+        "shopping_item": ChangeSource(
+            shopping_list_mgr.household_shopping_list_query,
+            lambda doc: shopping_item_to_json(ShoppingListManager.item_from_dict(doc)),
+        ),
+    },
+    max_subscribers=change_feed_max_subscribers,
+    max_subscribers_per_user=change_feed_max_subscribers_per_user,
+)
+# Each /household_changes stream holds one of the server's threads.
+threaded_stream_slots = threading.BoundedSemaphore(max(change_feed_max_threaded_streams, 1))
 
 # Used to manages sessions and user logins
 login_manager = LoginManager()
@@ -83,6 +204,9 @@ login_manager.login_view = "login"
 scheduler = BackgroundScheduler()
 # scheduler.start()
 
+# Runs periodic housekeeping jobs (e.g. archiving old products).
+maintenance_scheduler = BackgroundScheduler(daemon=True)
+
 
 # Create an instance of SendMail with the app and pt_timezone
 def convert_to_pt(dt):
@@ -97,11 +221,117 @@ def load_user(uid: str) -> User:
     return user
 
 
-@measure_time
+# Key of the BatchContext in the WSGI environ of /batch sub-requests. Clients
+# cannot set it, unlike headers.
+BATCH_ENVIRON_KEY = "pantry_guardian.batch"
+# Maximum number of sub-requests of a /batch request.
+MAX_BATCH_REQUESTS = 20
+# Endpoints that may be batched: the reads the app makes on launch. They return
+# small JSON responses, unlike e.g. /export_products or /household_changes,
+# and cannot nest /batch requests.
+BATCH_ENDPOINTS = frozenset(
+    (
+        "list_households",
+        "get_last_active_household",
+        "get_locations_categories",
+        "list_products",
+        "list_archived_products",
+        "get_shopping_list",
+        "get_pending_invitations",
+        "get_notification_settings",
+        "get_view_settings",
+        "search_products",
+        "get_barcode",
+    )
+)
+
+
+class BatchContext:
+    """What the sub-requests of a /batch request share with it."""
+
+    def __init__(self, user: User, stats: RequestStats | None, cache: RequestCache | None) -> None:
+        self.user = user
+        self.stats = stats
+        self.cache = cache
+
+
+# Counts the backend calls made while handling each request, see request_stats.py,
+# and records the request metrics.
+@app.before_request
+def start_request_stats():
+    g.request_start_time = time.perf_counter()
+    metrics.requests_in_flight.labels().inc()
+    # /batch sub-requests count their calls with, and share the cache of, the
+    # batch request.
+    batch = request.environ.get(BATCH_ENVIRON_KEY)
+    request_stats.start(batch.stats if batch else None)
+    request_cache.start(batch.cache if batch else None)
+    g.request_profile = request_profiler.start()
+
+
+@app.after_request
+def report_request_stats(response):
+    g.response_status = response.status_code
+    metrics.responses.labels(request.endpoint, response.status_code).inc()
+    stats = request_stats.current()
+    if stats is not None and BATCH_ENVIRON_KEY not in request.environ:
+        stats_json = stats.to_json()
+        log.info(f"request_stats {request.path} {response.status_code} {stats_json}")
+        if app.debug or app.config.get("REQUEST_STATS_HEADER"):
+            response.headers["X-Request-Stats"] = stats_json
+    return response
+
+
+@app.teardown_request
+def stop_request_stats(exc):
+    stats = request_stats.stop()
+    request_cache.stop()
+    metrics.requests_in_flight.labels().dec()
+    profile = g.pop("request_profile", None)
+    if profile is not None:
+        request_profiler.finish(
+            profile,
+            request.endpoint,
+            request.path,
+            g.get("response_status"),
+            stats.to_dict() if stats is not None else None,
+        )
+    start_time = g.pop("request_start_time", None)
+    if start_time is not None:
+        metrics.request_latency.labels(request.endpoint).observe(
+            time.perf_counter() - start_time
+        )
+
+
+if metrics_public and not metrics_token:
+    log.warning("METRICS_PUBLIC is set, /metrics is served without authentication")
+
+
+@app.route("/metrics", methods=["GET"])
+def get_metrics():
+    """
+    Metrics in the Prometheus text format. Requires METRICS_TOKEN, and is only
+    served without one if METRICS_PUBLIC is set.
+    """
+    if not metrics_token:
+        if not metrics_public:
+            return jsonify({"message": "Not Found"}), 404
+    elif not secrets.compare_digest(
+        request.headers.get("Authorization", ""), f"Bearer {metrics_token}"
+    ):
+        return jsonify({"message": "Unauthorized"}), 401
+    return Response(metrics.registry.render(), mimetype="text/plain; version=0.0.4")
+
+
 def token_required(f):
     @wraps(f)
     def decorated(*args, **kwargs):
         log.info(f"token_required({request.path})")
+        batch = request.environ.get(BATCH_ENVIRON_KEY)
+        if batch is not None:
+            # A /batch sub-request, the token of the batch request was verified.
+            flask_login.login_user(batch.user)
+            return f(*args, **kwargs)
         token = request.headers.get("idToken")
         if not token:
             log.error("Token is missing!")
@@ -127,6 +357,113 @@ def token_required(f):
     return decorated
 
 
+def admin_required(f):
+    """Restricts a route (after token_required) to the users in ADMIN_UIDS."""
+
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        if flask_login.current_user.get_id() not in admin_uids:
+            return jsonify({"message": "Admin access required"}), 403
+        return f(*args, **kwargs)
+
+    return decorated
+
+
+@app.route("/admin/profiles", methods=["GET"])
+@token_required
+@admin_required
+def get_request_profiles():
+    """Returns the profiled and slow requests captured by request_profiler."""
+    return jsonify(
+        {
+            "enabled": request_profiler.enabled,
+            "profiles": request_profiler.entries(),
+        }
+    )
+
+
+@app.route("/batch", methods=["POST"])
+@token_required
+@measure_time
+def batch_requests():
+    """
+    Handles several requests in one round trip, e.g. the ones the app makes
+    on launch. The body is {"requests": [{"path": "/list_products", "body":
+    {...}}, ...]} ("method" defaults to POST, an optional "id" is echoed),
+    and the response has a {"status", "body"} per sub-request, in order.
+    The token is verified once and the sub-requests share the request cache.
+    They run concurrently, so they must not depend on each other.
+    """
+    data = request.json or {}
+    sub_requests = data.get("requests")
+    if not isinstance(sub_requests, list) or not sub_requests:
+        return jsonify({"error": "requests must be a non-empty list"}), 400
+    if len(sub_requests) > MAX_BATCH_REQUESTS:
+        return (
+            jsonify({"error": f"At most {MAX_BATCH_REQUESTS} requests per batch"}),
+            400,
+        )
+    for sub_request in sub_requests:
+        if not is_batchable(sub_request):
+            return jsonify({"error": f"Invalid request: {sub_request}"}), 400
+
+    context = BatchContext(
+        flask_login.current_user._get_current_object(),
+        request_stats.current(),
+        request_cache.current(),
+    )
+    # Each sub-request runs in an empty context, so it gets its own app
+    # context (and flask.g) instead of the one of the batch request.
+    futures = [
+        batch_executor.submit(contextvars.Context().run, run_sub_request, sub_request, context)
+        for sub_request in sub_requests
+    ]
+    return jsonify({"responses": [future.result() for future in futures]})
+
+
+def is_batchable(sub_request: Any) -> bool:
+    """Whether a /batch sub-request is well-formed and goes to one of BATCH_ENDPOINTS."""
+    if not isinstance(sub_request, dict):
+        return False
+    path = sub_request.get("path")
+    method = sub_request.get("method", "POST")
+    if not isinstance(path, str) or not path.startswith("/") or not isinstance(method, str):
+        return False
+    try:
+        endpoint, _ = app.url_map.bind("").match(urlsplit(path).path, method)
+    except HTTPException:
+        return False
+    return endpoint in BATCH_ENDPOINTS
+
+
+def run_sub_request(sub_request: Dict[str, Any], context: BatchContext) -> Dict[str, Any]:
+    environ = EnvironBuilder(
+        path=sub_request["path"],
+        method=sub_request.get("method", "POST"),
+        json=sub_request.get("body"),
+    ).get_environ()
+    environ[BATCH_ENVIRON_KEY] = context
+    result: Dict[str, Any] = {"id": sub_request["id"]} if "id" in sub_request else {}
+    try:
+        with app.request_context(environ):
+            response = app.full_dispatch_request()
+    except Exception as e:
+        log.error(f"Error handling batched request {sub_request['path']}: {str(e)}")
+        return result | {"status": 500, "body": {"error": str(e)}}
+    if response.is_streamed:
+        # Not sent by BATCH_ENDPOINTS; reading it could block for good.
+        response.close()
+        log.error(f"Batched request {sub_request['path']} returned a streamed response")
+        return result | {"status": 500, "body": {"error": "Streamed responses cannot be batched"}}
+    body = response.get_json(silent=True) if response.is_json else None
+    result.update(
+        status=response.status_code,
+        body=body if body is not None else response.get_data(as_text=True),
+    )
+    response.close()
+    return result
+
+
 @app.route("/health", methods=["GET"])
 @measure_time
 def health():
@@ -214,12 +551,17 @@ def auth_route():
 
     if response.ok:
         uid = response.uid
-        user = user_manager.get_user(uid)
+        # These only depend on the user ID, so run them concurrently. Set
+        # default notification settings if not already set.
+        user, households, _ = concurrency.gather(
+            lambda: user_manager.get_user(uid),
+            lambda: household_manager.get_households_for_user(uid),
+            lambda: set_default_notification_settings(uid),
+        )
         login_user(user)
         log.info("User successfully logged in: %s", user.display_name())
 
         # Ensure there is at least one household for the user
-        households = household_manager.get_households_for_user(user.get_id())
         if len(households) == 0:
             log.warning("No households found for user. Creating one now")
             name = (
@@ -231,9 +573,6 @@ def auth_route():
             if not household_manager.add_or_update_household(household):
                 log.error("Unable to create default household for user.")
 
-        # Set default notification settings if not already set
-        set_default_notification_settings(uid)
-
         # Send the client the auth tokens and the user's display name
         token_response = {
             "rt": response.refresh_token,
@@ -271,37 +610,86 @@ def list_products():
 
     uid = flask_login.current_user.get_id()
 
-    if not household_manager.user_has_household(uid, household_id):
+    # Checked before the query, non-members must not trigger reads of the
+    # household's products.
+    if not household_manager.is_member(uid, household_id):
         log.warning("Permission denied for user to list_products for given household")
         return jsonify([]), 403
-
     products = product_mgr.get_household_products(household_id)
 
     log.info(f"Got {len(products)} products!")
 
-    result = []
-    for product in products:
-        result.append(
-            {
-                "product_name": product.product_name,
-                "expiration_date": (
-                    product.expiration_str() if product.does_expire else "No Expiration"
-                ),
-                "location": product.location,
-                "category": product.category,
-                "product_id": product.id,
-                "expired": product.does_expire
-                and product.expires < int(datetime.utcnow().timestamp() * 1000),
-                "creation_date": product.creation_str(),
-                "wasted": product.wasted,
-                "used": product.used,
-                "used_timestamp": product.used_timestamp_str() if product.used_timestamp else None,
-                "note": product.note or "",
-                "image_url": product.image_url,
-                "opened": product.opened,
-            }
-        )
-    return jsonify(result)
+    return jsonify([product_to_json(product) for product in products])
+
+
+def product_to_json(product: Product) -> dict:
+    return {
+        "product_name": product.product_name,
+        "expiration_date": (
+            product.expiration_str() if product.does_expire else "No Expiration"
+        ),
+        "location": product.location,
+        "category": product.category,
+        "product_id": product.id,
+        "expired": product.does_expire
+        and product.expires < int(datetime.utcnow().timestamp() * 1000),
+        "creation_date": product.creation_str(),
+        "wasted": product.wasted,
+        "used": product.used,
+        "used_timestamp": product.used_timestamp_str() if product.used_timestamp else None,
+        "note": product.note or "",
+        "image_url": product.image_url,
+        "thumbnail_url": product.thumbnail_url,
+        "opened": product.opened,
+        "update_time": product.update_time_str(),
+    }
+
+
+@app.route("/list_archived_products", methods=["POST"])
+@token_required
+@measure_time
+def list_archived_products():
+    """
+    Returns one page of archived wasted or used products of a household. Pass
+    the returned "next_cursor" as "cursor" to get the next page.
+    """
+    data = request.json or {}
+    household_id = data.get("householdId")
+    status = data.get("status")
+    if not household_id or status not in ("wasted", "used"):
+        return jsonify({"error": "householdId and status are required"}), 400
+
+    uid = flask_login.current_user.get_id()
+    if not household_manager.user_has_household(uid, household_id):
+        log.warning("Permission denied for user to list archived products")
+        return jsonify({"error": "Permission denied"}), 403
+
+    try:
+        page_size = min(max(int(data.get("pageSize") or 100), 1), 500)
+    except (TypeError, ValueError):
+        return jsonify({"error": "pageSize must be a number"}), 400
+    products, next_cursor = product_mgr.get_archived_products(
+        household_id, status, page_size, data.get("cursor")
+    )
+    return jsonify(
+        {
+            "products": [product_to_json(product) for product in products],
+            "next_cursor": next_cursor,
+        }
+    )
+
+
+def household_to_json(household: Household, uid: str, participants: Dict[str, User]) -> dict:
+    """The /list_households entry of a household; participants maps user IDs to users."""
+    # Deleted accounts may still be listed as participants.
+    known = [pid for pid in household.participants if pid in participants]
+    return {
+        "id": household.id,
+        "name": household.name,
+        "owner": household.owner_uid == uid,
+        "participant_emails": [participants[pid].email() for pid in known],
+        "display_names": [participants[pid].display_name() for pid in known],
+    }
 
 
 @app.route("/list_households", methods=["POST"])
@@ -311,29 +699,69 @@ def list_households():
     uid = flask_login.current_user.get_id()
     households = household_manager.get_households_for_user(uid)
 
-    result = []
-    for household in households:
-        result.append(
-            {
-                "id": household.id,
-                "name": household.name,
-                "owner": household.owner_uid == uid,
-                # FIXME/TODO: We need to cache this info so we don't have to query all
-                #             users every time this request is made.
-                "participant_emails": [
-                    user_manager.get_user(uid).email() for uid in household.participants
-                ],
-                "display_names": [
-                    user_manager.get_user(uid).display_name()
-                    for uid in household.participants
-                ],
-            }
-        )
+    # All participants are looked up with one call.
+    participants = user_manager.get_users(
+        [pid for household in households for pid in household.participants]
+    )
+    return jsonify([household_to_json(household, uid, participants) for household in households])
+
 
-    return jsonify(result)
+def archive_old_products():
+    """Moves products wasted or used more than archive_after_days ago to the archive."""
+    cutoff = int(
+        (datetime.now() - timedelta(days=archive_after_days)).timestamp() * 1000
+    )
+    archived = 0
+    while True:
+        moved = product_mgr.archive_products(cutoff)
+        archived += moved
+        # Products both wasted and used count once, a short batch does not
+        # mean that none are left.
+        if moved == 0:
+            break
+    log.info(f"Archived {archived} wasted or used products")
+
+
+maintenance_scheduler.add_job(
+    archive_old_products, "interval", hours=6, max_instances=1, coalesce=True
+)
+# The first index is built on the first lookup.
+maintenance_scheduler.add_job(
+    barcode_name_index.refresh, "interval", hours=12, max_instances=1, coalesce=True
+)
+maintenance_scheduler.add_job(
+    household_manager.sweep_invitations,
+    "interval",
+    hours=6,
+    max_instances=1,
+    coalesce=True,
+)
+maintenance_scheduler.add_job(
+    deletion_mgr.resume_stale_jobs,
+    "interval",
+    minutes=10,
+    max_instances=1,
+    coalesce=True,
+)
+# Picks up retries, and deletions queued by other instances or before a restart.
+maintenance_scheduler.add_job(
+    image_store.deletion_queue.drain, "interval", minutes=1, max_instances=1, coalesce=True
+)
+maintenance_scheduler.add_job(
+    image_store.collect_orphans,
+    "interval",
+    hours=24,
+    args=[int(orphan_image_grace_hours * 60 * 60 * 1000)],
+    max_instances=1,
+    coalesce=True,
+)
+maintenance_scheduler.start()
 
 
 def send_push_notification(token, title, body):
+    # Imported on first use, it pulls in the Google API client discovery code.
+    import firebase_admin.messaging as messaging
+
     message = messaging.Message(
         notification=messaging.Notification(
             title=title,
@@ -385,6 +813,31 @@ def save_notification_settings():
     return jsonify({"success": True})
 
 
+DEFAULT_NOTIFICATION_SETTINGS = {
+    "notificationsEnabled": False,
+    "daysBefore": 5,
+    "hour": 12,
+    "minute": 0,
+}
+DEFAULT_VIEW_SETTINGS = {
+    "sortByProductList": "name",
+    "hideExpiredProductList": False,
+    "activeFilterProductList": "All",
+    "viewModeProductList": "simple",
+    "sortByWastedList": "name",
+    "hideExpiredWastedList": False,
+    "activeFilterWastedList": "All",
+    "viewModeWastedList": "simple",
+}
+
+
+def notification_settings_to_json(settings: dict) -> dict:
+    return {
+        key: settings.get(key, default)
+        for key, default in DEFAULT_NOTIFICATION_SETTINGS.items()
+    }
+
+
 @app.route("/get_notification_settings", methods=["POST"])
 @token_required
 @measure_time
@@ -394,18 +847,9 @@ def get_notification_settings():
     doc = doc_ref.get()
     if doc.exists:
         settings = doc.to_dict().get("notification_settings", {})
-        return jsonify(
-            {
-                "notificationsEnabled": settings.get("notificationsEnabled", False),
-                "daysBefore": settings.get("daysBefore", 5),
-                "hour": settings.get("hour", 12),
-                "minute": settings.get("minute", 0),
-            }
-        )
+        return jsonify(notification_settings_to_json(settings))
     else:
-        return jsonify(
-            {"notificationsEnabled": False, "daysBefore": 5, "hour": 12, "minute": 0}
-        )
+        return jsonify(DEFAULT_NOTIFICATION_SETTINGS)
 
 
 @measure_time
@@ -414,22 +858,8 @@ def set_default_notification_settings(user_id):
     doc = doc_ref.get()
     if not doc.exists or "notification_settings" not in doc.to_dict():
         default_settings = {
-            "notification_settings": {
-                "notificationsEnabled": False,
-                "daysBefore": 5,
-                "hour": 12,
-                "minute": 0,
-            },
-            "view_settings": {
-                "sortByProductList": "name",
-                "hideExpiredProductList": False,
-                "activeFilterProductList": "All",
-                "viewModeProductList": "simple",
-                "sortByWastedList": "name",
-                "hideExpiredWastedList": False,
-                "activeFilterWastedList": "All",
-                "viewModeWastedList": "simple",
-            },
+            "notification_settings": dict(DEFAULT_NOTIFICATION_SETTINGS),
+            "view_settings": dict(DEFAULT_VIEW_SETTINGS),
         }
         doc_ref.set(default_settings, merge=True)
         log.info(f"Default settings initialized for user {user_id}")
@@ -499,6 +929,105 @@ def add_product():
         return jsonify({"success": False, "error": str(e)}), 500
 
 
+@app.route("/import_products", methods=["POST"])
+@token_required
+@measure_time
+def import_products():
+    """
+    Imports products from an uploaded CSV or NDJSON file into a household.
+    The file is parsed row by row and stored in batches, while progress and
+    per-row errors are streamed back as NDJSON events.
+    """
+    household_id = request.form.get("householdId")
+    if not household_id:
+        return jsonify({"success": False, "error": "Household ID is required"}), 400
+    if "file" not in request.files:
+        return jsonify({"success": False, "error": "No import file provided"}), 400
+
+    import_file = request.files["file"]
+    file_format = request.form.get("format") or os.path.splitext(
+        import_file.filename or ""
+    )[1].lstrip(".")
+    row_reader = ROW_READERS.get(file_format.lower())
+    if row_reader is None:
+        return jsonify({"success": False, "error": "Unsupported file format"}), 400
+
+    uid = flask_login.current_user.get_id()
+    household = household_manager.get_household(household_id)
+    if household is None or uid not in household.participants:
+        return jsonify({"success": False, "error": "Access denied to this household"}), 403
+
+    log.info(f"User {uid} imports {file_format} products into household {household_id}")
+    importer = ProductImporter(product_mgr, household)
+    events = importer.run(row_reader(import_file.stream))
+    return Response(
+        stream_with_context(json.dumps(event) + "\n" for event in events),
+        mimetype="application/x-ndjson",
+    )
+
+
+def export_date_range(data: dict) -> tuple[int | None, int | None]:
+    """Returns the inclusive creation time range (epoch millis) of an export."""
+    created_from = data.get("from")
+    created_to = data.get("to")
+    return (
+        ProductManager.parse_import_date(created_from) if created_from else None,
+        # Include the whole last day.
+        ProductManager.parse_import_date(created_to) + 24 * 60 * 60 * 1000 - 1
+        if created_to
+        else None,
+    )
+
+
+@app.route("/export_products", methods=["POST"])
+@token_required
+@measure_time
+def export_products():
+    """
+    Streams the products of a household as CSV or NDJSON. Optional filters are
+    "status" (all, active, wasted or used) and an inclusive "from"/"to" range
+    (YYYY-MM-DD) on the creation date.
+    """
+    data = request.json or {}
+    household_id = data.get("householdId")
+    file_format = data.get("format", "csv")
+    status = data.get("status", "all")
+    if not household_id:
+        return jsonify({"success": False, "error": "Household ID is required"}), 400
+    if file_format not in LINE_WRITERS or status not in STATUS_FILTERS:
+        return jsonify({"success": False, "error": "Invalid format or status"}), 400
+    try:
+        created_from, created_to = export_date_range(data)
+    except ValueError:
+        return jsonify({"success": False, "error": "Invalid date range"}), 400
+
+    uid = flask_login.current_user.get_id()
+    if not household_manager.user_has_household(uid, household_id):
+        return jsonify({"success": False, "error": "Access denied to this household"}), 403
+
+    def exported_lines():
+        status_filter = STATUS_FILTERS[status]
+        products = product_mgr.stream_household_products(
+            household_id, created_from, created_to
+        )
+        try:
+            yield from LINE_WRITERS[file_format](p for p in products if status_filter(p))
+        except Exception as e:
+            log.error(f"Error exporting products of household {household_id}: {e}")
+            # The status line is already sent; aborting the response is the
+            # only way to tell the client the file is incomplete.
+            raise
+
+    log.info(f"User {uid} exports {status} products of household {household_id}")
+    return Response(
+        stream_with_context(exported_lines()),
+        mimetype=EXPORT_MIMETYPES[file_format],
+        headers={
+            "Content-Disposition": f'attachment; filename="products.{file_format}"'
+        },
+    )
+
+
 @app.route("/upload_product_image", methods=["POST"])
 @token_required
 @measure_time
@@ -511,27 +1040,137 @@ def upload_product_image():
         if not image_file.filename:
             return jsonify({"error": "No selected file"}), 400
 
-        # Create a unique filename
-        file_extension = os.path.splitext(image_file.filename)[1]
-        unique_filename = f"product_images/{str(uuid.uuid4())}{file_extension}"
+        return store_product_image(image_file.read())
 
-        # Get Firebase Storage bucket
-        bucket = storage.bucket()
-        blob = bucket.blob(unique_filename)
+    except Exception as e:
+        log.error(f"Error uploading image: {str(e)}")
+        return jsonify({"error": str(e)}), 500
 
-        # Upload the file
-        blob.upload_from_file(image_file, content_type=image_file.content_type)
 
-        # Make the file publicly accessible
-        blob.make_public()
+@app.route("/create_image_upload", methods=["POST"])
+@token_required
+@measure_time
+def create_image_upload():
+    """
+    Returns a signed URL to upload a product image directly to storage,
+    bypassing the app. Once uploaded, call /complete_image_upload.
+    """
+    data = request.json or {}
+    content_type = data.get("content_type", "image/jpeg")
+    if content_type not in UPLOAD_CONTENT_TYPES:
+        return jsonify({"error": f"Unsupported content type {content_type}"}), 400
+    try:
+        upload = image_store.create_upload(
+            flask_login.current_user.get_id(),
+            content_type,
+            image_upload_max_bytes,
+            timedelta(seconds=image_upload_url_ttl_s),
+        )
+        return jsonify(upload), 200
+    except Exception as e:
+        log.error(f"Error creating image upload URL: {str(e)}")
+        return jsonify({"error": str(e)}), 500
 
-        # Return the public URL
-        image_url = blob.public_url
-        return jsonify({"image_url": image_url}), 200
 
+@app.route("/complete_image_upload", methods=["POST"])
+@token_required
+@measure_time
+def complete_image_upload():
+    """Processes and stores an image uploaded with /create_image_upload."""
+    data = request.json or {}
+    uid = flask_login.current_user.get_id()
+    upload_id = data.get("upload_id", "")
+    try:
+        image_data = image_store.read_upload(uid, upload_id, image_upload_max_bytes)
+    except UploadNotFoundException:
+        return jsonify({"error": "Upload not found"}), 404
+    except UploadTooLargeException:
+        return jsonify({"error": "Image file is too large"}), 413
     except Exception as e:
-        log.error(f"Error uploading image: {str(e)}")
+        log.error(f"Error reading image upload {upload_id}: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+    try:
+        response = store_product_image(image_data)
+    except Exception as e:
+        # Keep the upload so the client can retry, see ImageStore.collect_orphans().
+        log.error(f"Error storing image upload {upload_id}: {str(e)}")
         return jsonify({"error": str(e)}), 500
+    # Stored or not an image, either way it is not needed anymore.
+    image_store.discard_upload(uid, upload_id)
+    return response
+
+
+def store_product_image(image_data: bytes):
+    """Processes and stores an uploaded image, returns the response with its URLs."""
+    # Resized and re-encoded on the image pool, see image_processing.py.
+    try:
+        processed = image_processor.submit(image_data).result()
+    except InvalidImageException as e:
+        log.warning(f"Rejected product image upload: {e}")
+        return jsonify({"error": "Invalid image file"}), 400
+
+    image_url, thumbnail, uploaded = image_store.save(processed)
+    log.info(
+        f"Stored product image {image_url}: {processed.original_size} bytes received, "
+        f"{len(processed.image.data)} + {len(processed.thumbnail.data)} bytes "
+        + ("uploaded" if uploaded else "already stored")
+    )
+    return jsonify({"image_url": image_url, "thumbnail_url": thumbnail}), 200
+
+
+def product_update_fields(data: dict) -> dict:
+    """Collects the product fields present in an update request."""
+    fields = {
+        key: data[key]
+        for key in ("product_name", "location", "category", "note", "opened")
+        if key in data
+    }
+    expiration_date = data.get("expiration_date")
+    if expiration_date:
+        fields["expires"] = ProductManager.parse_import_date(expiration_date)
+    return fields
+
+
+def patch_product(
+    id: str, fields: dict, update_time: datetime | None, old_image_url: str | None
+) -> datetime | None:
+    """ProductManager.patch() that also moves the image reference if the image changes."""
+    new_image_url = fields.get("image_url")
+    if "image_url" not in fields or new_image_url == old_image_url:
+        return product_mgr.patch(id, fields, update_time)
+
+    # Take the new reference before the product points to the image, so the
+    # image cannot be deleted in between.
+    if not image_store.add_reference(new_image_url):
+        return None
+    new_update_time = None
+    try:
+        new_update_time = product_mgr.patch(id, fields, update_time)
+    finally:
+        if new_update_time is None:
+            # Keep the image, the client is likely to retry with it.
+            image_store.release(new_image_url, delete_unused=False)
+    if new_update_time is None:
+        # The product still points to the old image.
+        return None
+    image_store.release(old_image_url)
+    return new_update_time
+
+
+def add_image_fields(id: str, data: dict, fields: dict) -> tuple[str | None, datetime]:
+    """
+    Adds the image fields of an update to fields and returns the stored image
+    URL and update time of the product. Raises ProductNotFoundException.
+    """
+    image = product_mgr.get_image_url(id)
+    if image is None:
+        raise ProductNotFoundException(id)
+    fields["image_url"] = data["image_url"]
+    # Derived from the image instead of trusting the client. Images uploaded
+    # before thumbnails were generated have none.
+    fields["thumbnail_url"] = thumbnail_url(data["image_url"])
+    return image
 
 
 # Route to update a product
@@ -543,62 +1182,49 @@ def update_product(id):
         data = request.json
         log.info(f"Received update for product {id}: {data}")
 
-        product = product_mgr.get_product(id)
-        if not product:
-            return jsonify({"success": False, "error": "Product not found"}), 404
-
-        # Store the old image URL
-        old_image_url = product.image_url
-        # Keep existing image_url if not provided in update
-        new_image_url = data.get("image_url", old_image_url)
-
-        # Update product fields
-        product.product_name = data.get("product_name", product.product_name)
-        product.location = data.get("location", product.location)
-        product.category = data.get("category", product.category)
-        product.note = data.get("note", product.note)
-        product.image_url = new_image_url
-        product.opened = data.get("opened", product.opened)
-        expiration_date = data.get("expiration_date")
-        if expiration_date:
-            product.expires = ProductManager.parse_import_date(expiration_date)
-
-        if not product_mgr.add_product(product):
+        fields = product_update_fields(data)
+        try:
+            update_time = ProductManager.parse_update_time(data.get("update_time"))
+        except ValueError:
+            return jsonify({"success": False, "error": "Invalid update_time"}), 400
+
+        # Only read the stored image URL if the client sent one, so we know
+        # whether the image references change.
+        old_image_url = None
+        if "image_url" in data:
+            old_image_url, image_update_time = add_image_fields(id, data, fields)
+            # Guard against a concurrent image change between read and write.
+            update_time = update_time or image_update_time
+
+        if not fields:
+            return jsonify({"success": True})
+
+        new_update_time = patch_product(id, fields, update_time, old_image_url)
+        if new_update_time is None:
             log.error(f"Failed to update product {id}")
             return jsonify({"success": False, "error": "Failed to update product"}), 500
 
-        # If the image URL has changed or been removed, delete the old image
-        if old_image_url and old_image_url != new_image_url:
-            delete_image_from_storage(old_image_url)
-
         log.info(f"Product {id} successfully updated")
-        return jsonify({"success": True})
+        return jsonify(
+            {
+                "success": True,
+                "update_time": ProductManager.format_update_time(new_update_time),
+            }
+        )
 
+    except ProductNotFoundException:
+        return jsonify({"success": False, "error": "Product not found"}), 404
+    except ProductConflictException:
+        log.warning(f"Product {id} was modified concurrently")
+        return (
+            jsonify({"success": False, "error": "Product was modified by someone else"}),
+            409,
+        )
     except Exception as e:
         log.error(f"Error updating product {id}: {e}")
         return jsonify({"success": False, "error": str(e)}), 500
 
 
-def delete_image_from_storage(image_url: str | None) -> bool:
-    if not image_url:
-        return True
-
-    try:
-        # Extract filename from URL
-        # URL format: https://storage.googleapis.com/pantryguardian-f8381.appspot.com/product_images/filename.jpg
-        filename = image_url.split("product_images/")[-1]
-        if not filename:
-            return False
-
-        bucket = storage.bucket()
-        blob = bucket.blob(f"product_images/{filename}")
-        blob.delete()
-        return True
-    except Exception as e:
-        log.error(f"Error deleting image from storage: {e}")
-        return False
-
-
 @app.route("/delete_product/<string:id>", methods=["POST"])
 @token_required
 @measure_time
@@ -608,14 +1234,14 @@ def delete_product(id):
     if not product:
         return jsonify({"success": False, "error": "Product not found"}), 404
 
-    # Delete the image if it exists
-    if product.image_url:
-        delete_image_from_storage(product.image_url)
-
     success = product_mgr.delete_product(id)
     if not success:
         return jsonify({"success": False, "error": "Unable to delete product"}), 404
 
+    # Delete the image if no other product uses it
+    if product.image_url:
+        image_store.release(product.image_url)
+
     log.info(f"User {flask_login.current_user.get_id()} deleted product {id}")
     return jsonify({"success": True})
 
@@ -625,17 +1251,18 @@ def delete_product(id):
 @token_required
 @measure_time
 def waste_product(id):
-    product = product_mgr.get_product(id)
-    if product is None:
+    log.info(f"Marking product {id} as wasted")
+    try:
+        updated = product_mgr.patch(
+            id,
+            {"wasted": True, "wasted_timestamp": int(datetime.now().timestamp() * 1000)},
+        )
+    except ProductNotFoundException:
         log.error(f"Product with ID {id} not found")
         return jsonify({"success": False, "error": "Product not found"}), 404
 
-    log.info(f"Marking product {product.id} as wasted")
-    product.wasted = True
-    product.wasted_timestamp = int(datetime.now().timestamp() * 1000)
-
-    if not product_mgr.add_product(product):
-        log.error(f"Failed to update product with ID {product.id} in the database")
+    if updated is None:
+        log.error(f"Failed to update product with ID {id} in the database")
         return (
             jsonify(
                 {"success": False, "error": "Unable to update product to wasted state"}
@@ -643,7 +1270,7 @@ def waste_product(id):
             500,
         )
 
-    log.info(f"Product {product.id} successfully marked as wasted")
+    log.info(f"Product {id} successfully marked as wasted")
     return jsonify({"success": True})
 
 
@@ -652,17 +1279,18 @@ def waste_product(id):
 @token_required
 @measure_time
 def use_product(id):
-    product = product_mgr.get_product(id)
-    if product is None:
+    log.info(f"Marking product {id} as used")
+    try:
+        updated = product_mgr.patch(
+            id,
+            {"used": True, "used_timestamp": int(datetime.now().timestamp() * 1000)},
+        )
+    except ProductNotFoundException:
         log.error(f"Product with ID {id} not found")
         return jsonify({"success": False, "error": "Product not found"}), 404
 
-    log.info(f"Marking product {product.id} as used")
-    product.used = True
-    product.used_timestamp = int(datetime.now().timestamp() * 1000)
-
-    if not product_mgr.add_product(product):
-        log.error(f"Failed to update product with ID {product.id} in the database")
+    if updated is None:
+        log.error(f"Failed to update product with ID {id} in the database")
         return (
             jsonify(
                 {"success": False, "error": "Unable to update product to used state"}
@@ -670,7 +1298,7 @@ def use_product(id):
             500,
         )
 
-    log.info(f"Product {product.id} successfully marked as used")
+    log.info(f"Product {id} successfully marked as used")
     return jsonify({"success": True})
 
 
@@ -739,16 +1367,7 @@ def get_shopping_list():
         items = shopping_list_mgr.get_household_shopping_list(household_id)
 
         # Convert items to dictionaries for JSON serialization
-        items_data = []
-        for item in items:
-            items_data.append({
-                "id": item.id,
-                "product_name": item.product_name,
-                "added_by": item.added_by,
-                "added_timestamp": item.added_timestamp,
-                "note": item.note,
-                "quantity": item.quantity,
-            })
+        items_data = [shopping_item_to_json(item) for item in items]
 
         log.info(f"Retrieved {len(items_data)} shopping list items for household {household_id}")
         return jsonify({"success": True, "items": items_data})
@@ -758,6 +1377,17 @@ def get_shopping_list():
         return jsonify({"success": False, "error": str(e)}), 500
 
 
+def shopping_item_to_json(item: ShoppingListItem) -> dict:
+    return {
+        "id": item.id,
+        "product_name": item.product_name,
+        "added_by": item.added_by,
+        "added_timestamp": item.added_timestamp,
+        "note": item.note,
+        "quantity": item.quantity,
+    }
+
+
 @app.route("/mark_shopping_item_completed/<string:id>", methods=["POST"])
 @token_required
 @measure_time
@@ -825,7 +1455,7 @@ def generate_recipe():
         response = requests.post(
             "https://api.openai.com/v1/chat/completions",
             headers={
-                "Authorization": f"Bearer {openai}",
+                "Authorization": f"Bearer {secrets_mgr.get_openai_api_key()}",
                 "Content-Type": "application/json",
             },
             json={
@@ -881,7 +1511,7 @@ def generate_recipe_from_database():
             product_names.append(product.product_name)
 
     # Generate a recipe based on the product names
-    recipe_suggestion = recipe_generator.generate_recipe(product_names)
+    recipe_suggestion = get_recipe_generator().generate_recipe(product_names)
     return jsonify({"recipe_suggestion": recipe_suggestion})
 
 
@@ -939,38 +1569,47 @@ def get_locations_categories():
         return jsonify({"error": str(e)}), 500
 
 
-@app.route("/add_location", methods=["POST"])
-@token_required
-@measure_time
-def add_location():
-    try:
-        user = flask_login.current_user
-        data = request.json
-        new_location = data.get("location")
-        household_id = data.get("householdId")
+def update_household_list(
+    update: Callable[[str, str], bool], field: str, label: str, action: str
+):
+    """
+    Shared implementation of the routes adding or deleting a location or
+    category: checks the membership (cached) and updates the list with a
+    single write.
+    """
+    user = flask_login.current_user
+    data = request.json
+    value = data.get(field)
+    household_id = data.get("householdId")
 
-        if not new_location:
-            return jsonify({"success": False, "error": "Location is required"}), 400
-        if not household_id:
-            return jsonify({"success": False, "error": "household_id is required"}), 400
+    if not value:
+        return jsonify({"success": False, "error": f"{label} is required"}), 400
+    if not household_id:
+        return jsonify({"success": False, "error": "household_id is required"}), 400
 
-        # Check if user has access to this household
-        if not household_manager.user_has_household(user.get_id(), household_id):
-            return (
-                jsonify({"error": "User does not have access to this household"}),
-                403,
-            )
+    # Check if user has access to this household
+    if not household_manager.is_member(user.get_id(), household_id):
+        return (
+            jsonify({"error": "User does not have access to this household"}),
+            403,
+        )
 
-        household = household_manager.get_household(household_id)
-        if not household:
-            return jsonify({"success": False, "error": "Household not found"}), 404
+    try:
+        if update(household_id, value):
+            return jsonify({"success": True}), 200
+    except HouseholdNotFoundException:
+        return jsonify({"success": False, "error": "Household not found"}), 404
+    return jsonify({"success": False, "error": f"Unable to {action} {field}"}), 500
 
-        if new_location not in household.locations:
-            household.locations.append(new_location)
-            if household_manager.add_or_update_household(household):
-                return jsonify({"success": True}), 200
 
-        return jsonify({"success": False, "error": "Unable to add location"}), 500
+@app.route("/add_location", methods=["POST"])
+@token_required
+@measure_time
+def add_location():
+    try:
+        return update_household_list(
+            household_manager.add_location, "location", "Location", "add"
+        )
     except Exception as e:
         log.error(f"Error adding location: {str(e)}")
         return jsonify({"success": False, "error": str(e)}), 500
@@ -981,33 +1620,9 @@ def add_location():
 @measure_time
 def delete_location():
     try:
-        user = flask_login.current_user
-        data = request.json
-        location_to_delete = data.get("location")
-        household_id = data.get("householdId")
-
-        if not location_to_delete:
-            return jsonify({"success": False, "error": "Location is required"}), 400
-        if not household_id:
-            return jsonify({"success": False, "error": "household_id is required"}), 400
-
-        # Check if user has access to this household
-        if not household_manager.user_has_household(user.get_id(), household_id):
-            return (
-                jsonify({"error": "User does not have access to this household"}),
-                403,
-            )
-
-        household = household_manager.get_household(household_id)
-        if not household:
-            return jsonify({"success": False, "error": "Household not found"}), 404
-
-        if location_to_delete in household.locations:
-            household.locations.remove(location_to_delete)
-            if household_manager.add_or_update_household(household):
-                return jsonify({"success": True}), 200
-
-        return jsonify({"success": False, "error": "Unable to delete location"}), 500
+        return update_household_list(
+            household_manager.remove_location, "location", "Location", "delete"
+        )
     except Exception as e:
         log.error(f"Error deleting location: {str(e)}")
         return jsonify({"success": False, "error": str(e)}), 500
@@ -1018,33 +1633,9 @@ def delete_location():
 @measure_time
 def add_category():
     try:
-        user = flask_login.current_user
-        data = request.json
-        new_category = data.get("category")
-        household_id = data.get("householdId")
-
-        if not new_category:
-            return jsonify({"success": False, "error": "Category is required"}), 400
-        if not household_id:
-            return jsonify({"success": False, "error": "household_id is required"}), 400
-
-        # Check if user has access to this household
-        if not household_manager.user_has_household(user.get_id(), household_id):
-            return (
-                jsonify({"error": "User does not have access to this household"}),
-                403,
-            )
-
-        household = household_manager.get_household(household_id)
-        if not household:
-            return jsonify({"success": False, "error": "Household not found"}), 404
-
-        if new_category not in household.categories:
-            household.categories.append(new_category)
-            if household_manager.add_or_update_household(household):
-                return jsonify({"success": True}), 200
-
-        return jsonify({"success": False, "error": "Unable to add category"}), 500
+        return update_household_list(
+            household_manager.add_category, "category", "Category", "add"
+        )
     except Exception as e:
         log.error(f"Error adding category: {str(e)}")
         return jsonify({"success": False, "error": str(e)}), 500
@@ -1055,33 +1646,9 @@ def add_category():
 @measure_time
 def delete_category():
     try:
-        user = flask_login.current_user
-        data = request.json
-        category_to_delete = data.get("category")
-        household_id = data.get("householdId")
-
-        if not category_to_delete:
-            return jsonify({"success": False, "error": "Category is required"}), 400
-        if not household_id:
-            return jsonify({"success": False, "error": "household_id is required"}), 400
-
-        # Check if user has access to this household
-        if not household_manager.user_has_household(user.get_id(), household_id):
-            return (
-                jsonify({"error": "User does not have access to this household"}),
-                403,
-            )
-
-        household = household_manager.get_household(household_id)
-        if not household:
-            return jsonify({"success": False, "error": "Household not found"}), 404
-
-        if category_to_delete in household.categories:
-            household.categories.remove(category_to_delete)
-            if household_manager.add_or_update_household(household):
-                return jsonify({"success": True}), 200
-
-        return jsonify({"success": False, "error": "Unable to delete category"}), 500
+        return update_household_list(
+            household_manager.remove_category, "category", "Category", "delete"
+        )
     except Exception as e:
         log.error(f"Error deleting category: {str(e)}")
         return jsonify({"success": False, "error": str(e)}), 500
@@ -1221,28 +1788,10 @@ def get_view_settings():
             view_settings = user_doc.to_dict().get("view_settings", {})
             if not view_settings:
                 # Return default settings if none exist
-                view_settings = {
-                    "sortByProductList": "name",
-                    "hideExpiredProductList": False,
-                    "activeFilterProductList": "All",
-                    "viewModeProductList": "simple",
-                    "sortByWastedList": "name",
-                    "hideExpiredWastedList": False,
-                    "activeFilterWastedList": "All",
-                    "viewModeWastedList": "simple",
-                }
+                view_settings = DEFAULT_VIEW_SETTINGS
         else:
             # Return default settings if user doc doesn't exist
-            view_settings = {
-                "sortByProductList": "name",
-                "hideExpiredProductList": False,
-                "activeFilterProductList": "All",
-                "viewModeProductList": "simple",
-                "sortByWastedList": "name",
-                "hideExpiredWastedList": False,
-                "activeFilterWastedList": "All",
-                "viewModeWastedList": "simple",
-            }
+            view_settings = DEFAULT_VIEW_SETTINGS
 
         return jsonify(view_settings), 200
     except Exception as e:
@@ -1250,13 +1799,22 @@ def get_view_settings():
         return jsonify({"error": str(e)}), 500
 
 
+def search_limit(data: dict) -> int:
+    """The number of suggestions requested, 1 to 200. Raises ValueError."""
+    try:
+        return min(max(int(data.get("limit", 50)), 1), 200)
+    except TypeError:
+        raise ValueError("limit must be a number")
+
+
 @app.route("/search_products", methods=["POST"])
 @token_required
 @measure_time
 def search_products():
     """
     Search for product names in the user's household that match the query.
-    Returns a list of product suggestions with names and barcodes.
+    Returns a list of product suggestions with names and barcodes, prefix
+    matches first, followed by fuzzy matches.
     """
     try:
         data = request.json
@@ -1270,25 +1828,20 @@ def search_products():
         uid = flask_login.current_user.get_id()
         if not household_manager.user_has_household(uid, household_id):
             return jsonify({"error": "Permission denied"}), 403
-
-        # Get all products from the household
-        products = product_mgr.get_household_products(household_id)
-
-        # Filter products based on query and create unique name-barcode pairs
-        suggestions = {}  # Use dict to ensure uniqueness by product name
-        for product in products:
-            if query in product.product_name.lower():
-                # If we already have this product name, only update if this one has a barcode and the existing one doesn't
-                if product.product_name not in suggestions or (
-                    product.barcode and not suggestions[product.product_name]["barcode"]
-                ):
-                    suggestions[product.product_name] = {
-                        "name": product.product_name,
-                        "barcode": product.barcode if product.barcode else "",
-                    }
-
-        # Convert dictionary to list and sort by name
-        suggestion_list = sorted(suggestions.values(), key=lambda x: x["name"])
+        try:
+            limit = search_limit(data)
+        except ValueError:
+            return jsonify({"error": "limit must be a number"}), 400
+
+        # Prefix and fuzzy matches from the household's in-memory name index,
+        # followed by names known for barcodes from other sources.
+        suggestion_list = search_index.search(household_id, query, limit)
+        if len(suggestion_list) < limit:
+            known_names = {suggestion["name"] for suggestion in suggestion_list}
+            for suggestion in barcode_name_index.search(query, limit):
+                if suggestion["name"] not in known_names:
+                    suggestion_list.append(suggestion)
+            suggestion_list = suggestion_list[:limit]
         return jsonify({"suggestions": suggestion_list}), 200
 
     except Exception as e:
@@ -1332,16 +1885,14 @@ def delete_account():
 
         # Password is correct, proceed with account deletion
         try:
-            # Delete user's data from Firestore
+            # Delete the owned households and all other data of the user in
+            # the background.
             user_id = user.get_id()
-
-            # Get user's households
-            households = household_manager.get_households_for_user(user_id)
-
-            # Delete owned households
-            for household in households:
-                if household.owner_uid == user_id:
-                    household_manager.delete_household(household.id, user_id)
+            if deletion_mgr.start_account_cleanup(user_id, user.email()) is None:
+                return (
+                    jsonify({"success": False, "error": "Failed to delete account"}),
+                    500,
+                )
 
             # Delete the user from Firebase Auth
             auth.delete_user(user_id)
@@ -1459,20 +2010,175 @@ def delete_household():
                 403,
             )
 
-        # Delete the household
-        if household_manager.delete_household(household_id, user.get_id()):
-            return jsonify({"success": True}), 200
-        else:
+        # Delete the household, its products, shopping list and invitations are
+        # deleted in the background.
+        if not household_manager.delete_household(household_id, user.get_id()):
             return (
                 jsonify({"success": False, "error": "Failed to delete household"}),
                 500,
             )
+        job = deletion_mgr.start_household_cleanup(household_id, user.get_id())
+        return jsonify({"success": True, "job_id": job.id if job else None}), 200
 
     except Exception as e:
         log.error(f"Error deleting household: {str(e)}")
         return jsonify({"success": False, "error": str(e)}), 500
 
 
+@app.route("/get_deletion_job/<string:job_id>", methods=["POST"])
+@token_required
+@measure_time
+def get_deletion_job(job_id):
+    """Returns the progress of a household deletion started by the user."""
+    job = deletion_mgr.get_job(job_id)
+    if job is None or job.uid != flask_login.current_user.get_id():
+        return jsonify({"success": False, "error": "Deletion job not found"}), 404
+    return jsonify(
+        {
+            "success": True,
+            "status": job.status,
+            "deleted": job.deleted,
+            "error": job.error,
+        }
+    )
+
+
+@app.route("/household_changes", methods=["GET"])
+@token_required
+@measure_time
+def household_changes():
+    """
+    Streams the changes of a household's products and shopping list as
+    server-sent events (see HouseholdChangeFeed.stream()), instead of polling
+    /list_products and /get_shopping_list. Clients load the lists after the
+    "ready" event and then apply the events, and load them again on "resync"
+    or a reconnect.
+    Every stream holds a thread, so only CHANGE_FEED_MAX_THREADED_STREAMS are
+    served at a time (see async_app.py for many clients).
+    """
+    uid = flask_login.current_user.get_id()
+    household_id = request.args.get("household_id")
+    if not household_id:
+        return jsonify({"error": "household_id is required"}), 400
+    if not household_manager.is_member(uid, household_id):
+        return jsonify({"error": "User does not have access to this household"}), 403
+    if change_feed_max_threaded_streams <= 0 or not threaded_stream_slots.acquire(blocking=False):
+        log.warning("Rejected change feed subscription: no free stream thread")
+        return jsonify({"error": "Too many change feed streams"}), 503
+    try:
+        subscription = change_feed.subscribe(household_id, uid)
+    except TooManySubscribersException as e:
+        threaded_stream_slots.release()
+        log.warning(f"Rejected change feed subscription: {str(e)}")
+        return jsonify({"error": str(e)}), 503
+    response = Response(
+        change_feed.stream(subscription, change_feed_heartbeat_s),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+    # Also called if the stream never started.
+    @response.call_on_close
+    def release_stream():
+        change_feed.unsubscribe(subscription)
+        threaded_stream_slots.release()
+
+    return response
+
+
+@app.route("/bootstrap", methods=["POST"])
+@token_required
+@measure_time
+def bootstrap():
+    """
+    Everything the home screen shows in one request: the user's settings and
+    the last active household (or the given householdId) with its products
+    and shopping list. Each section has a version; the sections whose
+    current version the client passes in "versions" are sent without data.
+    """
+    try:
+        uid = flask_login.current_user.get_id()
+        data = request.json or {}
+        household_id = data.get("householdId")
+        known_versions = data.get("versions") or {}
+
+        if household_id:
+            user_data, household = concurrency.gather(
+                lambda: read_user_data(uid),
+                lambda: household_manager.get_household(household_id),
+            )
+        else:
+            # The household to show is in the user's document.
+            user_data = read_user_data(uid)
+            household_id = user_data.get("last_active_household")
+            household = household_manager.get_household(household_id) if household_id else None
+
+        # The lists are only read for members.
+        if household is not None and uid not in household.participants:
+            household = None
+        products, items = read_household_lists(household.id) if household is not None else ([], [])
+        sections = {
+            "settings": {
+                "notification_settings": notification_settings_to_json(
+                    user_data.get("notification_settings", {})
+                ),
+                "view_settings": user_data.get("view_settings") or DEFAULT_VIEW_SETTINGS,
+                "push_token": user_data.get("push_token"),
+            },
+            "household": None,
+            "products": None,
+            "shopping_list": None,
+        }
+        if household is not None:
+            sections["household"] = {
+                "id": household.id,
+                "name": household.name,
+                "owner": household.owner_uid == uid,
+                "participants": household.participants,
+                "locations": household.locations,
+                "categories": household.categories,
+            }
+            sections["products"] = [product_to_json(product) for product in products]
+            sections["shopping_list"] = [shopping_item_to_json(item) for item in items]
+
+        return jsonify(
+            {
+                "household_id": household.id if household is not None else None,
+                "sections": {
+                    name: versioned_section(section, known_versions.get(name))
+                    for name, section in sections.items()
+                },
+            }
+        )
+    except Exception as e:
+        log.error(f"Error bootstrapping: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+
+def read_user_data(uid: str) -> dict:
+    doc = firestore.collection("users").document(uid).get()
+    return (doc.to_dict() if doc.exists else None) or {}
+
+
+def read_household_lists(household_id: str) -> tuple[list[Product], list[ShoppingListItem]]:
+    """The products and shopping list of a household, read concurrently."""
+    products, items = concurrency.gather(
+        lambda: product_mgr.get_household_products(household_id),
+        lambda: shopping_list_mgr.get_household_shopping_list(household_id),
+    )
+    return products, items
+
+
+def versioned_section(section: Any, known_version: str | None) -> dict:
+    # The version is a hash of the content, the client keeps the data of the
+    # version it has.
+    content = json.dumps(section, sort_keys=True, separators=(",", ":"))
+    version = hashlib.sha256(content.encode()).hexdigest()[:16]
+    if version == known_version:
+        return {"version": version, "unchanged": True}
+    return {"version": version, "data": section}
+
+
 @app.route("/get_last_active_household", methods=["POST"])
 @token_required
 @measure_time
@@ -1593,7 +2299,7 @@ def invite_to_household():
 
         # Create an invitation
         invitation = household_manager.create_invitation(
-            household_id, user.get_id(), invitee_email
+            household_id, user.get_id(), invitee_email, user.display_name()
         )
         if not invitation:
             return (
@@ -1644,7 +2350,7 @@ def accept_invitation_endpoint(invitation_id):
             )
 
         # Accept the invitation
-        if not household_manager.accept_invitation(invitation_id, uid):
+        if not household_manager.accept_invitation(invitation_id, uid, invitation):
             return (
                 jsonify({"success": False, "error": "Failed to accept invitation"}),
                 500,
@@ -1706,12 +2412,19 @@ def get_pending_invitations():
         # Get all pending invitations for this user's email
         invitations = household_manager.get_invitations_for_email(email)
 
+        # The inviter's name is stored with the invitation, look up the ones
+        # of older invitations with a single call.
+        inviters = user_manager.get_users(
+            [i.inviter_uid for i in invitations if not i.inviter_name]
+        )
+
         # Format the response
         invitation_list = []
         for invitation in invitations:
-            # Get inviter's name
-            inviter = user_manager.get_user(invitation.inviter_uid)
-            inviter_name = inviter.display_name() if inviter else "Unknown"
+            inviter_name = invitation.inviter_name
+            if not inviter_name:
+                inviter = inviters.get(invitation.inviter_uid)
+                inviter_name = inviter.display_name() if inviter else "Unknown"
 
             invitation_list.append(
                 {
@@ -1721,6 +2434,7 @@ def get_pending_invitations():
                     "inviter_uid": invitation.inviter_uid,
                     "inviter_name": inviter_name,
                     "created_at": invitation.created_at,
+                    "expires_at": invitation.expires_at,
                 }
             )
 
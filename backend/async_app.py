@@ -0,0 +1,423 @@
+"""
+Async serving mode. The hot read routes are served natively on asyncio with
+the Firestore AsyncClient and aiohttp, so a single process can have hundreds
+of I/O-bound requests in flight. All other routes are delegated to the Flask
+app (see app.py) on a thread pool, so the API is the same in both modes.
+
+Run it with gunicorn:
+
+    gunicorn async_app:create_app --worker-class aiohttp.GunicornWebWorker -b 0.0.0.0:5000
+
+or with `python async_app.py --port 5000`.
+"""
+
+import argparse
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import contextvars
+import functools
+import time
+from typing import Awaitable, Callable, Iterator
+
+import aiohttp
+from absl import logging as log
+from aiohttp import web
+from firebase_admin import auth
+from firebase_admin.auth import ExpiredIdTokenError, InvalidIdTokenError
+from werkzeug.test import EnvironBuilder, run_wsgi_app
+
+import app as flask_app
+from async_managers import (
+    AsyncBarcodeManager,
+    AsyncHouseholdManager,
+    AsyncProductManager,
+    AsyncShoppingListManager,
+)
+from change_feed import (
+    SSE_HEARTBEAT,
+    Subscription,
+    TooManySubscribersException,
+    ready_message,
+    sse_message,
+)
+from config import async_blocking_workers, change_feed_heartbeat_s, image_upload_max_bytes
+import metrics
+from storage import create_async_document_store
+
+Handler = Callable[[web.Request], Awaitable[web.StreamResponse]]
+
+# Runs the blocking work of the async routes (Firebase Auth, CPU heavy
+# searches) and the requests delegated to Flask.
+_blocking_executor = ThreadPoolExecutor(
+    max_workers=async_blocking_workers, thread_name_prefix="async-blocking"
+)
+
+# Response headers computed again by aiohttp.
+_HOP_BY_HOP_HEADERS = {"content-length", "transfer-encoding", "connection"}
+# Request headers describing the body, passed to Flask in the WSGI environ.
+_BODY_HEADERS = {"content-length", "content-type", "transfer-encoding"}
+
+
+async def run_blocking(func: Callable, *args):
+    return await asyncio.get_running_loop().run_in_executor(
+        _blocking_executor, functools.partial(func, *args)
+    )
+
+
+def token_required(handler: Handler) -> Handler:
+    """Async version of app.token_required, stores the user in request["user"]."""
+
+    @functools.wraps(handler)
+    async def decorated(request: web.Request) -> web.StreamResponse:
+        token = request.headers.get("idToken")
+        if not token:
+            log.error("Token is missing!")
+            return web.json_response({"message": "Token is missing!"}, status=401)
+        try:
+            decoded_token = await run_blocking(auth.verify_id_token, token)
+            request["user"] = await run_blocking(
+                flask_app.user_manager.get_user, decoded_token["uid"]
+            )
+        except ExpiredIdTokenError as err:
+            log.warning(f"Token has expired: {err}")
+            return web.json_response({"message": "Token has expired!"}, status=401)
+        except InvalidIdTokenError:
+            log.error("Token is invalid!")
+            return web.json_response({"message": "Token is invalid!"}, status=401)
+        except Exception as e:
+            log.error(f"Token verification failed: {str(e)}")
+            return web.json_response(
+                {"message": "Token verification failed!", "error": str(e)}, status=401
+            )
+        return await handler(request)
+
+    return decorated
+
+
+async def request_json(request: web.Request) -> dict:
+    try:
+        data = await request.json()
+    except ValueError:
+        return {}
+    return data if isinstance(data, dict) else {}
+
+
+@token_required
+async def list_products(request: web.Request) -> web.StreamResponse:
+    data = await request_json(request)
+    household_id = data.get("householdId")
+    if not household_id:
+        log.warning("householdId not provides for list_products")
+        return web.json_response([], status=400)
+
+    uid = request["user"].get_id()
+    # Checked before the query, non-members must not trigger reads of the
+    # household's products.
+    if not await request.app["households"].user_has_household(uid, household_id):
+        log.warning("Permission denied for user to list_products for given household")
+        return web.json_response([], status=403)
+    products = await request.app["products"].get_household_products(household_id)
+    return web.json_response([flask_app.product_to_json(product) for product in products])
+
+
+@token_required
+async def list_households(request: web.Request) -> web.StreamResponse:
+    uid = request["user"].get_id()
+    households = await request.app["households"].get_households_for_user(uid)
+
+    participants = await run_blocking(
+        flask_app.user_manager.get_users,
+        [pid for household in households for pid in household.participants],
+    )
+    return web.json_response(
+        [flask_app.household_to_json(household, uid, participants) for household in households]
+    )
+
+
+@token_required
+async def get_shopping_list(request: web.Request) -> web.StreamResponse:
+    data = await request_json(request)
+    household_id = data.get("household_id")
+    if not household_id:
+        return web.json_response(
+            {"success": False, "error": "Household ID is required"}, status=400
+        )
+
+    uid = request["user"].get_id()
+    if not await request.app["households"].user_has_household(uid, household_id):
+        return web.json_response(
+            {"success": False, "error": "Access denied to this household"}, status=403
+        )
+    items = await request.app["shopping_list"].get_household_shopping_list(household_id)
+    return web.json_response(
+        {"success": True, "items": [flask_app.shopping_item_to_json(item) for item in items]}
+    )
+
+
+@token_required
+async def get_barcode(request: web.Request) -> web.StreamResponse:
+    data = await request_json(request)
+    barcode = data.get("barcode")
+    household_id = data.get("householdId")
+    if not barcode:
+        return web.json_response({"error": "Barcode is required"}, status=400)
+    if not household_id:
+        return web.json_response({"error": "household_id is required"}, status=400)
+
+    result = await request.app["barcodes"].get_product_name(barcode, household_id)
+    if result and result[0]:
+        product_name, is_ext = result
+        return web.json_response({"barcode": barcode, "name": product_name, "ext": is_ext})
+    return web.json_response({"error": "Barcode not found"})
+
+
+@token_required
+async def search_products(request: web.Request) -> web.StreamResponse:
+    data = await request_json(request)
+    query = data.get("query", "").lower()
+    household_id = data.get("householdId")
+    if not household_id:
+        return web.json_response({"error": "Household ID is required"}, status=400)
+
+    uid = request["user"].get_id()
+    if not await request.app["households"].user_has_household(uid, household_id):
+        return web.json_response({"error": "Permission denied"}, status=403)
+
+    try:
+        limit = flask_app.search_limit(data)
+    except ValueError:
+        return web.json_response({"error": "limit must be a number"}, status=400)
+
+    # The search indexes are shared with the Flask app. Building a household
+    # index loads its products, so search off the event loop.
+    suggestions = await run_blocking(search_suggestions, household_id, query, limit)
+    return web.json_response({"suggestions": suggestions})
+
+
+def search_suggestions(household_id: str, query: str, limit: int) -> list[dict]:
+    suggestion_list = flask_app.search_index.search(household_id, query, limit)
+    if len(suggestion_list) < limit:
+        known_names = {suggestion["name"] for suggestion in suggestion_list}
+        for suggestion in flask_app.barcode_name_index.search(query, limit):
+            if suggestion["name"] not in known_names:
+                suggestion_list.append(suggestion)
+    return suggestion_list[:limit]
+
+
+@token_required
+async def household_changes(request: web.Request) -> web.StreamResponse:
+    """
+    Async version of app.household_changes. Waiting for events takes no
+    thread, so this mode suits many connected clients much better.
+    """
+    household_id = request.query.get("household_id")
+    if not household_id:
+        return web.json_response({"error": "household_id is required"}, status=400)
+    uid = request["user"].get_id()
+    if not await request.app["households"].user_has_household(uid, household_id):
+        return web.json_response(
+            {"error": "User does not have access to this household"}, status=403
+        )
+
+    loop = asyncio.get_running_loop()
+    wakeup = asyncio.Event()
+    try:
+        subscription = flask_app.change_feed.subscribe(
+            household_id, uid, lambda: loop.call_soon_threadsafe(wakeup.set)
+        )
+    except TooManySubscribersException as e:
+        log.warning(f"Rejected change feed subscription: {str(e)}")
+        return web.json_response({"error": str(e)}, status=503)
+
+    response = web.StreamResponse(
+        headers={
+            "Content-Type": "text/event-stream",
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",
+        }
+    )
+    try:
+        await response.prepare(request)
+        await write_changes(response, subscription, wakeup)
+    except ConnectionResetError:
+        # The client disconnected.
+        pass
+    finally:
+        flask_app.change_feed.unsubscribe(subscription)
+    return response
+
+
+async def write_changes(
+    response: web.StreamResponse, subscription: Subscription, wakeup: asyncio.Event
+) -> None:
+    """Async version of HouseholdChangeFeed.stream()."""
+    household_id = subscription.household_id
+    while not subscription.closed and subscription.read_time is None:
+        await wait_for_wakeup(response, wakeup)
+    if subscription.read_time is not None:
+        await response.write(sse_message("ready", ready_message(subscription)).encode())
+    while not subscription.closed:
+        # Events may have arrived before the subscription was ready.
+        for event in subscription.poll():
+            await response.write(sse_message("change", dict(event)).encode())
+        await wait_for_wakeup(response, wakeup)
+    if subscription.overflowed:
+        await response.write(sse_message("resync", {"household_id": household_id}).encode())
+
+
+async def wait_for_wakeup(response: web.StreamResponse, wakeup: asyncio.Event) -> None:
+    """Waits for the subscription's notification, writing a heartbeat if there is none."""
+    try:
+        await asyncio.wait_for(wakeup.wait(), change_feed_heartbeat_s)
+    except asyncio.TimeoutError:
+        await response.write(SSE_HEARTBEAT.encode())
+        return
+    wakeup.clear()
+
+
+class RequestBodyStream:
+    """
+    The body of an aiohttp request as the blocking file object WSGI apps read
+    (wsgi.input). Reads are made on the event loop from a worker thread, so
+    uploads and imports are not buffered in memory first.
+    """
+
+    def __init__(self, request: web.Request, loop: asyncio.AbstractEventLoop) -> None:
+        self.__content = request.content
+        self.__loop = loop
+
+    def read(self, size: int | None = -1) -> bytes:
+        if size is None or size < 0:
+            return self.__call(self.__content.read())
+        return self.__call(self.__content.read(size))
+
+    def readline(self, size: int | None = -1) -> bytes:
+        return self.__call(self.__content.readline())
+
+    def __call(self, coro) -> bytes:
+        return asyncio.run_coroutine_threadsafe(coro, self.__loop).result()
+
+
+async def wsgi_fallback(request: web.Request) -> web.StreamResponse:
+    """
+    Handles a request with the Flask app, on the blocking executor. The request
+    and response bodies are streamed, e.g. for imports, exports and
+    server-sent events.
+    """
+    # The body headers are set below, EnvironBuilder would encode a body.
+    builder = EnvironBuilder(
+        path=request.path,
+        method=request.method,
+        query_string=request.query_string,
+        headers=[(k, v) for k, v in request.headers.items() if k.lower() not in _BODY_HEADERS],
+    )
+    environ = builder.get_environ()
+    environ["wsgi.input"] = RequestBodyStream(request, asyncio.get_running_loop())
+    environ["CONTENT_TYPE"] = request.headers.get("Content-Type", "")
+    if request.content_length is not None:
+        environ["CONTENT_LENGTH"] = str(request.content_length)
+    else:
+        environ.pop("CONTENT_LENGTH", None)
+        # Chunked request body, read it until the end.
+        environ["wsgi.input_terminated"] = True
+    environ["REMOTE_ADDR"] = request.remote or ""
+
+    # Flask's request context is pushed inside the response iterator (e.g. by
+    # stream_with_context), so all of its steps run in the same context even
+    # though they may run on different threads.
+    context = contextvars.Context()
+    app_iter, status, headers = await run_blocking(
+        context.run, run_wsgi_app, flask_app.app.wsgi_app, environ
+    )
+    try:
+        response = web.StreamResponse(
+            status=int(status.split(" ", 1)[0]),
+            headers=[(k, v) for k, v in headers.items() if k.lower() not in _HOP_BY_HOP_HEADERS],
+        )
+        if headers.get("Content-Length") is not None:
+            response.content_length = int(headers["Content-Length"])
+        await response.prepare(request)
+        await write_wsgi_body(response, context, iter(app_iter))
+        await response.write_eof()
+        return response
+    finally:
+        close = getattr(app_iter, "close", None)
+        if close is not None:
+            await run_blocking(context.run, close)
+
+
+async def write_wsgi_body(
+    response: web.StreamResponse, context: contextvars.Context, chunks: Iterator[bytes]
+) -> None:
+    """Writes the chunks of a WSGI response as they are produced."""
+    while True:
+        chunk = await run_blocking(context.run, next, chunks, None)
+        if chunk is None:
+            return
+        if chunk:
+            await response.write(chunk)
+
+
+@web.middleware
+async def metrics_middleware(request: web.Request, handler: Handler) -> web.StreamResponse:
+    route = request.match_info.route.name
+    if route is None:
+        # Delegated to Flask, which records its own metrics.
+        return await handler(request)
+    start_time = time.perf_counter()
+    metrics.requests_in_flight.labels().inc()
+    status = 500
+    try:
+        response = await handler(request)
+        status = response.status
+        return response
+    finally:
+        metrics.requests_in_flight.labels().dec()
+        metrics.responses.labels(route, status).inc()
+        metrics.request_latency.labels(route).observe(time.perf_counter() - start_time)
+
+
+async def create_app() -> web.Application:
+    firestore = create_async_document_store(flask_app.firestore)
+    session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=10))
+
+    # Image uploads are the largest request bodies read by aiohttp itself; the
+    # bodies of delegated requests are streamed to Flask without a limit.
+    application = web.Application(
+        middlewares=[metrics_middleware], client_max_size=image_upload_max_bytes
+    )
+    application["households"] = AsyncHouseholdManager(firestore)
+    application["products"] = AsyncProductManager(firestore)
+    application["shopping_list"] = AsyncShoppingListManager(firestore)
+    application["barcodes"] = AsyncBarcodeManager(firestore, session)
+
+    async def close_session(_: web.Application) -> None:
+        await session.close()
+
+    application.on_cleanup.append(close_session)
+
+    for path, handler in (
+        ("/list_products", list_products),
+        ("/list_households", list_households),
+        ("/get_shopping_list", get_shopping_list),
+        ("/get_barcode", get_barcode),
+        ("/search_products", search_products),
+    ):
+        application.router.add_post(path, handler, name=handler.__name__)
+    application.router.add_get(
+        "/household_changes", household_changes, name="household_changes"
+    )
+    application.router.add_route("*", "/{tail:.*}", wsgi_fallback)
+    return application
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Runs the app in async serving mode.")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=5000)
+    args = parser.parse_args()
+    web.run_app(create_app(), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+"""
+asyncio variants of the read paths of the managers, used by the async serving
+mode (see async_app.py). They take a google.cloud.firestore.AsyncClient (or
+an AsyncLocalDocumentStore) and share the document conversions with the
+synchronous managers.
+"""
+
+import asyncio
+
+import aiohttp
+from absl import logging as log
+from google.cloud.firestore_v1.base_query import FieldFilter
+
+from barcode_manager import BarcodeManager
+from household_manager import Household, HouseholdManager
+from product_manager import Product, ProductManager
+from shopping_list_manager import ShoppingListItem, ShoppingListManager
+
+
+class AsyncHouseholdManager:
+    def __init__(self, firestore) -> None:
+        self.__db = firestore
+
+    async def user_has_household(self, uid: str, household_id: str) -> bool:
+        household = await self.get_household(household_id)
+        if household is None:
+            return False
+        return uid in household.participants
+
+    async def get_household(self, id: str) -> Household | None:
+        if id is None or id.isspace():
+            log.error("get_household(): id must not be empty")
+            return None
+        try:
+            doc = await self.__db.collection("households").document(id).get()
+            if not doc.exists:
+                log.error("[%s] Cannot find household", id)
+                return None
+            return HouseholdManager.household_from_dict(doc)
+        except Exception as err:
+            log.error("[%s] Unable to fetch household data, %s", id, err)
+            return None
+
+    async def get_households_for_user(self, uid: str) -> list[Household]:
+        if uid is None or uid.isspace():
+            log.error("get_households_for_user(): uid must not be empty")
+            return []
+        try:
+            collection = self.__db.collection("households")
+            owned, participating = await asyncio.gather(
+                collection.where(filter=FieldFilter("owner_uid", "==", uid)).get(),
+                collection.where(filter=FieldFilter("participants", "array_contains", uid)).get(),
+            )
+            # Households the user owns first.
+            owned_ids = {doc.id for doc in owned}
+            return [HouseholdManager.household_from_dict(doc) for doc in owned] + [
+                HouseholdManager.household_from_dict(doc)
+                for doc in participating
+                if doc.id not in owned_ids
+            ]
+        except Exception as err:
+            log.error("[%s] Unable to fetch households for user, %s", uid, err)
+            return []
+
+
+class AsyncProductManager:
+    def __init__(self, firestore) -> None:
+        self.__db = firestore
+
+    async def get_household_products(self, household_id: str) -> list[Product]:
+        if household_id is None or household_id.isspace():
+            log.error("get_household_products(): uid must not be empty")
+            return []
+        try:
+            docs = await (
+                self.__db.collection("products")
+                .where(filter=FieldFilter("household_id", "==", household_id))
+                .get()
+            )
+            return [ProductManager.product_from_dict(doc) for doc in docs]
+        except Exception as err:
+            log.error("[%s] Unable to fetch products for household, %s", household_id, err)
+            return []
+
+
+class AsyncShoppingListManager:
+    def __init__(self, firestore) -> None:
+        self.__db = firestore
+
+    async def get_household_shopping_list(self, household_id: str) -> list[ShoppingListItem]:
+        if household_id is None or household_id.isspace():
+            log.error("get_household_shopping_list(): household_id must not be empty")
+            return []
+        try:
+            docs = await (
+                self.__db.collection("shopping_list")
+                .where(filter=FieldFilter("household_id", "==", household_id))
+                .where(filter=FieldFilter("completed", "==", False))
+                .get()
+            )
+            return [ShoppingListManager.item_from_dict(doc) for doc in docs]
+        except Exception as err:
+            log.error("[%s] Unable to fetch shopping list for household, %s", household_id, err)
+            return []
+
+
+class AsyncBarcodeManager:
+    def __init__(self, firestore, session: aiohttp.ClientSession) -> None:
+        self.__db = firestore
+        self.__session = session
+
+    async def get_product_name(self, barcode: str, household_id: str) -> tuple[str, bool] | None:
+        """See BarcodeManager.get_product_name()."""
+        if not barcode or barcode.isspace():
+            log.error("get_product_name(): barcode must not be empty")
+            return None
+        if not household_id or household_id.isspace():
+            log.error("get_product_name(): household_id must not be empty")
+            return None
+        try:
+            doc_ref = self.__db.collection("barcodes").document(barcode)
+            data = (await doc_ref.get()).to_dict()
+            if data:
+                return BarcodeManager.household_name(data, household_id)
+
+            product_name = await self.fetch_open_food_facts_name(barcode)
+            if not product_name:
+                log.warning("get_product_name(): failed to fetch product name for [%s]", barcode)
+                return None
+            await doc_ref.set({"names": [{"name": product_name, "source": "ext:openfoodfacts"}]})
+            return product_name, True
+        except Exception as err:
+            log.error("[%s] Unable to fetch barcode data: %s", barcode, err)
+            return None
+
+    async def fetch_open_food_facts_name(self, code: str) -> str | None:
+        try:
+            async with self.__session.get(
+                f"https://world.openfoodfacts.org/api/v2/product/{code}.json"
+            ) as response:
+                if response.status == 404:
+                    log.info("Barcode not found in Open Food Facts: %s", code)
+                    return ""
+                if response.status != 200:
+                    log.error("Failed to request barcode: %s", response.status)
+                    return None
+                data = await response.json(content_type=None)
+            if not data:
+                log.error("Failed to request barcode: %s", data)
+                return None
+            return data.get("product", {}).get("product_name", "")
+        except Exception as err:
+            log.error("Failed to request barcode: %s", err)
+            return None
@@ -0,0 +1,180 @@
+from array import array
+from collections import Counter
+import threading
+import time
+from typing import Callable, Dict, Iterable
+
+from absl import logging as log
+from rapidfuzz import fuzz, process
+
+
+class StringTable:
+    """Immutable list of strings stored in one string plus an offsets array."""
+
+    def __init__(self, strings: Iterable[str]) -> None:
+        parts = []
+        self.__offsets = array("I", [0])
+        for string in strings:
+            parts.append(string)
+            self.__offsets.append(self.__offsets[-1] + len(string))
+        self.__data = "".join(parts)
+
+    def __len__(self) -> int:
+        return len(self.__offsets) - 1
+
+    def __getitem__(self, i: int) -> str:
+        return self.__data[self.__offsets[i]:self.__offsets[i + 1]]
+
+
+class BarcodeNameSnapshot:
+    """
+    Read-only index of distinct product names and one barcode for each. Names
+    are sorted case-insensitively, so name IDs are in alphabetical order.
+    Trigram posting lists are arrays of name IDs.
+    """
+
+    def __init__(self, entries: Iterable[tuple[str, str]]) -> None:
+        # Keep one barcode per case-insensitive name.
+        by_name: Dict[str, tuple[str, str]] = {}
+        for barcode, name in entries:
+            name = name.strip()
+            if name:
+                by_name.setdefault(name.lower(), (name, barcode))
+        keys = sorted(by_name)
+        self.lower_names = StringTable(keys)
+        self.names = StringTable(by_name[key][0] for key in keys)
+        self.barcodes = StringTable(by_name[key][1] for key in keys)
+
+        postings: Dict[str, array] = {}
+        for name_id, key in enumerate(keys):
+            for trigram in set(trigrams(key)):
+                postings.setdefault(trigram, array("I")).append(name_id)
+        self.postings = postings
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def prefix_ids(self, prefix: str, limit: int) -> list[int]:
+        # Binary search for the first name >= prefix.
+        lo, hi = 0, len(self.lower_names)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.lower_names[mid] < prefix:
+                lo = mid + 1
+            else:
+                hi = mid
+        ids: list[int] = []
+        while lo < len(self.lower_names) and len(ids) < limit:
+            if not self.lower_names[lo].startswith(prefix):
+                break
+            ids.append(lo)
+            lo += 1
+        return ids
+
+    def trigram_candidates(self, query: str, limit: int, budget: int) -> list[int]:
+        """
+        Returns the IDs of the names sharing the most trigrams with the query.
+        Rare trigrams are the most selective, so the posting lists are merged
+        from the shortest one up until `budget` IDs have been counted.
+        """
+        lists = sorted(
+            (self.postings[trigram] for trigram in set(trigrams(query)) if trigram in self.postings),
+            key=len,
+        )
+        hits: Counter = Counter()
+        counted = 0
+        for posting in lists:
+            if counted and counted + len(posting) > budget:
+                break
+            hits.update(posting)
+            counted += len(posting)
+        return [name_id for name_id, _ in hits.most_common(limit)]
+
+
+def trigrams(text: str) -> list[str]:
+    padded = f"  {text} "
+    return [padded[i:i + 3] for i in range(len(padded) - 2)]
+
+
+class BarcodeNameIndex:
+    """
+    Global autocomplete over the product names in the barcodes collection
+    (Open Food Facts and household sourced). The index is rebuilt from scratch
+    by refresh() and swapped in atomically, lookups only read from memory.
+    It is first built in the background on the first lookup, so starting the
+    app does not read the barcodes collection.
+    """
+
+    # Number of trigram candidates that get ranked with RapidFuzz.
+    CANDIDATES_PER_RESULT = 5
+    # Maximum number of posting list entries merged per lookup.
+    POSTINGS_BUDGET = 20000
+    # Minimum RapidFuzz WRatio score (0-100) of a suggestion.
+    SCORE_CUTOFF = 60
+    # Minimum time between two attempts to build the index on lookup.
+    LOAD_RETRY_S = 60
+
+    def __init__(self, load_entries: Callable[[], Iterable[tuple[str, str]]]) -> None:
+        self.__load_entries = load_entries
+        self.__snapshot: BarcodeNameSnapshot | None = None
+        self.__refresh_lock = threading.Lock()
+        self.__load_lock = threading.Lock()
+        self.__load_started_at: float | None = None
+
+    def refresh(self) -> None:
+        if not self.__refresh_lock.acquire(blocking=False):
+            log.info("Barcode name index refresh already in progress")
+            return
+        try:
+            start = time.monotonic()
+            snapshot = BarcodeNameSnapshot(self.__load_entries())
+            self.__snapshot = snapshot
+            log.info(
+                "Built barcode name index of %d names in %.1fs",
+                len(snapshot),
+                time.monotonic() - start,
+            )
+        except Exception as err:
+            log.error("Unable to build barcode name index: %s", err)
+        finally:
+            self.__refresh_lock.release()
+
+    def search(self, query: str, limit: int = 20) -> list[Dict[str, str]]:
+        """
+        Returns up to `limit` name+barcode suggestions: name prefix matches in
+        alphabetical order first, followed by trigram matches ranked by score.
+        """
+        snapshot = self.__snapshot
+        if snapshot is None:
+            self.__load_in_background()
+        query = query.strip().lower()
+        if snapshot is None or not query or limit <= 0:
+            return []
+
+        ids: Dict[int, None] = dict.fromkeys(snapshot.prefix_ids(query, limit))
+        if len(ids) < limit and len(query) >= 2:
+            candidates = snapshot.trigram_candidates(
+                query, limit * self.CANDIDATES_PER_RESULT, self.POSTINGS_BUDGET
+            )
+            ranked = process.extract(
+                query,
+                {name_id: snapshot.lower_names[name_id] for name_id in candidates},
+                scorer=fuzz.WRatio,
+                limit=limit,
+                score_cutoff=self.SCORE_CUTOFF,
+            )
+            for _, _, name_id in ranked:
+                ids.setdefault(name_id, None)
+
+        return [
+            {"name": snapshot.names[name_id], "barcode": snapshot.barcodes[name_id]}
+            for name_id in list(ids)[:limit]
+        ]
+
+    def __load_in_background(self) -> None:
+        now = time.monotonic()
+        with self.__load_lock:
+            if self.__load_started_at is not None and now - self.__load_started_at < self.LOAD_RETRY_S:
+                return
+            self.__load_started_at = now
+        threading.Thread(target=self.refresh, name="barcode-index-load", daemon=True).start()
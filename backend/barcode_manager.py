@@ -1,6 +1,6 @@
 from absl import logging as log
 import requests
-from typing import List, Tuple, Dict
+from typing import Any, Iterator, List, Tuple, Dict
 
 
 class Barcode:
@@ -60,23 +60,28 @@ class BarcodeManager:
                     )
                     return None
 
-            names = data.get("names", [])
-            open_food_facts_name = ""
-            for name in names:
-                if name["source"] == "ext:openfoodfacts":
-                    open_food_facts_name = name["name"]
-                if name["source"] == household_id:
-                    # If the barcode was added for this household, immediately return it.
-                    return name["name"], False
-
-            # If we got here, we don't have a local household name for the product. So return
-            # the name from Open Food Facts if we have it, otherwise return empty string.
-            return open_food_facts_name, True
+            return self.household_name(data, household_id)
 
         except Exception as err:
             log.error("[%s] Unable to fetch barcode data: %s", barcode, err)
             return None
 
+    @staticmethod
+    def household_name(data: Dict[str, Any], household_id: str) -> Tuple[str, bool]:
+        """Returns (product_name, is_ext) of a barcode document for a household."""
+        names = data.get("names", [])
+        open_food_facts_name = ""
+        for name in names:
+            if name["source"] == "ext:openfoodfacts":
+                open_food_facts_name = name["name"]
+            if name["source"] == household_id:
+                # If the barcode was added for this household, immediately return it.
+                return name["name"], False
+
+        # If we got here, we don't have a local household name for the product. So return
+        # the name from Open Food Facts if we have it, otherwise return empty string.
+        return open_food_facts_name, True
+
     def add_barcode(self, barcode: Barcode) -> bool:
         if not barcode or not barcode.code or barcode.code.isspace():
             log.error("add_barcode(): code must not be empty")
@@ -129,6 +134,29 @@ class BarcodeManager:
             log.error("Failed to add barcode [%s]: %s", barcode.code, err)
             return False
 
+    def iter_names(self, page_size: int = 1000) -> Iterator[Tuple[str, str]]:
+        """
+        Yields (barcode, name) for every name in the barcodes collection. Pages
+        through the collection with query cursors instead of one long stream.
+        """
+        query = (
+            self.__db.collection("barcodes")
+            .select(["names"])
+            .order_by("__name__")
+            .limit(page_size)
+        )
+        last_doc = None
+        while True:
+            page = query.start_after(last_doc) if last_doc is not None else query
+            docs = list(page.stream())
+            for doc in docs:
+                for name in (doc.to_dict() or {}).get("names", []):
+                    if name.get("name"):
+                        yield doc.id, name["name"]
+            if len(docs) < page_size:
+                return
+            last_doc = docs[-1]
+
     def fetch_open_food_facts_name(self, code: str) -> str | None:
         if not code or code.isspace():
             log.error("fetch_open_food_facts(): code must not be empty")
@@ -0,0 +1,195 @@
+"""
+Compares the threaded serving mode (gunicorn gthread, as in the Dockerfile)
+with the async serving mode (async_app.py) under many concurrent clients.
+
+Each mode runs in its own server process on the local document store, seeded
+with the same synthetic data as bench_routes.py and with Firebase auth stubbed
+out. Every store call waits --latency-ms to simulate the Firestore round trip,
+which is what the async mode can overlap. The results are written as JSON, e.g.:
+
+    python benchmarks/bench_async.py --concurrency 200 --latency-ms 20 --output bench_async.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import time
+from typing import Any, Dict
+
+# Must be set before the app (and its config) is imported.
+os.environ.setdefault("STORAGE_BACKEND", "memory")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import aiohttp  # noqa: E402
+from absl import logging as log  # noqa: E402
+
+from bench_routes import ROUTES, AuthStub, Dataset, percentile, seed  # noqa: E402
+
+MODES = ("threaded", "async")
+
+
+def serve(args: argparse.Namespace) -> None:
+    """Seeds the store and serves the app in the given mode (runs in the child process)."""
+    auth_stub = AuthStub()
+    auth_stub.install()
+    import app as app_module
+
+    log.set_verbosity(log.WARNING)
+    app_module.maintenance_scheduler.shutdown(wait=False)
+    dataset = seed(app_module, auth_stub, args)
+    app_module.barcode_name_index.refresh()
+    # Tell the parent the server is about to listen and which data to request.
+    print(json.dumps(vars(dataset)), flush=True)
+
+    if args.serve == "async":
+        from aiohttp import web
+
+        import async_app
+
+        web.run_app(async_app.create_app(), host="127.0.0.1", port=args.port, print=None)
+        return
+
+    from gunicorn.app.base import BaseApplication
+
+    class ThreadedApplication(BaseApplication):
+        def load_config(self) -> None:
+            self.cfg.set("bind", f"127.0.0.1:{args.port}")
+            self.cfg.set("workers", 1)
+            self.cfg.set("threads", args.threads)
+            self.cfg.set("worker_class", "gthread")
+            self.cfg.set("backlog", 4096)
+            self.cfg.set("loglevel", "warning")
+
+        def load(self):
+            return app_module.app
+
+    ThreadedApplication().run()
+
+
+async def wait_until_ready(port: int, timeout_s: float = 30) -> None:
+    deadline = time.monotonic() + timeout_s
+    async with aiohttp.ClientSession() as session:
+        while True:
+            try:
+                async with session.get(f"http://127.0.0.1:{port}/health") as response:
+                    await response.read()
+                    return
+            except aiohttp.ClientConnectionError:
+                if time.monotonic() > deadline:
+                    raise
+                await asyncio.sleep(0.1)
+
+
+async def run_route(port: int, dataset: Dataset, name: str, args: argparse.Namespace) -> Dict[str, Any]:
+    make_request = ROUTES[name]
+    connector = aiohttp.TCPConnector(limit=args.concurrency)
+    async with aiohttp.ClientSession(connector=connector) as session:
+
+        async def call(i: int) -> tuple[float, bool]:
+            path, body = make_request(dataset, random.Random(args.seed + i))
+            start = time.perf_counter()
+            try:
+                async with session.post(
+                    f"http://127.0.0.1:{port}{path}", json=body, headers={"idToken": dataset.uid}
+                ) as response:
+                    await response.read()
+                    ok = response.status < 400
+            except aiohttp.ClientError:
+                ok = False
+            return (time.perf_counter() - start) * 1000, ok
+
+        async def run(num: int) -> list[tuple[float, bool]]:
+            semaphore = asyncio.Semaphore(args.concurrency)
+
+            async def bounded(i: int) -> tuple[float, bool]:
+                async with semaphore:
+                    return await call(i)
+
+            return await asyncio.gather(*[bounded(i) for i in range(num)])
+
+        await run(args.warmup)
+        start = time.perf_counter()
+        results = await run(args.requests)
+        elapsed = time.perf_counter() - start
+
+    latencies = sorted(latency for latency, _ in results)
+    return {
+        "requests": len(results),
+        "errors": sum(1 for _, ok in results if not ok),
+        "p50_ms": round(percentile(latencies, 50), 3),
+        "p95_ms": round(percentile(latencies, 95), 3),
+        "p99_ms": round(percentile(latencies, 99), 3),
+        "mean_ms": round(statistics.fmean(latencies), 3) if latencies else 0.0,
+        "throughput_rps": round(len(results) / elapsed, 1) if elapsed else 0.0,
+    }
+
+
+def bench_mode(mode: str, port: int, routes: list[str], args: argparse.Namespace) -> Dict[str, Any]:
+    command = [sys.executable, os.path.abspath(__file__), "--serve", mode, "--port", str(port)]
+    for key in ("products", "participants", "households", "shopping_items", "barcodes", "seed", "threads"):
+        command += [f"--{key.replace('_', '-')}", str(getattr(args, key))]
+    env = dict(os.environ, LOCAL_STORAGE_LATENCY_MS=str(args.latency_ms))
+    server = subprocess.Popen(command, env=env, stdout=subprocess.PIPE, text=True)
+    try:
+        assert server.stdout is not None
+        dataset = Dataset(**json.loads(server.stdout.readline()))
+        asyncio.run(wait_until_ready(port))
+        return {name: asyncio.run(run_route(port, dataset, name, args)) for name in routes}
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--products", type=int, default=1000, help="products in the benchmarked household")
+    parser.add_argument("--participants", type=int, default=5, help="members of the benchmarked household")
+    parser.add_argument("--households", type=int, default=3, help="households of the benchmarked user")
+    parser.add_argument("--shopping-items", type=int, default=100)
+    parser.add_argument("--barcodes", type=int, default=2000, help="entries in the global barcodes collection")
+    parser.add_argument("--concurrency", type=int, default=200, help="concurrent clients")
+    parser.add_argument("--requests", type=int, default=1000, help="measured requests per route")
+    parser.add_argument("--warmup", type=int, default=50, help="unmeasured requests per route")
+    parser.add_argument("--routes", default="list_products,get_shopping_list,list_households,get_barcode")
+    parser.add_argument("--modes", default=",".join(MODES), help="comma separated serving modes to run")
+    parser.add_argument("--latency-ms", type=float, default=20, help="simulated document store round-trip time")
+    parser.add_argument("--threads", type=int, default=4, help="gunicorn threads of the threaded mode")
+    parser.add_argument("--port", type=int, default=5099)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--serve", choices=MODES, help=argparse.SUPPRESS)
+    parser.add_argument("--output", help="write the JSON results to this file instead of stdout")
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args)
+        return
+
+    routes = [name.strip() for name in args.routes.split(",") if name.strip()]
+    modes = [mode.strip() for mode in args.modes.split(",") if mode.strip()]
+    unknown = [name for name in routes if name not in ROUTES] + [mode for mode in modes if mode not in MODES]
+    if unknown:
+        parser.error(f"Unknown routes or modes: {', '.join(unknown)}")
+
+    results = {
+        "config": {
+            key: value
+            for key, value in vars(args).items()
+            if key not in ("output", "routes", "modes", "serve", "port")
+        },
+        "modes": {mode: bench_mode(mode, args.port, routes, args) for mode in modes},
+    }
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
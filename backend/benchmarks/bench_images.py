@@ -0,0 +1,119 @@
+"""
+Benchmarks the product image pipeline (image_processing.py): bytes saved and
+processing time per upload, and throughput of the worker pool. Uses synthetic
+phone-sized JPEG photos unless real ones are given, e.g.:
+
+    python benchmarks/bench_images.py --images ~/photos/*.jpg --format webp --output images.json
+"""
+
+import argparse
+import io
+import json
+import os
+import statistics
+import sys
+import time
+from typing import Any, Dict
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from PIL import Image, ImageChops  # noqa: E402
+
+from bench_routes import percentile  # noqa: E402
+from image_processing import ImageProcessor  # noqa: E402
+
+# (width, height) of the synthetic photos, common phone camera resolutions.
+PHOTO_SIZES = [(4032, 3024), (4000, 3000), (3264, 2448), (1920, 1080)]
+
+
+def synthetic_photo(width: int, height: int, seed: int) -> bytes:
+    """A noisy gradient saved like a phone camera does: high quality JPEG with EXIF."""
+    gradient = Image.linear_gradient("L").resize((width, height))
+    noise = Image.effect_noise((width, height), 20 + seed % 30)
+    image = Image.merge(
+        "RGB",
+        (gradient, ImageChops.add(gradient.transpose(Image.Transpose.ROTATE_180), noise, 2), noise),
+    )
+    exif = Image.Exif()
+    exif[0x0112] = 6  # Orientation: rotated 90 degrees
+    exif[0x010F] = "Benchmark Phone"  # Make
+    out = io.BytesIO()
+    image.save(out, "JPEG", quality=92, exif=exif.tobytes())
+    return out.getvalue()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", nargs="*", help="image files to process instead of synthetic photos")
+    parser.add_argument("--count", type=int, default=12, help="number of synthetic photos")
+    parser.add_argument("--format", default="webp", help="output format, webp or jpeg")
+    parser.add_argument("--quality", type=int, default=80)
+    parser.add_argument("--max-size", type=int, default=1600)
+    parser.add_argument("--thumbnail-size", type=int, default=320)
+    parser.add_argument("--workers", type=int, default=2, help="size of the image worker pool")
+    parser.add_argument("--output", help="write the JSON results to this file instead of stdout")
+    args = parser.parse_args()
+
+    if args.images:
+        uploads = []
+        for path in args.images:
+            with open(path, "rb") as f:
+                uploads.append(f.read())
+    else:
+        uploads = [
+            synthetic_photo(*PHOTO_SIZES[i % len(PHOTO_SIZES)], seed=i) for i in range(args.count)
+        ]
+
+    processor = ImageProcessor(
+        max_size=args.max_size,
+        thumbnail_size=args.thumbnail_size,
+        format=args.format,
+        quality=args.quality,
+        workers=args.workers,
+    )
+    processor.process(uploads[0])  # warm up
+
+    latencies = []
+    results = []
+    for data in uploads:
+        start = time.perf_counter()
+        results.append(processor.process(data))
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    for future in [processor.submit(data) for data in uploads]:
+        future.result()
+    pool_elapsed = time.perf_counter() - start
+
+    original_bytes = sum(result.original_size for result in results)
+    stored_bytes = sum(len(result.image.data) for result in results)
+    thumbnail_bytes = sum(len(result.thumbnail.data) for result in results)
+    latencies.sort()
+    output: Dict[str, Any] = {
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "images")}
+        | {"images": len(uploads), "synthetic": not args.images},
+        "bytes": {
+            "original_mean": round(original_bytes / len(results)),
+            "image_mean": round(stored_bytes / len(results)),
+            "thumbnail_mean": round(thumbnail_bytes / len(results)),
+            "image_saved_pct": round(100 * (1 - stored_bytes / original_bytes), 1),
+            # What a list view downloads per product, compared to the original.
+            "thumbnail_saved_pct": round(100 * (1 - thumbnail_bytes / original_bytes), 2),
+        },
+        "processing_ms": {
+            "p50": round(percentile(latencies, 50), 1),
+            "p95": round(percentile(latencies, 95), 1),
+            "mean": round(statistics.fmean(latencies), 1),
+        },
+        "pool_throughput_images_per_s": round(len(uploads) / pool_elapsed, 2),
+    }
+    text = json.dumps(output, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+"""
+Measures the cost of recording metrics on the request path, in nanoseconds
+per call:
+
+    python benchmarks/bench_metrics.py
+"""
+
+import json
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import metrics  # noqa: E402
+from timing import measure_time  # noqa: E402
+
+
+def noop() -> None:
+    pass
+
+
+def main() -> None:
+    number = 200000
+    histogram = metrics.route_latency.labels("bench")
+    counter = metrics.cache_lookups.labels("bench", "hit")
+    timed_noop = measure_time(noop)
+    cases = {
+        "histogram_observe": lambda: histogram.observe(0.012),
+        "counter_inc": counter.inc,
+        "labels_lookup": lambda: metrics.backend_latency.labels("firestore", "get"),
+        "measure_time_overhead": timed_noop,
+        "baseline_call": noop,
+    }
+    results = {
+        name: round(min(timeit.repeat(case, number=number, repeat=5)) / number * 1e9, 1)
+        for name, case in cases.items()
+    }
+    print(json.dumps({"ns_per_call": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
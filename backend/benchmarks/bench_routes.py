@@ -0,0 +1,315 @@
+"""
+Benchmarks the hot API routes against the local document store, with Firebase
+auth stubbed out, so it runs without credentials or network access.
+
+Synthetic households are seeded first, then each route is called at a fixed
+concurrency through the Flask test client. The results (latency percentiles,
+throughput and backend calls per request) are written as JSON, e.g.:
+
+    python benchmarks/bench_routes.py --products 10000 --concurrency 8 --output bench.json
+"""
+
+import argparse
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+import json
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+from typing import Any, Callable, Dict
+
+# Must be set before the app (and its config) is imported.
+os.environ.setdefault("STORAGE_BACKEND", "memory")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from absl import logging as log  # noqa: E402
+from firebase_admin import auth  # noqa: E402
+from firebase_admin.auth import UserRecord  # noqa: E402
+
+WORDS = (
+    "apple banana carrot tomato potato onion garlic pepper cheese butter milk yogurt "
+    "bread pasta rice flour sugar salt basil oregano chicken beef salmon tuna beans "
+    "lentils oats cereal honey jam peanut almond walnut spinach lettuce cucumber lemon "
+    "orange mango grape cherry strawberry blueberry chocolate coffee tea juice ham "
+    "sausage egg cream mustard ketchup mayo vinegar olive oil soup noodles tofu"
+).split()
+ADJECTIVES = "organic fresh frozen dried smoked sliced whole light spicy sweet".split()
+LOCATIONS = ["Pantry", "Fridge", "Freezer"]
+CATEGORIES = ["Veggies", "Fruits", "Baking", "Spices", "Others"]
+
+
+class AuthStub:
+    """Replaces the Firebase auth calls made while handling requests and counts them."""
+
+    def __init__(self) -> None:
+        self.users: Dict[str, UserRecord] = {}
+        self.calls: Counter = Counter()
+        self.__lock = threading.Lock()
+
+    def add_user(self, uid: str) -> None:
+        self.users[uid] = UserRecord(
+            {"localId": uid, "email": f"{uid}@example.com", "displayName": uid.title()}
+        )
+
+    def install(self) -> None:
+        auth.verify_id_token = self.verify_id_token
+        auth.get_user = self.get_user
+        auth.get_users = self.get_users
+
+    def verify_id_token(self, id_token: str, *args, **kwargs) -> Dict[str, Any]:
+        self.__count("verify_id_token")
+        if id_token not in self.users:
+            raise auth.InvalidIdTokenError("Unknown user")
+        return {"uid": id_token}
+
+    def get_user(self, uid: str, *args, **kwargs) -> UserRecord:
+        self.__count("get_user")
+        if uid not in self.users:
+            raise auth.UserNotFoundError(f"No user {uid}")
+        return self.users[uid]
+
+    def get_users(self, identifiers: list, *args, **kwargs) -> auth.GetUsersResult:
+        self.__count("get_users")
+        return auth.GetUsersResult(
+            [self.users[i.uid] for i in identifiers if i.uid in self.users],
+            [i for i in identifiers if i.uid not in self.users],
+        )
+
+    def __count(self, name: str) -> None:
+        with self.__lock:
+            self.calls[name] += 1
+
+
+class Dataset:
+    def __init__(self, household_id: str, uid: str, queries: list[str], barcodes: list[str]) -> None:
+        self.household_id = household_id
+        self.uid = uid
+        self.queries = queries
+        self.barcodes = barcodes
+
+
+# Route name -> function returning the (path, JSON body) of a request.
+ROUTES: Dict[str, Callable[[Dataset, random.Random], tuple[str, Dict[str, Any]]]] = {
+    "list_products": lambda ds, rnd: ("/list_products", {"householdId": ds.household_id}),
+    "search_products": lambda ds, rnd: (
+        "/search_products",
+        {"householdId": ds.household_id, "query": rnd.choice(ds.queries)},
+    ),
+    "get_shopping_list": lambda ds, rnd: ("/get_shopping_list", {"household_id": ds.household_id}),
+    "list_households": lambda ds, rnd: ("/list_households", {}),
+    "get_barcode": lambda ds, rnd: (
+        "/get_barcode",
+        {"householdId": ds.household_id, "barcode": rnd.choice(ds.barcodes)},
+    ),
+    "bootstrap": lambda ds, rnd: ("/bootstrap", {"householdId": ds.household_id}),
+    # The requests of the app launch in one /batch request.
+    "batch_launch": lambda ds, rnd: (
+        "/batch",
+        {
+            "requests": [
+                {"path": "/list_households"},
+                {"path": "/get_locations_categories", "body": {"householdId": ds.household_id}},
+                {"path": "/list_products", "body": {"householdId": ds.household_id}},
+                {"path": "/get_shopping_list", "body": {"household_id": ds.household_id}},
+                {"path": "/get_pending_invitations"},
+            ]
+        },
+    ),
+}
+
+
+def product_name(rnd: random.Random) -> str:
+    words = rnd.sample(WORDS, rnd.choice((1, 2, 2, 3)))
+    if rnd.random() < 0.3:
+        words.insert(0, rnd.choice(ADJECTIVES))
+    return " ".join(words).capitalize()
+
+
+def seed(app_module, auth_stub: AuthStub, args: argparse.Namespace) -> Dataset:
+    """Writes the synthetic households, products, shopping list and barcodes."""
+    rnd = random.Random(args.seed)
+    db = app_module.firestore
+    writer = BatchWriter(db)
+
+    uids = [f"user{i}" for i in range(args.participants)]
+    for uid in uids:
+        auth_stub.add_user(uid)
+        writer.set(db.collection("users").document(uid), {"email": f"{uid}@example.com"})
+    uid = uids[0]
+
+    household_ids = []
+    for i in range(args.households):
+        household_ref = db.collection("households").document()
+        participants = uids if i == 0 else [uid] + rnd.sample(uids[1:], min(2, len(uids) - 1))
+        writer.set(
+            household_ref,
+            dict(app_module.Household(household_ref.id, uid, f"Household {i}", participants)),
+        )
+        household_ids.append(household_ref.id)
+    household_id = household_ids[0]
+
+    now_ms = int(time.time() * 1000)
+    barcodes = [f"{4000000000000 + i}" for i in range(args.barcodes)]
+    for code in barcodes:
+        writer.set(
+            db.collection("barcodes").document(code),
+            {"names": [{"name": product_name(rnd), "source": "ext:openfoodfacts"}]},
+        )
+    for _ in range(args.products):
+        writer.set(
+            db.collection("products").document(),
+            dict(
+                app_module.Product(
+                    "",
+                    rnd.choice(barcodes) if rnd.random() < 0.5 else "",
+                    rnd.choice(CATEGORIES),
+                    now_ms - rnd.randint(0, 90) * 86400000,
+                    now_ms + rnd.randint(-10, 60) * 86400000,
+                    rnd.choice(LOCATIONS),
+                    product_name(rnd),
+                    household_id,
+                    False,
+                    0,
+                    "",
+                )
+            ),
+        )
+    for _ in range(args.shopping_items):
+        writer.set(
+            db.collection("shopping_list").document(),
+            dict(app_module.ShoppingListItem("", product_name(rnd), household_id, uid, now_ms)),
+        )
+    writer.commit()
+
+    queries = [word[:n] for word in WORDS for n in (2, 4)] + ["chese", "tomatto", "bred"]
+    return Dataset(household_id, uid, queries, barcodes)
+
+
+class BatchWriter:
+    def __init__(self, db, batch_size: int = 500) -> None:
+        self.__db = db
+        self.__batch_size = batch_size
+        self.__batch = db.batch()
+        self.__size = 0
+
+    def set(self, ref, data: Dict[str, Any]) -> None:
+        self.__batch.set(ref, data)
+        self.__size += 1
+        if self.__size == self.__batch_size:
+            self.commit()
+
+    def commit(self) -> None:
+        if self.__size:
+            self.__batch.commit()
+        self.__batch = self.__db.batch()
+        self.__size = 0
+
+
+def percentile(sorted_values: list[float], p: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(p / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def run_route(app_module, auth_stub: AuthStub, dataset: Dataset, name: str, args: argparse.Namespace) -> Dict[str, Any]:
+    make_request = ROUTES[name]
+    clients = threading.local()
+
+    def call(i: int) -> tuple[float, bool]:
+        if not hasattr(clients, "client"):
+            clients.client = app_module.app.test_client()
+        path, body = make_request(dataset, random.Random(args.seed + i))
+        start = time.perf_counter()
+        response = clients.client.post(path, json=body, headers={"idToken": dataset.uid})
+        return (time.perf_counter() - start) * 1000, response.status_code < 400
+
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        list(executor.map(call, range(args.warmup)))
+        store_before = Counter(app_module.firestore.stats)
+        auth_before = Counter(auth_stub.calls)
+        start = time.perf_counter()
+        results = list(executor.map(call, range(args.requests)))
+        elapsed = time.perf_counter() - start
+
+    store_calls = Counter(app_module.firestore.stats)
+    store_calls.subtract(store_before)
+    auth_calls = Counter(auth_stub.calls)
+    auth_calls.subtract(auth_before)
+    backend_calls = {f"store_{key}": value for key, value in store_calls.items()}
+    backend_calls.update({f"auth_{key}": value for key, value in auth_calls.items()})
+
+    latencies = sorted(latency for latency, _ in results)
+    return {
+        "requests": len(results),
+        "errors": sum(1 for _, ok in results if not ok),
+        "p50_ms": round(percentile(latencies, 50), 3),
+        "p95_ms": round(percentile(latencies, 95), 3),
+        "p99_ms": round(percentile(latencies, 99), 3),
+        "mean_ms": round(statistics.fmean(latencies), 3) if latencies else 0.0,
+        "throughput_rps": round(len(results) / elapsed, 1) if elapsed else 0.0,
+        "backend_calls_per_request": {
+            key: round(value / len(results), 2)
+            for key, value in sorted(backend_calls.items())
+            if value
+        },
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--products", type=int, default=1000, help="products in the benchmarked household")
+    parser.add_argument("--participants", type=int, default=5, help="members of the benchmarked household")
+    parser.add_argument("--households", type=int, default=3, help="households of the benchmarked user")
+    parser.add_argument("--shopping-items", type=int, default=100)
+    parser.add_argument("--barcodes", type=int, default=2000, help="entries in the global barcodes collection")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=200, help="measured requests per route")
+    parser.add_argument("--warmup", type=int, default=20, help="unmeasured requests per route")
+    parser.add_argument("--routes", default=",".join(ROUTES), help="comma separated routes to run")
+    parser.add_argument("--latency-ms", type=float, help="simulated document store round-trip time")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="write the JSON results to this file instead of stdout")
+    args = parser.parse_args()
+
+    if args.latency_ms is not None:
+        os.environ["LOCAL_STORAGE_LATENCY_MS"] = str(args.latency_ms)
+    routes = [name.strip() for name in args.routes.split(",") if name.strip()]
+    unknown = [name for name in routes if name not in ROUTES]
+    if unknown:
+        parser.error(f"Unknown routes: {', '.join(unknown)}")
+
+    auth_stub = AuthStub()
+    auth_stub.install()
+    import app as app_module
+
+    log.set_verbosity(log.WARNING)
+    app_module.maintenance_scheduler.shutdown(wait=False)
+
+    start = time.perf_counter()
+    dataset = seed(app_module, auth_stub, args)
+    app_module.barcode_name_index.refresh()
+    seed_s = time.perf_counter() - start
+
+    results = {
+        "config": {
+            key: value for key, value in vars(args).items() if key not in ("output", "routes")
+        }
+        | {"storage_backend": os.environ["STORAGE_BACKEND"], "seed_s": round(seed_s, 2)},
+        "routes": {
+            name: run_route(app_module, auth_stub, dataset, name, args) for name in routes
+        },
+    }
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
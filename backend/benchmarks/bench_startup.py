@@ -0,0 +1,115 @@
+"""
+Measures the cold start of the app: each run imports it in a fresh Python
+process and reports the total import time, the import time of each module
+app.py imports directly (from `python -X importtime`), the time of each
+initialization step (timing.startup_phase) and the latency of the first
+request. The medians over all runs are written as JSON, e.g.:
+
+    python benchmarks/bench_startup.py --runs 10 --output startup.json
+
+Uses the in-memory document store unless STORAGE_BACKEND is set.
+"""
+
+import argparse
+from collections import defaultdict
+import json
+import os
+import statistics
+import subprocess
+import sys
+from typing import Any, Dict
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+# Runs in the child process and prints its measurements as JSON.
+CHILD = """
+import json, time
+start = time.perf_counter()
+import app
+import_s = time.perf_counter() - start
+app.maintenance_scheduler.shutdown(wait=False)
+from timing import startup_phases
+start = time.perf_counter()
+app.app.test_client().get("/health")
+first_request_s = time.perf_counter() - start
+print(json.dumps({"import_s": import_s, "phases": startup_phases, "first_request_s": first_request_s}))
+"""
+
+
+def parse_importtime(stderr: str, parent: str = "app") -> Dict[str, float]:
+    """Returns module -> cumulative import seconds for the direct imports of `parent`."""
+    modules: Dict[str, float] = {}
+    lines = [line for line in stderr.splitlines() if line.startswith("import time:")]
+    parent_indent = None
+    # Children are printed before their parent, so walk the lines backwards.
+    for line in reversed(lines):
+        _, cumulative, name = line.split("|", 2)
+        indent = len(name) - len(name.lstrip())
+        name = name.strip()
+        if parent_indent is None:
+            if name == parent:
+                parent_indent = indent
+            continue
+        if indent <= parent_indent:
+            break
+        if indent == parent_indent + 2:
+            modules[name] = int(cumulative) / 1e6
+    return modules
+
+
+def run_once() -> Dict[str, Any]:
+    env = dict(os.environ)
+    env.setdefault("STORAGE_BACKEND", "memory")
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", CHILD],
+        cwd=BACKEND_DIR,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    measurements = json.loads(result.stdout.strip().splitlines()[-1])
+    measurements["modules"] = parse_importtime(result.stderr)
+    return measurements
+
+
+def median_ms(values: list[float]) -> float:
+    return round(statistics.median(values) * 1000, 2)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15, help="number of slowest imports to report")
+    parser.add_argument("--output", help="write the JSON results to this file instead of stdout")
+    args = parser.parse_args()
+
+    runs = [run_once() for _ in range(args.runs)]
+    phases: Dict[str, list[float]] = defaultdict(list)
+    modules: Dict[str, list[float]] = defaultdict(list)
+    for run in runs:
+        for name, seconds in run["phases"].items():
+            phases[name].append(seconds)
+        for name, seconds in run["modules"].items():
+            modules[name].append(seconds)
+
+    # Without -X importtime overhead the imports are somewhat faster, so the
+    # module times are best compared with each other, not with import_ms.
+    slowest = sorted(modules.items(), key=lambda item: statistics.median(item[1]), reverse=True)
+    results = {
+        "config": {"runs": args.runs, "storage_backend": os.environ.get("STORAGE_BACKEND", "memory")},
+        "import_ms": median_ms([run["import_s"] for run in runs]),
+        "first_request_ms": median_ms([run["first_request_s"] for run in runs]),
+        "init_phases_ms": {name: median_ms(values) for name, values in phases.items()},
+        "imports_ms": {name: median_ms(values) for name, values in slowest[: args.top]},
+    }
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
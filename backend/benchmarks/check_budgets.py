@@ -0,0 +1,107 @@
+"""
+Fails if a route makes more backend calls, or reads more Firestore documents,
+than its budget, to catch N+1 query regressions. Each route is called once to warm up caches, then once
+more to read the call counts from the X-Request-Stats header. Run it from the
+backend directory (run_tests.sh --budgets does):
+
+    python benchmarks/check_budgets.py
+"""
+
+import argparse
+import json
+import random
+import sys
+from typing import Dict
+
+from bench_routes import ROUTES, AuthStub, seed
+
+# Dataset the budgets below were measured with.
+DATASET = argparse.Namespace(
+    products=200,
+    participants=5,
+    households=3,
+    shopping_items=20,
+    barcodes=200,
+    seed=1,
+)
+
+
+def docs_read(expected: int) -> int:
+    """
+    Budget for a route that reads the expected number of Firestore documents,
+    with 10% (at least 2 documents) of headroom. That tolerates small changes,
+    e.g. reading one more settings document, but not a read per product.
+    """
+    return expected + max(2, expected // 10)
+
+
+# Route -> maximum number of calls per backend service, and of Firestore
+# documents read ("docs_read"), in a warm request.
+BUDGETS: Dict[str, Dict[str, int]] = {
+    # The household and its products.
+    "list_products": {"firestore": 2, "auth": 2, "docs_read": docs_read(1 + DATASET.products)},
+    # Served from the search index, one household membership read.
+    "search_products": {"firestore": 1, "auth": 2, "docs_read": docs_read(1)},
+    # The user's households (owned and participating, so read twice) and the
+    # shopping list items.
+    "get_shopping_list": {
+        "firestore": 3,
+        "auth": 2,
+        "docs_read": docs_read(2 * DATASET.households + DATASET.shopping_items),
+    },
+    # The participants of all the user's households are looked up with one call.
+    "list_households": {"firestore": 2, "auth": 3, "docs_read": docs_read(2 * DATASET.households)},
+    "get_barcode": {"firestore": 1, "auth": 2, "docs_read": docs_read(1)},
+    # The user document, the household, its products and shopping list.
+    "bootstrap": {
+        "firestore": 4,
+        "auth": 2,
+        "docs_read": docs_read(2 + DATASET.products + DATASET.shopping_items),
+    },
+    # Five launch requests, verifying the token and reading the household once:
+    # the documents of list_households, list_products and get_shopping_list.
+    "batch_launch": {
+        "firestore": 8,
+        "auth": 3,
+        "docs_read": docs_read(4 * DATASET.households + 1 + DATASET.products + DATASET.shopping_items),
+    },
+}
+SERVICES = ("firestore", "auth", "storage", "http")
+
+
+def main() -> int:
+    auth_stub = AuthStub()
+    auth_stub.install()
+    import app as app_module
+    from absl import logging as log
+
+    log.set_verbosity(log.WARNING)
+    app_module.maintenance_scheduler.shutdown(wait=False)
+    app_module.app.config["REQUEST_STATS_HEADER"] = True
+    dataset = seed(app_module, auth_stub, DATASET)
+    client = app_module.app.test_client()
+
+    failed = False
+    for name, budget in BUDGETS.items():
+        path, body = ROUTES[name](dataset, random.Random(DATASET.seed))
+        for _ in range(2):
+            response = client.post(path, json=body, headers={"idToken": dataset.uid})
+        stats = json.loads(response.headers["X-Request-Stats"])
+        used = {
+            service: sum(
+                num for call, num in stats["calls"].items() if call.startswith(f"{service}.")
+            )
+            for service in SERVICES
+        }
+        used["docs_read"] = stats["docs_read"]
+        over = {
+            service: num for service, num in used.items() if num > budget.get(service, 0)
+        }
+        status = "OVER BUDGET" if over else "ok"
+        print(f"{name}: {status} {json.dumps(used)} budget {json.dumps(budget)}")
+        failed = failed or bool(over) or response.status_code >= 400
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,192 @@
+"""
+Durable queue of Cloud Storage blobs to delete. Request handlers only write
+the entries to the blob_deletions collection; a background worker deletes
+the blobs in batches, retries failures with exponential backoff and moves
+entries that keep failing to blob_deletions_dead for manual inspection.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import threading
+from typing import Any, Callable, Iterable
+
+from absl import logging as log
+from google.api_core.exceptions import NotFound
+from google.cloud.firestore_v1 import DocumentSnapshot
+from google.cloud.firestore_v1.base_query import FieldFilter
+
+
+class BlobDeletion:
+    def __init__(
+        self,
+        path: str,
+        content_hash: str = "",
+        attempts: int = 0,
+        next_attempt_at: int = 0,
+        created_at: int = 0,
+        error: str = "",
+    ) -> None:
+        self.path = path
+        # Set for content-addressed images: the blob is kept if the image got
+        # referenced or uploaded again since it was queued (see image_store.py).
+        self.content_hash = content_hash
+        self.attempts = attempts
+        self.next_attempt_at = next_attempt_at
+        self.created_at = created_at
+        self.error = error
+
+    def __iter__(self):
+        yield "path", self.path
+        yield "content_hash", self.content_hash
+        yield "attempts", self.attempts
+        yield "next_attempt_at", self.next_attempt_at
+        yield "created_at", self.created_at
+        yield "error", self.error
+
+
+class BlobDeletionQueue:
+    BATCH_LIMIT = 100
+    MAX_ATTEMPTS = 8
+    # Delay before the first retry, doubled with every attempt.
+    RETRY_DELAY_MS = 60 * 1000
+    MAX_RETRY_DELAY_MS = 6 * 60 * 60 * 1000
+
+    def __init__(
+        self,
+        firestore,
+        bucket: Callable[[], Any],
+        is_referenced: Callable[[str, int], bool] | None = None,
+        max_workers: int = 8,
+    ) -> None:
+        self.__db = firestore
+        # Returns the storage bucket; called on use so the client is created lazily.
+        self.__bucket = bucket
+        # Tells whether a content hash is in use again since the given time
+        # (epoch millis), see BlobDeletion.content_hash.
+        self.__is_referenced = is_referenced
+        self.__executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="blob-deletion")
+        # Drains the queue soon after something was enqueued, see enqueue().
+        self.__drainer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="blob-drain")
+        self.__drain_pending = threading.Event()
+        self.__drain_lock = threading.Lock()
+
+    def enqueue(self, paths: Iterable[str], content_hash: str = "") -> bool:
+        """Queues the blobs for deletion with a single write; returns False if that failed."""
+        now = self.__now()
+        batch = self.__db.batch()
+        num = 0
+        for path in paths:
+            batch.set(
+                self.__queue().document(self.__doc_id(path)),
+                dict(BlobDeletion(path, content_hash, next_attempt_at=now, created_at=now)),
+            )
+            num += 1
+        if num == 0:
+            return True
+        try:
+            batch.commit()
+        except Exception as err:
+            log.error("Unable to queue %d blobs for deletion: %s", num, err)
+            return False
+        self.__schedule_drain()
+        return True
+
+    def drain(self) -> int:
+        """Processes all entries that are due; returns the number of deleted blobs."""
+        with self.__drain_lock:
+            self.__drain_pending.clear()
+            return self.__drain()
+
+    def __drain(self) -> int:
+        deleted = 0
+        try:
+            while True:
+                docs = list(
+                    self.__queue()
+                    .where(filter=FieldFilter("next_attempt_at", "<=", self.__now()))
+                    .order_by("next_attempt_at")
+                    .limit(self.BATCH_LIMIT)
+                    .stream()
+                )
+                if not docs:
+                    break
+                deleted += self.__process(docs)
+                if len(docs) < self.BATCH_LIMIT:
+                    break
+        except Exception as err:
+            log.error("drain(): Unable to process the blob deletion queue: %s", err)
+        if deleted:
+            log.info("Deleted %d queued blobs", deleted)
+        return deleted
+
+    def __process(self, docs: list[DocumentSnapshot]) -> int:
+        entries = [self.__entry_from_dict(doc) for doc in docs]
+        errors = list(self.__executor.map(self.__delete, entries))
+        now = self.__now()
+        batch = self.__db.batch()
+        for doc, entry, error in zip(docs, entries, errors):
+            if error is None:
+                batch.delete(doc.reference)
+                continue
+            entry.attempts += 1
+            entry.error = error
+            if entry.attempts >= self.MAX_ATTEMPTS:
+                log.error("Giving up deleting blob %s after %d attempts: %s", entry.path, entry.attempts, error)
+                batch.set(self.__dead_letters().document(doc.id), dict(entry))
+                batch.delete(doc.reference)
+                continue
+            delay = min(self.RETRY_DELAY_MS * 2 ** (entry.attempts - 1), self.MAX_RETRY_DELAY_MS)
+            entry.next_attempt_at = now + delay
+            log.warning("Deleting blob %s failed (attempt %d): %s", entry.path, entry.attempts, error)
+            batch.set(doc.reference, dict(entry))
+        batch.commit()
+        return sum(1 for error in errors if error is None)
+
+    def __delete(self, entry: BlobDeletion) -> str | None:
+        """Deletes the blob of an entry, returns the error if it failed."""
+        try:
+            if (
+                entry.content_hash
+                and self.__is_referenced
+                and self.__is_referenced(entry.content_hash, entry.created_at)
+            ):
+                log.info("Keeping blob %s, it is in use again", entry.path)
+                return None
+            self.__bucket().blob(entry.path).delete()
+        except NotFound:
+            pass
+        except Exception as err:
+            return str(err)
+        return None
+
+    def __schedule_drain(self) -> None:
+        # Coalesces the enqueues made while a drain is waiting to run.
+        if not self.__drain_pending.is_set():
+            self.__drain_pending.set()
+            self.__drainer.submit(self.drain)
+
+    def __entry_from_dict(self, doc: DocumentSnapshot) -> BlobDeletion:
+        data = doc.to_dict()
+        if data is None:
+            raise ValueError("Document data is None")
+        return BlobDeletion(
+            data["path"],
+            data.get("content_hash", ""),
+            data.get("attempts", 0),
+            data.get("next_attempt_at", 0),
+            data.get("created_at", 0),
+            data.get("error", ""),
+        )
+
+    def __doc_id(self, path: str) -> str:
+        # Document IDs cannot contain slashes; one entry per blob.
+        return path.replace("/", ":")
+
+    def __now(self) -> int:
+        return int(datetime.now().timestamp() * 1000)
+
+    def __queue(self):
+        return self.__db.collection("blob_deletions")
+
+    def __dead_letters(self):
+        return self.__db.collection("blob_deletions_dead")
@@ -0,0 +1,302 @@
+"""
+Pushes the changes of a household's products and shopping list to its
+connected members, so they do not have to poll /list_products and
+/get_shopping_list.
+
+There is one Firestore snapshot listener per source (products, shopping
+list) and household with subscribers, shared by all of them. It is stopped
+when the last subscriber leaves. Every subscriber has a bounded buffer of
+pending events; a subscriber that falls behind is closed and has to reload
+(the "resync" event), instead of slowing down the others.
+
+A subscriber is ready once the listeners delivered their first snapshot.
+Clients load the lists after the "ready" event, so no change falls between
+the loaded lists and the events.
+"""
+
+from collections import deque
+from datetime import datetime
+import json
+import threading
+from typing import Any, Callable, Dict, Iterator
+
+from absl import logging as log
+from google.api_core.datetime_helpers import DatetimeWithNanoseconds
+
+import metrics
+
+_subscribers = metrics.change_feed_subscribers.labels()
+_listeners = metrics.change_feed_listeners.labels()
+
+
+# Sent when there were no events for a while, so proxies keep the connection
+# open and disconnected clients are noticed.
+SSE_HEARTBEAT = ": heartbeat\n\n"
+
+
+def sse_message(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
+
+
+def format_read_time(read_time: datetime) -> str:
+    if isinstance(read_time, DatetimeWithNanoseconds):
+        return read_time.rfc3339()
+    return read_time.isoformat()
+
+
+class TooManySubscribersException(Exception):
+    """Raised when a subscription would exceed the connection limits."""
+
+
+def ready_message(subscription: "Subscription") -> Dict[str, Any]:
+    return {"household_id": subscription.household_id, "read_time": subscription.read_time}
+
+
+class ChangeSource:
+    def __init__(self, query: Callable[[str], Any], to_json: Callable[[Any], Dict[str, Any]]) -> None:
+        # Returns the query of a household's documents.
+        self.query = query
+        # Converts a document snapshot to the JSON sent to clients.
+        self.to_json = to_json
+
+
+class ChangeEvent:
+    def __init__(self, source: str, change: str, id: str, data: Dict[str, Any] | None = None) -> None:
+        # Name of the ChangeSource, e.g. "product".
+        self.source = source
+        # "added", "modified" or "removed".
+        self.change = change
+        self.id = id
+        # None for removed documents.
+        self.data = data
+
+    def __iter__(self):
+        yield "source", self.source
+        yield "change", self.change
+        yield "id", self.id
+        yield "data", self.data
+
+
+class Subscription:
+    def __init__(
+        self, household_id: str, uid: str, max_pending: int, notify: Callable[[], Any] | None = None
+    ) -> None:
+        self.household_id = household_id
+        self.uid = uid
+        self.__max_pending = max_pending
+        # Called after events were added, e.g. to wake up an asyncio task.
+        self.__notify = notify
+        self.__events: deque[ChangeEvent] = deque()
+        self.__condition = threading.Condition()
+        self.__closed = False
+        self.overflowed = False
+        # RFC 3339 time of the snapshot the subscriber was ready at, None
+        # until then.
+        self.__read_time: str | None = None
+
+    @property
+    def closed(self) -> bool:
+        return self.__closed
+
+    @property
+    def read_time(self) -> str | None:
+        return self.__read_time
+
+    def wait_ready(self, timeout: float) -> bool:
+        """Waits up to timeout seconds for the subscription to be ready."""
+        with self.__condition:
+            self.__condition.wait_for(lambda: self.__read_time is not None or self.__closed, timeout)
+            return self.__read_time is not None
+
+    def get(self, timeout: float) -> list[ChangeEvent]:
+        """Returns the pending events, waiting up to timeout seconds for some."""
+        with self.__condition:
+            self.__condition.wait_for(lambda: self.__events or self.__closed, timeout)
+            return self.__drain()
+
+    def poll(self) -> list[ChangeEvent]:
+        """Returns the pending events without waiting."""
+        with self.__condition:
+            return self.__drain()
+
+    def _publish(self, events: list[ChangeEvent]) -> None:
+        with self.__condition:
+            if self.__closed:
+                return
+            if len(self.__events) + len(events) > self.__max_pending:
+                self.overflowed = True
+                self.__closed = True
+                self.__events.clear()
+            else:
+                self.__events.extend(events)
+            self.__condition.notify_all()
+        if self.__notify is not None:
+            self.__notify()
+
+    def _ready(self, read_time: str) -> None:
+        with self.__condition:
+            if self.__read_time is not None:
+                return
+            self.__read_time = read_time
+            self.__condition.notify_all()
+        if self.__notify is not None:
+            self.__notify()
+
+    def _close(self) -> None:
+        with self.__condition:
+            self.__closed = True
+            self.__condition.notify_all()
+        if self.__notify is not None:
+            self.__notify()
+
+    def __drain(self) -> list[ChangeEvent]:
+        events = list(self.__events)
+        self.__events.clear()
+        return events
+
+
+class HouseholdListeners:
+    """The snapshot listeners of a household's sources."""
+
+    def __init__(self, source_names: list[str]) -> None:
+        self.watches: list[Any] = []
+        # Set once the watches are stopped.
+        self.stopped = threading.Event()
+        # Sources that did not deliver their first snapshot yet.
+        self.unsynced = set(source_names)
+        # Time of the last snapshot.
+        self.read_time: datetime | None = None
+
+    @property
+    def synced(self) -> bool:
+        return not self.unsynced
+
+
+class HouseholdChangeFeed:
+    def __init__(
+        self,
+        sources: Dict[str, ChangeSource],
+        max_subscribers: int = 200,
+        max_subscribers_per_user: int = 5,
+        max_pending: int = 1000,
+    ) -> None:
+        self.__sources = sources
+        self.__max_subscribers = max_subscribers
+        self.__max_subscribers_per_user = max_subscribers_per_user
+        self.__max_pending = max_pending
+        self.__lock = threading.Lock()
+        # household ID -> its subscribers, and the listeners of its sources.
+        self.__subscribers: Dict[str, list[Subscription]] = {}
+        self.__listeners: Dict[str, HouseholdListeners] = {}
+
+    def subscribe(
+        self, household_id: str, uid: str, notify: Callable[[], Any] | None = None
+    ) -> Subscription:
+        """
+        Subscribes to the changes of a household, starting its listeners if it
+        has no other subscribers. The subscription is ready once they have
+        their first snapshots. Raises TooManySubscribersException.
+        """
+        subscription = Subscription(household_id, uid, self.__max_pending, notify)
+        with self.__lock:
+            subscriptions = [s for subs in self.__subscribers.values() for s in subs]
+            if len(subscriptions) >= self.__max_subscribers:
+                raise TooManySubscribersException("Too many change feed subscribers")
+            if sum(1 for s in subscriptions if s.uid == uid) >= self.__max_subscribers_per_user:
+                raise TooManySubscribersException(f"Too many change feed subscriptions of {uid}")
+            self.__subscribers.setdefault(household_id, []).append(subscription)
+            listeners = self.__listeners.get(household_id)
+            if listeners is None:
+                listeners = HouseholdListeners(list(self.__sources))
+                self.__listeners[household_id] = listeners
+                listeners.watches = [
+                    source.query(household_id).on_snapshot(
+                        self.__callback(household_id, name, listeners)
+                    )
+                    for name, source in self.__sources.items()
+                ]
+                _listeners.inc()
+                log.info("[%s] Started change feed listeners", household_id)
+            read_time = listeners.read_time if listeners.synced else None
+        _subscribers.inc()
+        if read_time is not None:
+            subscription._ready(format_read_time(read_time))
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        """Ends a subscription, stopping the household's listeners if it was the last one."""
+        subscription._close()
+        with self.__lock:
+            subscriptions = self.__subscribers.get(subscription.household_id, [])
+            if subscription not in subscriptions:
+                return
+            subscriptions.remove(subscription)
+            _subscribers.dec()
+            if subscriptions:
+                return
+            del self.__subscribers[subscription.household_id]
+            listeners = self.__listeners.pop(subscription.household_id)
+            listeners.stopped.set()
+        for watch in listeners.watches:
+            watch.unsubscribe()
+        _listeners.dec()
+        log.info("[%s] Stopped change feed listeners", subscription.household_id)
+
+    def stream(self, subscription: Subscription, heartbeat_s: float) -> Iterator[str]:
+        """
+        The server-sent events of a subscription: "ready" with the read time
+        of the snapshot it starts at, then a "change" per event, and "resync"
+        if the subscriber fell behind. Ends the subscription when the client
+        disconnects.
+        """
+        try:
+            while not subscription.closed and not subscription.wait_ready(heartbeat_s):
+                yield SSE_HEARTBEAT
+            if subscription.read_time is not None:
+                yield sse_message("ready", ready_message(subscription))
+            while not subscription.closed:
+                events = subscription.get(heartbeat_s)
+                if not events:
+                    yield SSE_HEARTBEAT
+                for event in events:
+                    yield sse_message("change", dict(event))
+            if subscription.overflowed:
+                yield sse_message("resync", {"household_id": subscription.household_id})
+        finally:
+            self.unsubscribe(subscription)
+
+    def num_subscribers(self) -> int:
+        with self.__lock:
+            return sum(len(subs) for subs in self.__subscribers.values())
+
+    def __callback(self, household_id: str, source_name: str, listeners: HouseholdListeners) -> Callable:
+        source = self.__sources[source_name]
+
+        def on_snapshot(docs: list, changes: list, read_time: datetime) -> None:
+            # Snapshots may still arrive after unsubscribing, they must not
+            # reach the subscribers of newer listeners.
+            if listeners.stopped.is_set():
+                return
+            with self.__lock:
+                initial = source_name in listeners.unsynced
+                listeners.unsynced.discard(source_name)
+                listeners.read_time = read_time
+                subscriptions = list(self.__subscribers.get(household_id, []))
+            # The first snapshot has all documents, the subscribers load them
+            # once all sources have theirs.
+            if initial:
+                if listeners.synced:
+                    for subscription in subscriptions:
+                        subscription._ready(format_read_time(read_time))
+                return
+            events = [self.__event(source_name, source, change) for change in changes]
+            for subscription in subscriptions:
+                subscription._publish(events)
+
+        return on_snapshot
+
+    def __event(self, source_name: str, source: ChangeSource, change: Any) -> ChangeEvent:
+        kind = change.type.name.lower()
+        if kind == "removed":
+            return ChangeEvent(source_name, kind, change.document.id)
+        return ChangeEvent(source_name, kind, change.document.id, source.to_json(change.document))
@@ -0,0 +1,47 @@
+"""
+Runs independent backend calls of a request concurrently on a shared, bounded
+thread pool. Calls run in a copy of the caller's context, so context
+variables (like the request stats) are visible to them.
+"""
+
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+import contextvars
+import threading
+from typing import Any, Callable, TypeVar
+
+from config import fanout_workers
+
+T = TypeVar("T")
+
+_executor = ThreadPoolExecutor(max_workers=fanout_workers, thread_name_prefix="fanout")
+_local = threading.local()
+
+
+def submit(func: Callable[..., T], *args, **kwargs) -> Future:
+    context = contextvars.copy_context()
+    return _executor.submit(context.run, _run_in_worker, func, *args, **kwargs)
+
+
+def gather(*calls: Callable[[], Any]) -> list[Any]:
+    """
+    Runs the calls concurrently and returns their results in order. The last
+    call runs on the calling thread. If a call raises, the exception is
+    re-raised once all calls are done.
+
+    Calls made from a pool thread run sequentially, so nested fan-outs cannot
+    exhaust the pool and deadlock.
+    """
+    if len(calls) < 2 or getattr(_local, "in_worker", False):
+        return [call() for call in calls]
+    futures = [submit(call) for call in calls[:-1]]
+    try:
+        last = calls[-1]()
+    finally:
+        # Wait for all calls, even if the inline one failed.
+        wait(futures)
+    return [future.result() for future in futures] + [last]
+
+
+def _run_in_worker(func: Callable[..., T], *args, **kwargs) -> T:
+    _local.in_worker = True
+    return func(*args, **kwargs)
@@ -1,4 +1,67 @@
+import os
 import pytz
 
 
 pt_timezone = pytz.timezone('US/Pacific')
+
+# Pending household invitations expire after this many days.
+invitation_ttl_days = int(os.environ.get("INVITATION_TTL_DAYS", "14"))
+
+# Wasted and used products are moved to the archive after this many days.
+archive_after_days = int(os.environ.get("ARCHIVE_AFTER_DAYS", "30"))
+
+# Document store used by the managers: "firestore", or "memory"/"sqlite" to run
+# without Google credentials (see local_store.py).
+storage_backend = os.environ.get("STORAGE_BACKEND", "firestore")
+local_storage_path = os.environ.get("LOCAL_STORAGE_PATH", "local_store.db")
+# Simulated round-trip time of every local document store call.
+local_storage_latency_ms = float(os.environ.get("LOCAL_STORAGE_LATENCY_MS", "0"))
+
+# Bearer token required to read /metrics. If empty, /metrics is disabled unless
+# METRICS_PUBLIC is set to "true", e.g. when it is only reachable internally.
+metrics_token = os.environ.get("METRICS_TOKEN", "")
+metrics_public = os.environ.get("METRICS_PUBLIC", "false").lower() == "true"
+
+# Request profiling (see profiling.py): profile every Nth request with cProfile
+# and/or capture the stacks of requests slower than PROFILE_SLOW_MS. 0 disables.
+profile_sample_every = int(os.environ.get("PROFILE_SAMPLE_EVERY", "0"))
+profile_slow_ms = float(os.environ.get("PROFILE_SLOW_MS", "0"))
+
+# Comma separated user IDs allowed to use the /admin endpoints.
+admin_uids = {uid.strip() for uid in os.environ.get("ADMIN_UIDS", "").split(",") if uid.strip()}
+
+# Size of the thread pool used to run independent backend calls of a request
+# concurrently (see concurrency.py).
+fanout_workers = int(os.environ.get("FANOUT_WORKERS", "16"))
+# Sub-requests of /batch requests handled at the same time.
+batch_workers = int(os.environ.get("BATCH_WORKERS", "16"))
+
+# Household change feed (see change_feed.py): maximum number of connected
+# clients, in total and per user, and the interval of the keep-alive comments.
+change_feed_max_subscribers = int(os.environ.get("CHANGE_FEED_MAX_SUBSCRIBERS", "200"))
+change_feed_max_subscribers_per_user = int(os.environ.get("CHANGE_FEED_MAX_SUBSCRIBERS_PER_USER", "5"))
+change_feed_heartbeat_s = float(os.environ.get("CHANGE_FEED_HEARTBEAT_SECONDS", "15"))
+# Streams served by the threaded Flask app hold a worker thread each, keep
+# this well below the number of threads (gunicorn --threads, 4 in the
+# Dockerfile). 0 refuses the streams there; the async serving mode is not
+# limited by it.
+change_feed_max_threaded_streams = int(os.environ.get("CHANGE_FEED_MAX_THREADED_STREAMS", "1"))
+
+# Thread pool of the async serving mode (see async_app.py), running Firebase
+# Auth calls and the requests delegated to the Flask app.
+async_blocking_workers = int(os.environ.get("ASYNC_BLOCKING_WORKERS", "64"))
+
+# Uploaded product images (see image_processing.py): longest side in pixels of
+# the stored image and its thumbnail, output format (webp or jpeg), encoder
+# quality and the number of images processed in parallel.
+image_max_size = int(os.environ.get("IMAGE_MAX_SIZE", "1600"))
+image_thumbnail_size = int(os.environ.get("IMAGE_THUMBNAIL_SIZE", "320"))
+image_format = os.environ.get("IMAGE_FORMAT", "webp")
+image_quality = int(os.environ.get("IMAGE_QUALITY", "80"))
+image_workers = int(os.environ.get("IMAGE_WORKERS", "2"))
+# Uploaded images no product uses are deleted once they are this old.
+orphan_image_grace_hours = float(os.environ.get("ORPHAN_IMAGE_GRACE_HOURS", "24"))
+# Direct-to-storage image uploads: maximum size of the original image and how
+# long a signed upload URL stays valid.
+image_upload_max_bytes = int(os.environ.get("IMAGE_UPLOAD_MAX_BYTES", str(20 * 1024 * 1024)))
+image_upload_url_ttl_s = int(os.environ.get("IMAGE_UPLOAD_URL_TTL_SECONDS", "900"))
@@ -0,0 +1,321 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import threading
+import uuid
+from typing import Callable, Dict
+
+from absl import logging as log
+from google.api_core.exceptions import FailedPrecondition, NotFound
+from google.cloud.firestore_v1 import ArrayRemove, DocumentSnapshot, Query
+from google.cloud.firestore_v1.base_query import FieldFilter
+
+
+class DeletionJob:
+    def __init__(
+        self,
+        id: str,
+        kind: str,
+        target_id: str,
+        uid: str,
+        email: str = "",
+        status: str = "pending",
+        deleted: Dict[str, int] | None = None,
+        created_at: int | None = None,
+        updated_at: int | None = None,
+        error: str = "",
+        attempts: int = 0,
+    ) -> None:
+        self.id = id
+        # Either "household" (target_id is the household ID) or "account"
+        # (target_id is the user ID).
+        self.kind = kind
+        self.target_id = target_id
+        self.uid = uid
+        self.email = email
+        # "pending", "running", "done" or "failed" (gave up after MAX_ATTEMPTS).
+        self.status = status
+        # Number of deleted documents (or blobs) per collection.
+        self.deleted = deleted if deleted is not None else {}
+        self.created_at = created_at
+        self.updated_at = updated_at
+        self.error = error
+        # Number of times the job was started.
+        self.attempts = attempts
+
+    def __iter__(self):
+        yield "kind", self.kind
+        yield "target_id", self.target_id
+        yield "uid", self.uid
+        yield "email", self.email
+        yield "status", self.status
+        yield "deleted", self.deleted
+        yield "created_at", self.created_at
+        yield "updated_at", self.updated_at
+        yield "error", self.error
+        yield "attempts", self.attempts
+
+
+class DeletionManager:
+    """
+    Deletes everything that belongs to a household or an account in the
+    background: products (and their images), archived products, shopping list
+    items, invitations and the user document. Documents are removed in batches
+    of BATCH_LIMIT. Progress is stored in the deletion_jobs collection, and
+    since every step deletes whatever its query still finds, an interrupted job
+    can simply be run again (see resume_stale_jobs()).
+    """
+
+    BATCH_LIMIT = 500
+    # Jobs that have not made progress for this long are considered abandoned.
+    STALE_AFTER_MS = 5 * 60 * 1000
+    # Jobs are marked "failed" instead of being resumed after this many starts.
+    MAX_ATTEMPTS = 5
+
+    def __init__(
+        self,
+        firestore,
+        delete_image: Callable[[str], bool],
+        max_blob_workers: int = 8,
+    ) -> None:
+        self.__db = firestore
+        self.__delete_image = delete_image
+        self.__job_executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="deletion-job"
+        )
+        self.__blob_executor = ThreadPoolExecutor(
+            max_workers=max_blob_workers, thread_name_prefix="deletion-blob"
+        )
+        # IDs of the jobs submitted by this instance that did not finish yet.
+        # They may wait long enough behind another job to look stale.
+        self.__active_jobs: set[str] = set()
+        self.__active_lock = threading.Lock()
+
+    def start_household_cleanup(self, household_id: str, uid: str) -> DeletionJob | None:
+        """Deletes the data of an already deleted household in the background."""
+        if household_id is None or household_id.isspace():
+            log.error("start_household_cleanup(): household_id must not be empty")
+            return None
+        return self.__start(DeletionJob(str(uuid.uuid4()), "household", household_id, uid))
+
+    def start_account_cleanup(self, uid: str, email: str) -> DeletionJob | None:
+        """
+        Deletes the owned households (with all their data), the memberships,
+        invitations and the user document of an account in the background.
+        """
+        if uid is None or uid.isspace():
+            log.error("start_account_cleanup(): uid must not be empty")
+            return None
+        return self.__start(DeletionJob(str(uuid.uuid4()), "account", uid, uid, email))
+
+    def get_job(self, id: str) -> DeletionJob | None:
+        if id is None or id.isspace():
+            log.error("get_job(): id must not be empty")
+            return None
+        try:
+            doc = self.__jobs_collection().document(id).get()
+            if not doc.exists:
+                return None
+            return self.__job_from_dict(doc)
+        except Exception as err:
+            log.error("[%s] Unable to fetch deletion job, %s", id, err)
+            return None
+
+    def resume_stale_jobs(self) -> int:
+        """
+        Restarts unfinished jobs that stopped making progress, e.g. after a
+        restart. Each job is claimed with a conditional write first, so only
+        one instance resumes it. Jobs that were started MAX_ATTEMPTS times are
+        marked "failed" instead.
+        """
+        stale_before = self.__now() - self.STALE_AFTER_MS
+        resumed = 0
+        try:
+            query: Query = self.__jobs_collection().where(
+                filter=FieldFilter("status", "in", ["pending", "running"])
+            )
+            for doc in query.stream():
+                job = self.__job_from_dict(doc)
+                if (job.updated_at or 0) >= stale_before or self.__is_active(job.id):
+                    continue
+                if job.attempts >= self.MAX_ATTEMPTS:
+                    log.error("[%s] Giving up deletion job after %d attempts", job.id, job.attempts)
+                    self.__claim(doc, job, "failed")
+                elif self.__claim(doc, job, job.status):
+                    log.info("[%s] Resuming %s deletion job", job.id, job.kind)
+                    self.__submit(job)
+                    resumed += 1
+        except Exception as err:
+            log.error("resume_stale_jobs(): Unable to resume deletion jobs: %s", err)
+        return resumed
+
+    def __claim(self, doc: DocumentSnapshot, job: DeletionJob, status: str) -> bool:
+        """
+        Sets the status of a job read as doc, unless it was written since.
+        Returns False if another instance got there first.
+        """
+        job.status = status
+        job.updated_at = self.__now()
+        try:
+            doc.reference.update(
+                {"status": job.status, "updated_at": job.updated_at},
+                option=self.__db.write_option(last_update_time=doc.update_time),
+            )
+        except (FailedPrecondition, NotFound):
+            log.info("[%s] Deletion job was claimed by another instance", job.id)
+            return False
+        return True
+
+    def __start(self, job: DeletionJob) -> DeletionJob | None:
+        job.created_at = job.created_at or self.__now()
+        if not self.__save(job):
+            return None
+        self.__submit(job)
+        return job
+
+    def __submit(self, job: DeletionJob) -> None:
+        with self.__active_lock:
+            self.__active_jobs.add(job.id)
+        self.__job_executor.submit(self.__run, job)
+
+    def __is_active(self, id: str) -> bool:
+        with self.__active_lock:
+            return id in self.__active_jobs
+
+    def __run(self, job: DeletionJob) -> None:
+        try:
+            self.__execute(job)
+        finally:
+            with self.__active_lock:
+                self.__active_jobs.discard(job.id)
+
+    def __execute(self, job: DeletionJob) -> None:
+        job.status = "running"
+        job.attempts += 1
+        self.__save(job)
+        try:
+            if job.kind == "household":
+                self.__delete_household_data(job, job.target_id)
+            else:
+                self.__delete_account_data(job)
+            job.status = "done"
+            log.info("[%s] Deletion job finished: %s", job.id, job.deleted)
+        except Exception as err:
+            # Keep the job "running" so it gets resumed once it is stale.
+            job.error = str(err)
+            log.error("[%s] Deletion job failed (attempt %d): %s", job.id, job.attempts, err)
+        self.__save(job)
+
+    def __delete_household_data(self, job: DeletionJob, household_id: str) -> None:
+        for name in ("products", "products_archive"):
+            self.__delete_query(
+                job,
+                name,
+                self.__db.collection(name)
+                .where(filter=FieldFilter("household_id", "==", household_id))
+                .select(["image_url"]),
+                self.__delete_images,
+            )
+        for name in ("shopping_list", "household_invitations"):
+            self.__delete_query(
+                job,
+                name,
+                self.__db.collection(name).where(
+                    filter=FieldFilter("household_id", "==", household_id)
+                ),
+            )
+
+    def __delete_account_data(self, job: DeletionJob) -> None:
+        uid = job.target_id
+        # Delete each owned household only after its data, so an interrupted
+        # job still finds it.
+        owned: Query = self.__db.collection("households").where(
+            filter=FieldFilter("owner_uid", "==", uid)
+        )
+        for household in owned.stream():
+            self.__delete_household_data(job, household.id)
+            household.reference.delete()
+            self.__count(job, "households", 1)
+
+        member_of: Query = self.__db.collection("households").where(
+            filter=FieldFilter("participants", "array_contains", uid)
+        )
+        for household in member_of.stream():
+            household.reference.update({"participants": ArrayRemove([uid])})
+
+        if job.email:
+            self.__delete_query(
+                job,
+                "household_invitations",
+                self.__db.collection("household_invitations").where(
+                    filter=FieldFilter("invitee_email", "==", job.email)
+                ),
+            )
+        self.__db.collection("users").document(uid).delete()
+        self.__count(job, "users", 1)
+
+    def __delete_query(
+        self,
+        job: DeletionJob,
+        name: str,
+        query: Query,
+        before_delete: Callable[[DeletionJob, list[DocumentSnapshot]], None] | None = None,
+    ) -> None:
+        """Deletes all documents matching the query, one batch at a time."""
+        while True:
+            docs = list(query.limit(self.BATCH_LIMIT).stream())
+            if not docs:
+                return
+            if before_delete is not None:
+                before_delete(job, docs)
+            batch = self.__db.batch()
+            for doc in docs:
+                batch.delete(doc.reference)
+            batch.commit()
+            self.__count(job, name, len(docs))
+
+    def __delete_images(self, job: DeletionJob, docs: list[DocumentSnapshot]) -> None:
+        image_urls = [
+            url for url in ((doc.to_dict() or {}).get("image_url") for doc in docs) if url
+        ]
+        if not image_urls:
+            return
+        # Storage deletes are independent round-trips, so run them concurrently.
+        results = list(self.__blob_executor.map(self.__delete_image, image_urls))
+        self.__count(job, "product_images", sum(1 for ok in results if ok))
+
+    def __count(self, job: DeletionJob, name: str, num: int) -> None:
+        job.deleted[name] = job.deleted.get(name, 0) + num
+        self.__save(job)
+
+    def __save(self, job: DeletionJob) -> bool:
+        job.updated_at = self.__now()
+        try:
+            self.__jobs_collection().document(job.id).set(dict(job))
+        except Exception as err:
+            log.error("[%s] Unable to store deletion job: %s", job.id, err)
+            return False
+        return True
+
+    def __now(self) -> int:
+        return int(datetime.now().timestamp() * 1000)
+
+    def __jobs_collection(self):
+        return self.__db.collection("deletion_jobs")
+
+    def __job_from_dict(self, doc: DocumentSnapshot) -> DeletionJob:
+        data = doc.to_dict()
+        if data is None:
+            raise ValueError("Document data is None")
+        return DeletionJob(
+            doc.id,
+            data["kind"],
+            data["target_id"],
+            data["uid"],
+            data.get("email", ""),
+            data.get("status", "pending"),
+            data.get("deleted", {}),
+            data.get("created_at"),
+            data.get("updated_at"),
+            data.get("error", ""),
+            data.get("attempts", 0),
+        )
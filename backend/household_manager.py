@@ -1,9 +1,24 @@
 from absl import logging as log
-from google.cloud.firestore_v1 import Query, DocumentSnapshot
+from collections import OrderedDict
+from google.api_core.exceptions import FailedPrecondition, NotFound
+from google.cloud.firestore_v1 import ArrayRemove, ArrayUnion, Query, DocumentSnapshot
 from google.cloud.firestore_v1.base_query import FieldFilter
+import threading
+import time
 import uuid
 from datetime import datetime
 
+import concurrency
+import metrics
+import request_cache
+
+_membership_hits = metrics.cache_lookups.labels("household_membership", "hit")
+_membership_misses = metrics.cache_lookups.labels("household_membership", "miss")
+
+
+class HouseholdNotFoundException(Exception):
+    """Raised when a household to be updated does not exist."""
+
 
 class Household:
     def __init__(
@@ -48,6 +63,9 @@ class Invitation:
         invitee_email: str,
         status: str = "pending",
         created_at: int | None = None,
+        inviter_name: str = "",
+        expires_at: int | None = None,
+        update_time: datetime | None = None,
     ) -> None:
         self.id = id
         self.household_id = household_id
@@ -56,6 +74,13 @@ class Invitation:
         self.invitee_email = invitee_email
         self.status = status
         self.created_at = created_at
+        # Display name of the inviter when the invitation was created, so
+        # listing invitations needs no user lookups. Empty for old invitations.
+        self.inviter_name = inviter_name
+        # Seconds since the epoch, like created_at. None for old invitations.
+        self.expires_at = expires_at
+        # Not persisted, the update time of the document it was read from.
+        self.update_time = update_time
 
     def __iter__(self):
         yield "household_id", self.household_id
@@ -64,11 +89,30 @@ class Invitation:
         yield "invitee_email", self.invitee_email
         yield "status", self.status
         yield "created_at", self.created_at
+        yield "inviter_name", self.inviter_name
+        yield "expires_at", self.expires_at
+
+    def is_expired(self, now: int, ttl_s: int) -> bool:
+        expires_at = self.expires_at
+        if expires_at is None:
+            expires_at = (self.created_at or now) + ttl_s
+        return expires_at <= now
 
 
 class HouseholdManager:
-    def __init__(self, firestore) -> None:
+    # How long a positive membership check is trusted. Members are only
+    # removed when their account or the household is deleted.
+    MEMBERSHIP_TTL_S = 60
+    MAX_CACHED_MEMBERSHIPS = 4096
+    SWEEP_BATCH_SIZE = 500
+
+    def __init__(self, firestore, invitation_ttl_s: int = 14 * 24 * 60 * 60) -> None:
         self.__db = firestore
+        # Pending invitations expire after this long, see sweep_invitations().
+        self.__invitation_ttl_s = invitation_ttl_s
+        self.__memberships_lock = threading.Lock()
+        # (uid, household ID) -> check time, least recently used first.
+        self.__memberships: OrderedDict[tuple[str, str], float] = OrderedDict()
 
     def user_has_household(self, uid: str, household_id: str) -> bool:
         household = self.get_household(household_id)
@@ -76,16 +120,42 @@ class HouseholdManager:
             return False
         return uid in household.participants
 
+    def is_member(self, uid: str, household_id: str) -> bool:
+        """
+        Like user_has_household(), but remembers positive answers for
+        MEMBERSHIP_TTL_S so repeated edits of a household skip the read.
+        """
+        key = (uid, household_id)
+        with self.__memberships_lock:
+            checked_at = self.__memberships.get(key)
+            if checked_at is not None and time.monotonic() - checked_at < self.MEMBERSHIP_TTL_S:
+                self.__memberships.move_to_end(key)
+                _membership_hits.inc()
+                return True
+        _membership_misses.inc()
+        if not self.user_has_household(uid, household_id):
+            return False
+        with self.__memberships_lock:
+            self.__memberships[key] = time.monotonic()
+            self.__memberships.move_to_end(key)
+            while len(self.__memberships) > self.MAX_CACHED_MEMBERSHIPS:
+                self.__memberships.popitem(last=False)
+        return True
+
     def get_household(self, id: str) -> Household | None:
         if id is None or id.isspace():
             log.error("get_household(): id must not be empty")
             return None
+        # The membership check and the route often read the same household.
+        return request_cache.memoize(("household", id), lambda: self.__fetch_household(id))
+
+    def __fetch_household(self, id: str) -> Household | None:
         try:
             data = self.__collection().document(id).get()
             if data is None:
                 log.error("[%s] Cannot find household", id)
                 return None
-            return self.__household_from_dict(data)
+            return self.household_from_dict(data)
         except Exception as err:
             log.error("[%s] Unable to fetch household data, %s", id, err)
             return None
@@ -95,23 +165,28 @@ class HouseholdManager:
             log.error("get_households_for_user(): uid must not be empty")
             return []
         try:
-            found_household_ids = []
-            results = []
-            # Add the household where the user is an owner first.
-            query: Query = self.__collection().where(
+            # The households the user owns and the ones the user participates
+            # in, queried concurrently.
+            owned_query: Query = self.__collection().where(
                 filter=FieldFilter("owner_uid", "==", uid)
             )
-            for household in query.stream():
-                results.append(self.__household_from_dict(household))
-                found_household_ids.append(household.id)
-
-            # Next, add the households the user is a participant.
-            query2: Query = self.__collection().where(
+            participant_query: Query = self.__collection().where(
                 filter=FieldFilter("participants", "array_contains", uid)
             )
-            for household in query2.stream():
+            owned, participating = concurrency.gather(
+                lambda: list(owned_query.stream()),
+                lambda: list(participant_query.stream()),
+            )
+
+            # Add the household where the user is an owner first.
+            found_household_ids = set()
+            results = []
+            for household in owned:
+                results.append(self.household_from_dict(household))
+                found_household_ids.add(household.id)
+            for household in participating:
                 if household.id not in found_household_ids:
-                    results.append(self.__household_from_dict(household))
+                    results.append(self.household_from_dict(household))
             return results
         except Exception as err:
             log.error("[%s] Unable to fetch households for user, %s", uid, err)
@@ -125,6 +200,7 @@ class HouseholdManager:
         if not household.name or household.name.isspace():
             log.error("add_or_update_household(): name must be set")
             return False
+        request_cache.discard(("household", hid))
         try:
             d = dict(household)
             self.__collection().document(hid).set(d)
@@ -137,13 +213,53 @@ class HouseholdManager:
         if id is None or id.isspace():
             log.error("delete_household(): id must not be empty")
             return False
+        request_cache.discard(("household", id))
         try:
             self.__collection().document(id).delete()
         except Exception as err:
             log.error("delete_household(): Unable to delete household: %s", err)
             return False
+        self.__forget_memberships(id)
+        return True
+
+    def add_location(self, id: str, location: str) -> bool:
+        return self.__update_list(id, "locations", ArrayUnion([location]))
+
+    def remove_location(self, id: str, location: str) -> bool:
+        return self.__update_list(id, "locations", ArrayRemove([location]))
+
+    def add_category(self, id: str, category: str) -> bool:
+        return self.__update_list(id, "categories", ArrayUnion([category]))
+
+    def remove_category(self, id: str, category: str) -> bool:
+        return self.__update_list(id, "categories", ArrayRemove([category]))
+
+    def __update_list(self, id: str, field: str, change: ArrayUnion | ArrayRemove) -> bool:
+        """
+        Adds or removes a value of one of the household's lists with a single
+        write, so concurrent edits of the list do not overwrite each other.
+        Adding a value that exists or removing one that does not is a no-op.
+        Raises HouseholdNotFoundException.
+        """
+        if id is None or id.isspace():
+            log.error("__update_list(): id must not be empty")
+            return False
+        request_cache.discard(("household", id))
+        try:
+            self.__collection().document(id).update({field: change})
+        except NotFound:
+            self.__forget_memberships(id)
+            raise HouseholdNotFoundException(id)
+        except Exception as err:
+            log.error("[%s] Unable to update household %s: %s", id, field, err)
+            return False
         return True
 
+    def __forget_memberships(self, household_id: str) -> None:
+        with self.__memberships_lock:
+            for key in [key for key in self.__memberships if key[1] == household_id]:
+                del self.__memberships[key]
+
     def num_households(self) -> int:
         try:
             households = self.__collection().get()
@@ -175,7 +291,11 @@ class HouseholdManager:
         return True
 
     def create_invitation(
-        self, household_id: str, inviter_uid: str, invitee_email: str
+        self,
+        household_id: str,
+        inviter_uid: str,
+        invitee_email: str,
+        inviter_name: str = "",
     ) -> Invitation | None:
         # Validate input and household/inviter
         household = self._validate_invitation_inputs(
@@ -193,6 +313,7 @@ class HouseholdManager:
 
         # Create a new invitation
         invitation_id = str(uuid.uuid4())
+        created_at = int(datetime.now().timestamp())
         invitation = Invitation(
             invitation_id,
             household_id,
@@ -200,7 +321,9 @@ class HouseholdManager:
             inviter_uid,
             invitee_email,
             "pending",
-            int(datetime.now().timestamp()),
+            created_at,
+            inviter_name,
+            created_at + self.__invitation_ttl_s,
         )
 
         try:
@@ -240,7 +363,9 @@ class HouseholdManager:
             invitee_email, household_id
         )
         if existing_invitation is not None:
-            if existing_invitation.status == "pending":
+            if existing_invitation.status == "pending" and not existing_invitation.is_expired(
+                int(datetime.now().timestamp()), self.__invitation_ttl_s
+            ):
                 return existing_invitation
             elif existing_invitation.status == "accepted":
                 log.error(
@@ -306,15 +431,26 @@ class HouseholdManager:
                 .where(filter=FieldFilter("status", "==", "pending"))
             )
 
+            now = int(datetime.now().timestamp())
             results = []
-            for invitation in query.stream():
-                results.append(self.__invitation_from_dict(invitation))
+            for doc in query.stream():
+                invitation = self.__invitation_from_dict(doc)
+                # Expired ones are deleted by sweep_invitations().
+                if not invitation.is_expired(now, self.__invitation_ttl_s):
+                    results.append(invitation)
             return results
         except Exception as err:
             log.error("Unable to fetch invitations for email: %s", err)
             return []
 
-    def accept_invitation(self, invitation_id: str, user_id: str) -> bool:
+    def accept_invitation(
+        self, invitation_id: str, user_id: str, invitation: Invitation | None = None
+    ) -> bool:
+        """
+        Marks a pending invitation as accepted and adds the user to the
+        household in a single atomic write. The invitation is read unless the
+        caller already did; the write fails if it was answered since then.
+        """
         if invitation_id is None or invitation_id.isspace():
             log.error("accept_invitation(): invitation_id must not be empty")
             return False
@@ -323,7 +459,8 @@ class HouseholdManager:
             return False
 
         # Get the invitation
-        invitation = self.get_invitation(invitation_id)
+        if invitation is None:
+            invitation = self.get_invitation(invitation_id)
         if invitation is None:
             log.error("accept_invitation(): Invitation not found")
             return False
@@ -332,21 +469,39 @@ class HouseholdManager:
         if invitation.status != "pending":
             log.error("accept_invitation(): Invitation is not pending")
             return False
+        if invitation.is_expired(int(datetime.now().timestamp()), self.__invitation_ttl_s):
+            log.error("accept_invitation(): Invitation has expired")
+            return False
+
+        return self.__commit_acceptance(invitation_id, invitation, user_id)
 
-        # Update the invitation status to accepted
+    def __commit_acceptance(self, invitation_id: str, invitation: Invitation, user_id: str) -> bool:
+        # Update the invitation status and add the user to the household.
+        request_cache.discard(("household", invitation.household_id))
         try:
-            self.__invitations_collection().document(invitation_id).update(
-                {"status": "accepted"}
+            option = (
+                self.__db.write_option(last_update_time=invitation.update_time)
+                if invitation.update_time is not None
+                else None
             )
-
-            # Add the user to the household
-            if not self.add_participant(
-                invitation.household_id, invitation.inviter_uid, user_id
-            ):
-                log.error("accept_invitation(): Failed to add user to household")
-                return False
-
+            batch = self.__db.batch()
+            batch.update(
+                self.__invitations_collection().document(invitation_id),
+                {"status": "accepted"},
+                option=option,
+            )
+            batch.update(
+                self.__collection().document(invitation.household_id),
+                {"participants": ArrayUnion([user_id])},
+            )
+            batch.commit()
             return True
+        except FailedPrecondition:
+            log.error("[%s] Invitation was answered concurrently", invitation_id)
+            return False
+        except NotFound:
+            log.error("[%s] Invitation or household no longer exists", invitation_id)
+            return False
         except Exception as err:
             log.error("[%s] Unable to accept invitation: %s", invitation_id, err)
             return False
@@ -377,13 +532,70 @@ class HouseholdManager:
             log.error("[%s] Unable to reject invitation: %s", invitation_id, err)
             return False
 
+    def sweep_invitations(self) -> int:
+        """
+        Deletes expired and answered invitations, so the collection (and the
+        query for pending invitations) only holds the live ones. Returns the
+        number of deleted invitations.
+        """
+        now = int(datetime.now().timestamp())
+        queries = [
+            self.__invitations_collection().where(filter=FieldFilter("expires_at", "<=", now)),
+            self.__invitations_collection().where(
+                filter=FieldFilter("status", "in", ["accepted", "rejected"])
+            ),
+        ]
+        deleted = 0
+        try:
+            for query in queries:
+                deleted += self.__delete_all(query)
+            deleted += self.__delete_expired_without_expiry(now)
+        except Exception as err:
+            log.error("sweep_invitations(): Unable to delete invitations: %s", err)
+        if deleted:
+            log.info("Deleted %d expired or answered invitations", deleted)
+        return deleted
+
+    def __delete_all(self, query: Query) -> int:
+        deleted = 0
+        while True:
+            docs = list(query.select([]).limit(self.SWEEP_BATCH_SIZE).stream())
+            if not docs:
+                return deleted
+            batch = self.__db.batch()
+            for doc in docs:
+                batch.delete(doc.reference)
+            batch.commit()
+            deleted += len(docs)
+            if len(docs) < self.SWEEP_BATCH_SIZE:
+                return deleted
+
+    def __delete_expired_without_expiry(self, now: int) -> int:
+        # Invitations created before expires_at was stored expire ttl after
+        # their creation.
+        query = self.__invitations_collection().where(
+            filter=FieldFilter("created_at", "<=", now - self.__invitation_ttl_s)
+        )
+        expired = [
+            doc.reference
+            for doc in query.select(["expires_at"]).stream()
+            if (doc.to_dict() or {}).get("expires_at") is None
+        ]
+        for start in range(0, len(expired), self.SWEEP_BATCH_SIZE):
+            batch = self.__db.batch()
+            for reference in expired[start:start + self.SWEEP_BATCH_SIZE]:
+                batch.delete(reference)
+            batch.commit()
+        return len(expired)
+
     def __collection(self):
         return self.__db.collection("households")
 
     def __invitations_collection(self):
         return self.__db.collection("household_invitations")
 
-    def __household_from_dict(self, doc: DocumentSnapshot) -> Household:
+    @staticmethod
+    def household_from_dict(doc: DocumentSnapshot) -> Household:
         data = doc.to_dict()
         if data is None:
             raise ValueError("Document data is None")
@@ -408,4 +620,7 @@ class HouseholdManager:
             data["invitee_email"],
             data["status"],
             data.get("created_at"),
+            data.get("inviter_name", ""),
+            data.get("expires_at"),
+            doc.update_time,
         )
@@ -0,0 +1,126 @@
+"""
+Prepares uploaded product photos for storage: applies the EXIF orientation and
+then drops all metadata (location, camera), bounds the dimensions and
+re-encodes at the configured quality. A small thumbnail is produced alongside
+for list views.
+
+Decoding and encoding are CPU heavy and need a few times the decoded image
+size in memory, so images are processed on a small dedicated pool rather
+than on the request threads. Pillow releases the GIL while doing so.
+"""
+
+from concurrent.futures import Future, ThreadPoolExecutor
+import io
+import math
+
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+# Larger images are rejected instead of decoded (decompression bombs).
+Image.MAX_IMAGE_PIXELS = 50_000_000
+
+_CONTENT_TYPES = {"WEBP": "image/webp", "JPEG": "image/jpeg"}
+_EXTENSIONS = {"WEBP": ".webp", "JPEG": ".jpg"}
+
+
+class InvalidImageException(Exception):
+    """Raised when the uploaded data is not an image that can be processed."""
+
+
+class EncodedImage:
+    def __init__(self, data: bytes, format: str, width: int, height: int) -> None:
+        self.data = data
+        self.format = format
+        self.width = width
+        self.height = height
+
+    @property
+    def content_type(self) -> str:
+        return _CONTENT_TYPES[self.format]
+
+    @property
+    def extension(self) -> str:
+        return _EXTENSIONS[self.format]
+
+
+class ProcessedImage:
+    def __init__(self, image: EncodedImage, thumbnail: EncodedImage, original_size: int) -> None:
+        self.image = image
+        self.thumbnail = thumbnail
+        # Size in bytes of the uploaded file.
+        self.original_size = original_size
+
+
+class ImageProcessor:
+    def __init__(
+        self,
+        max_size: int = 1600,
+        thumbnail_size: int = 320,
+        format: str = "WEBP",
+        quality: int = 80,
+        thumbnail_quality: int = 70,
+        workers: int = 2,
+    ) -> None:
+        format = format.upper()
+        if format == "JPG":
+            format = "JPEG"
+        if format not in _CONTENT_TYPES:
+            raise ValueError(f"Unsupported image format '{format}'")
+        self.__max_size = max_size
+        self.__thumbnail_size = thumbnail_size
+        self.__format = format
+        self.__quality = quality
+        self.__thumbnail_quality = thumbnail_quality
+        self.__executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="images")
+
+    def submit(self, data: bytes) -> Future:
+        """Processes the image on the worker pool; the future's result is a ProcessedImage."""
+        return self.__executor.submit(self.process, data)
+
+    def process(self, data: bytes) -> ProcessedImage:
+        try:
+            with Image.open(io.BytesIO(data)) as original:
+                # Lets JPEGs decode directly at a reduced scale (still at least
+                # max_size), which is several times faster for phone photos.
+                scale = min(1.0, self.__max_size / max(original.size))
+                original.draft(
+                    "RGB", (math.ceil(original.width * scale), math.ceil(original.height * scale))
+                )
+                # Rotate the pixels as the camera meant to, the orientation tag
+                # is dropped with the rest of the metadata.
+                image = ImageOps.exif_transpose(original)
+                image.load()
+        except (UnidentifiedImageError, Image.DecompressionBombError, OSError) as err:
+            raise InvalidImageException(str(err)) from err
+
+        image = self.__to_rgb(image)
+        image.thumbnail((self.__max_size, self.__max_size), Image.Resampling.LANCZOS)
+        encoded = self.__encode(image, self.__quality)
+        # Downscale from the already reduced image, it is much faster.
+        image.thumbnail((self.__thumbnail_size, self.__thumbnail_size), Image.Resampling.LANCZOS)
+        thumbnail = self.__encode(image, self.__thumbnail_quality)
+        return ProcessedImage(encoded, thumbnail, len(data))
+
+    def __to_rgb(self, image: Image.Image) -> Image.Image:
+        if image.mode == "RGB":
+            return image
+        if image.mode in ("RGBA", "LA", "P") and self.__format == "JPEG":
+            # JPEG has no alpha channel, flatten onto white.
+            rgba = image.convert("RGBA")
+            background = Image.new("RGB", rgba.size, (255, 255, 255))
+            background.paste(rgba, mask=rgba.getchannel("A"))
+            return background
+        if image.mode in ("RGBA", "LA", "P"):
+            return image.convert("RGBA")
+        return image.convert("RGB")
+
+    def __encode(self, image: Image.Image, quality: int) -> EncodedImage:
+        out = io.BytesIO()
+        # Only the color profile is kept, EXIF and XMP are not written.
+        icc_profile = image.info.get("icc_profile")
+        if self.__format == "JPEG":
+            image.save(
+                out, "JPEG", quality=quality, optimize=True, progressive=True, icc_profile=icc_profile
+            )
+        else:
+            image.save(out, "WEBP", quality=quality, method=4, icc_profile=icc_profile)
+        return EncodedImage(out.getvalue(), self.__format, image.width, image.height)
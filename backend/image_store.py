@@ -0,0 +1,336 @@
+"""
+Content-addressed storage of product images. Processed images are stored as
+product_images/<sha256 of the bytes><ext> (and their thumbnail under
+product_images/thumbnails/), so uploading the same photo again, or using it
+for several products, stores it once and skips the upload.
+
+The number of products referencing each image is kept in the product_images
+collection (one document per hash). Products take a reference when their
+image_url is set and release it when it changes or the product is deleted;
+the blobs are queued for deletion (see blob_deletion_queue.py) with the last
+reference. Images uploaded but never attached to a product are collected by
+collect_orphans().
+
+Images stored before this used random names; releasing them deletes the
+blobs without reference counting.
+
+Clients can also upload the original photo straight to the bucket with a
+short-lived signed URL (create_upload()), under uploads/<uid>/<upload ID>,
+and then have it processed with read_upload(). Raw uploads are deleted once
+processed, or by collect_orphans() if they never are.
+"""
+
+from datetime import datetime, timedelta, timezone
+import hashlib
+import re
+from typing import Any, Callable, Dict, Iterator
+import uuid
+
+from absl import logging as log
+from google.api_core.exceptions import FailedPrecondition, NotFound
+from google.cloud.firestore_v1 import Increment
+from google.cloud.firestore_v1.base_query import FieldFilter
+
+from blob_deletion_queue import BlobDeletionQueue
+import concurrency
+from image_processing import EncodedImage, ProcessedImage
+
+IMAGE_PREFIX = "product_images/"
+THUMBNAIL_PREFIX = "product_images/thumbnails/"
+UPLOAD_PREFIX = "uploads/"
+# Content types accepted for direct uploads.
+UPLOAD_CONTENT_TYPES = frozenset(("image/jpeg", "image/png", "image/webp"))
+_UPLOAD_ID = re.compile(r"^[0-9a-f]{32}$")
+# Content-addressed image paths, the name is the SHA-256 of the stored bytes.
+_HASHED_PATH = re.compile(r"^product_images/([0-9a-f]{64})\.[a-z]+$")
+_HASH_CHUNK_SIZE = 1 << 20
+# Stored blobs never change, so clients and CDNs may cache them forever.
+_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+def content_hash(data: bytes) -> str:
+    digest = hashlib.sha256()
+    view = memoryview(data)
+    for start in range(0, len(view), _HASH_CHUNK_SIZE):
+        digest.update(view[start:start + _HASH_CHUNK_SIZE])
+    return digest.hexdigest()
+
+
+def thumbnail_path(image_path: str) -> str:
+    """Returns the storage path of the thumbnail of product_images/<name>."""
+    return image_path.replace(IMAGE_PREFIX, THUMBNAIL_PREFIX, 1)
+
+
+def image_path(image_url: str) -> str | None:
+    """Returns the storage path of a product image URL, or None if it is not one."""
+    # URL format: https://storage.googleapis.com/pantryguardian-f8381.appspot.com/product_images/filename.jpg
+    filename = image_url.split(IMAGE_PREFIX)[-1] if IMAGE_PREFIX in image_url else ""
+    return f"{IMAGE_PREFIX}{filename}" if filename else None
+
+
+def thumbnail_url(image_url: str | None) -> str | None:
+    """
+    Returns the thumbnail URL of a product image URL. Only content-addressed
+    images are known to have one; older images and other URLs return None.
+    """
+    path = image_path(image_url) if image_url else None
+    if image_url is None or path is None or not _HASHED_PATH.match(path):
+        return None
+    return image_url.replace(path, thumbnail_path(path))
+
+
+class UploadNotFoundException(Exception):
+    """Raised when a direct upload does not exist (or belongs to another user)."""
+
+
+class UploadTooLargeException(Exception):
+    """Raised when a direct upload exceeds the allowed size."""
+
+
+class ImageStore:
+    def __init__(self, firestore, bucket: Callable[[], Any]) -> None:
+        self.__db = firestore
+        # Returns the storage bucket; called on use so the client is created lazily.
+        self.__bucket = bucket
+        self.__deletion_queue = BlobDeletionQueue(firestore, bucket, self.is_referenced)
+
+    @property
+    def deletion_queue(self) -> BlobDeletionQueue:
+        return self.__deletion_queue
+
+    def save(self, processed: ProcessedImage) -> tuple[str, str, bool]:
+        """
+        Stores a processed image and its thumbnail unless they already exist.
+        Returns the image URL, the thumbnail URL and whether it was uploaded.
+        """
+        digest = content_hash(processed.image.data)
+        path = f"{IMAGE_PREFIX}{digest}{processed.image.extension}"
+        bucket = self.__bucket()
+        image_blob = bucket.blob(path)
+        thumbnail_blob = bucket.blob(thumbnail_path(path))
+        _, exists = concurrency.gather(
+            # Protects the image from collect_orphans() until a product uses it.
+            lambda: self.__refs().document(digest).set({"uploaded_at": _now_ms()}, merge=True),
+            image_blob.exists,
+        )
+        if exists:
+            return image_blob.public_url, thumbnail_blob.public_url, False
+
+        concurrency.gather(
+            lambda: self.__upload(image_blob, processed.image),
+            lambda: self.__upload(thumbnail_blob, processed.thumbnail),
+        )
+        return image_blob.public_url, thumbnail_blob.public_url, True
+
+    def create_upload(
+        self, uid: str, content_type: str, max_bytes: int, expires_in: timedelta
+    ) -> Dict[str, Any]:
+        """
+        Returns a V4 signed URL the client can PUT the original image to,
+        with the headers it must send, and the ID to pass to read_upload().
+        """
+        upload_id = uuid.uuid4().hex
+        headers = {
+            "Content-Type": content_type,
+            # Storage rejects larger uploads, the header is part of the signature.
+            "x-goog-content-length-range": f"0,{max_bytes}",
+        }
+        url = self.__upload_blob(uid, upload_id).generate_signed_url(
+            version="v4",
+            expiration=expires_in,
+            method="PUT",
+            content_type=content_type,
+            headers={"x-goog-content-length-range": headers["x-goog-content-length-range"]},
+        )
+        return {
+            "upload_id": upload_id,
+            "upload_url": url,
+            "method": "PUT",
+            "headers": headers,
+            "expires_at": int((datetime.now() + expires_in).timestamp() * 1000),
+        }
+
+    def read_upload(self, uid: str, upload_id: str, max_bytes: int) -> bytes:
+        """
+        Returns the bytes of a direct upload of the user.
+        Raises UploadNotFoundException or UploadTooLargeException.
+        """
+        if not upload_id or not _UPLOAD_ID.match(upload_id):
+            raise UploadNotFoundException(upload_id)
+        blob = self.__bucket().get_blob(self.__upload_path(uid, upload_id))
+        if blob is None:
+            raise UploadNotFoundException(upload_id)
+        if (blob.size or 0) > max_bytes:
+            self.discard_upload(uid, upload_id)
+            raise UploadTooLargeException(upload_id)
+        return blob.download_as_bytes()
+
+    def discard_upload(self, uid: str, upload_id: str) -> bool:
+        """Queues the deletion of a direct upload, e.g. once it was processed."""
+        if not upload_id or not _UPLOAD_ID.match(upload_id):
+            return False
+        return self.__deletion_queue.enqueue([self.__upload_path(uid, upload_id)])
+
+    def add_reference(self, image_url: str | None) -> bool:
+        """Records that one more product uses the image."""
+        digest = self.__hash(image_url)
+        if digest is None:
+            return True
+        try:
+            self.__refs().document(digest).set({"count": Increment(1)}, merge=True)
+            return True
+        except Exception as err:
+            log.error("[%s] Unable to add image reference: %s", digest, err)
+            return False
+
+    def is_referenced(self, digest: str, since_ms: int = 0) -> bool:
+        """
+        Whether a product uses the image with the given content hash, or it was
+        uploaded again after since_ms (epoch millis). save() reuses an existing
+        blob, so a deletion queued before such an upload must keep it.
+        """
+        doc = self.__refs().document(digest).get()
+        data = doc.to_dict() or {}
+        return data.get("count", 0) > 0 or data.get("uploaded_at", 0) > since_ms
+
+    def release(self, image_url: str | None, delete_unused: bool = True) -> bool:
+        """
+        Records that one product less uses the image, and deletes the image
+        once no product uses it anymore (unless delete_unused is False).
+        """
+        if not image_url:
+            return True
+        path = image_path(image_url)
+        if path is None:
+            log.error("release(): not a product image URL: %s", image_url)
+            return False
+        digest = self.__hash(image_url)
+        if digest is None:
+            # Not reference counted, see the module docstring.
+            return self.__delete_blobs(path) if delete_unused else True
+        try:
+            unused = self.__remove_reference(digest, delete_unused)
+        except Exception as err:
+            log.error("[%s] Unable to release image reference: %s", digest, err)
+            return False
+        return self.__delete_blobs(path, digest) if unused else True
+
+    def collect_orphans(self, grace_ms: int) -> int:
+        """
+        Queues the deletion of images no product uses (e.g. uploads that were
+        never saved with a product) and of thumbnails without an image. Blobs
+        younger than grace_ms are kept. Returns the number of queued blobs.
+        """
+        cutoff = _now_ms() - grace_ms
+        images = set()
+        thumbnails = []
+        orphans = 0
+        try:
+            for blob in self.__bucket().list_blobs(prefix=IMAGE_PREFIX):
+                if blob.name.startswith(THUMBNAIL_PREFIX):
+                    thumbnails.append(blob)
+                    continue
+                images.add(blob.name)
+                if _created_ms(blob) < cutoff and self.__is_orphan(blob, cutoff):
+                    self.__delete_blobs(blob.name, self.__hash(blob.name) or "")
+                    orphans += 2
+            for blob in thumbnails:
+                image = blob.name.replace(THUMBNAIL_PREFIX, IMAGE_PREFIX, 1)
+                if image not in images and _created_ms(blob) < cutoff:
+                    self.__deletion_queue.enqueue([blob.name])
+                    orphans += 1
+            # Direct uploads that were never processed.
+            abandoned = [
+                blob.name
+                for blob in self.__bucket().list_blobs(prefix=UPLOAD_PREFIX)
+                if _created_ms(blob) < cutoff
+            ]
+            self.__deletion_queue.enqueue(abandoned)
+            orphans += len(abandoned)
+        except Exception as err:
+            log.error("collect_orphans(): Unable to collect orphaned images: %s", err)
+        log.info("Queued %d orphaned image blobs for deletion", orphans)
+        return orphans
+
+    def __is_orphan(self, blob: Any, cutoff: int) -> bool:
+        digest = self.__hash(blob.name)
+        if digest is None:
+            # Not reference counted, look for a product using it.
+            return not any(True for _ in self.__products_using(blob.public_url))
+        doc = self.__refs().document(digest).get()
+        data = doc.to_dict() or {}
+        if data.get("count", 0) > 0 or data.get("uploaded_at", 0) >= cutoff:
+            return False
+        if doc.exists:
+            try:
+                doc.reference.delete(option=self.__db.write_option(last_update_time=doc.update_time))
+            except FailedPrecondition:
+                # Uploaded or referenced in the meantime.
+                return False
+        return True
+
+    def __products_using(self, image_url: str) -> Iterator[Any]:
+        for name in ("products", "products_archive"):
+            yield from (
+                self.__db.collection(name)
+                .where(filter=FieldFilter("image_url", "==", image_url))
+                .select([])
+                .limit(1)
+                .stream()
+            )
+
+    def __remove_reference(self, digest: str, delete_unused: bool) -> bool:
+        """Decrements the reference count, returns whether the image is to be deleted."""
+        ref = self.__refs().document(digest)
+        try:
+            ref.update({"count": Increment(-1)})
+        except NotFound:
+            if delete_unused:
+                log.warning("[%s] Image has no references, deleting it", digest)
+            return delete_unused
+        if not delete_unused:
+            return False
+        doc = ref.get()
+        if (doc.to_dict() or {}).get("count", 0) > 0:
+            return False
+        try:
+            # Only delete if no reference was added since reading the count.
+            ref.delete(option=self.__db.write_option(last_update_time=doc.update_time))
+        except FailedPrecondition:
+            return False
+        return True
+
+    def __hash(self, image_url: str | None) -> str | None:
+        """Returns the content hash of an image URL (or path), None if it has none."""
+        path = image_path(image_url) if image_url else None
+        match = _HASHED_PATH.match(path) if path else None
+        return match.group(1) if match else None
+
+    def __upload(self, blob: Any, image: EncodedImage) -> None:
+        blob.cache_control = _CACHE_CONTROL
+        blob.upload_from_string(image.data, content_type=image.content_type)
+        # Make the file publicly accessible
+        blob.make_public()
+
+    def __delete_blobs(self, path: str, digest: str = "") -> bool:
+        # The thumbnail is queued even for images that never had one, deleting
+        # a missing blob is a no-op.
+        return self.__deletion_queue.enqueue([path, thumbnail_path(path)], digest)
+
+    def __upload_path(self, uid: str, upload_id: str) -> str:
+        return f"{UPLOAD_PREFIX}{uid}/{upload_id}"
+
+    def __upload_blob(self, uid: str, upload_id: str) -> Any:
+        return self.__bucket().blob(self.__upload_path(uid, upload_id))
+
+    def __refs(self):
+        return self.__db.collection("product_images")
+
+
+def _now_ms() -> int:
+    return int(datetime.now().timestamp() * 1000)
+
+
+def _created_ms(blob: Any) -> int:
+    created = blob.time_created or datetime.now(timezone.utc)
+    return int(created.timestamp() * 1000)
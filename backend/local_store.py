@@ -0,0 +1,804 @@
+"""
+A local stand-in for the Firestore client, backed by SQLite (a file or
+":memory:"). It implements the part of the client API the managers use, with
+the same query semantics: equality, range, "in" and array filters, ordering,
+limits, start_after() cursors, projections, batches, write preconditions,
+query snapshot listeners and the ArrayUnion/ArrayRemove/Increment/DELETE_FIELD/
+SERVER_TIMESTAMP transforms.
+
+It exists so the app can be run, profiled and benchmarked without Google
+credentials or network access. It is not meant for production data.
+"""
+
+import asyncio
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+import functools
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, AsyncIterator, Callable, Dict, Iterator
+
+from absl import logging as log
+from google.api_core.datetime_helpers import DatetimeWithNanoseconds
+from google.api_core.exceptions import FailedPrecondition, NotFound
+from google.cloud.firestore_v1 import (
+    DELETE_FIELD,
+    SERVER_TIMESTAMP,
+    ArrayRemove,
+    ArrayUnion,
+    Increment,
+)
+from google.cloud.firestore_v1.base_query import And, FieldFilter, Or
+from google.cloud.firestore_v1.watch import ChangeType, DocumentChange
+
+DESCENDING = "DESCENDING"
+
+
+class _Missing:
+    """Marks a field that does not exist in a document."""
+
+
+MISSING = _Missing()
+
+
+def _now() -> DatetimeWithNanoseconds:
+    return DatetimeWithNanoseconds.now(timezone.utc)
+
+
+def _order_key(value: Any) -> tuple:
+    """
+    Returns a key that orders values like Firestore does across types:
+    null < bool < number < timestamp < string < bytes < array < map.
+    """
+    if value is None:
+        return (0,)
+    if isinstance(value, bool):
+        return (1, value)
+    if isinstance(value, (int, float)):
+        return (2, value)
+    if isinstance(value, datetime):
+        return (3, value.timestamp())
+    if isinstance(value, str):
+        return (4, value)
+    if isinstance(value, bytes):
+        return (5, value)
+    if isinstance(value, (list, tuple)):
+        return (7, tuple(_order_key(v) for v in value))
+    if isinstance(value, dict):
+        return (8, tuple((k, _order_key(v)) for k, v in sorted(value.items())))
+    return (6, str(value))
+
+
+def _copy(value: Any) -> Any:
+    # Much faster than copy.deepcopy() for plain document data.
+    if isinstance(value, dict):
+        return {k: _copy(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_copy(v) for v in value]
+    return value
+
+
+def _get_field(data: Dict[str, Any], field_path: str) -> Any:
+    value: Any = data
+    for part in field_path.split("."):
+        if not isinstance(value, dict) or part not in value:
+            return MISSING
+        value = value[part]
+    return value
+
+
+def _set_field(data: Dict[str, Any], field_path: str, value: Any) -> None:
+    parts = field_path.split(".")
+    for part in parts[:-1]:
+        child = data.get(part)
+        if not isinstance(child, dict):
+            child = data[part] = {}
+        data = child
+    if value is DELETE_FIELD:
+        data.pop(parts[-1], None)
+    else:
+        data[parts[-1]] = value
+
+
+def _transform(current: Any, value: Any) -> Any:
+    """Resolves sentinels and transforms against the current field value."""
+    if value is SERVER_TIMESTAMP:
+        return _now()
+    if isinstance(value, ArrayUnion):
+        result = list(current) if isinstance(current, list) else []
+        keys = [_order_key(v) for v in result]
+        for item in value.values:
+            if _order_key(item) not in keys:
+                result.append(item)
+                keys.append(_order_key(item))
+        return result
+    if isinstance(value, ArrayRemove):
+        removed = {_order_key(v) for v in value.values}
+        current = current if isinstance(current, list) else []
+        return [v for v in current if _order_key(v) not in removed]
+    if isinstance(value, Increment):
+        base = current if isinstance(current, (int, float)) else 0
+        return base + value.value
+    if isinstance(value, dict):
+        return {
+            k: _transform(_get_field(current, k) if isinstance(current, dict) else MISSING, v)
+            for k, v in value.items()
+        }
+    return _copy(value)
+
+
+def _merge(target: Dict[str, Any], data: Dict[str, Any]) -> None:
+    for key, value in data.items():
+        if value is DELETE_FIELD:
+            target.pop(key, None)
+        elif isinstance(value, dict) and isinstance(target.get(key), dict):
+            _merge(target[key], value)
+        else:
+            target[key] = _transform(target.get(key, MISSING), value)
+
+
+def _matches(data: Dict[str, Any], doc_id: str, flt: Any) -> bool:
+    if isinstance(flt, And):
+        return all(_matches(data, doc_id, f) for f in flt.filters)
+    if isinstance(flt, Or):
+        return any(_matches(data, doc_id, f) for f in flt.filters)
+    value = doc_id if flt.field_path == "__name__" else _get_field(data, flt.field_path)
+    if value is MISSING:
+        return False
+    return _compare(value, flt.op_string, flt.value)
+
+
+def _compare(value: Any, op: str, expected: Any) -> bool:
+    key = _order_key(value)
+    if op == "array_contains":
+        return isinstance(value, list) and _order_key(expected) in map(_order_key, value)
+    if op == "array_contains_any":
+        wanted = {_order_key(v) for v in expected}
+        return isinstance(value, list) and any(_order_key(v) in wanted for v in value)
+    if op == "in":
+        return key in {_order_key(v) for v in expected}
+    if op == "not-in":
+        return key not in {_order_key(v) for v in expected}
+    if op == "==":
+        return key == _order_key(expected)
+    if op == "!=":
+        return key != _order_key(expected)
+    expected_key = _order_key(expected)
+    # Range filters only match values of the same type.
+    if key[0] != expected_key[0]:
+        return False
+    return {
+        "<": key < expected_key,
+        "<=": key <= expected_key,
+        ">": key > expected_key,
+        ">=": key >= expected_key,
+    }[op]
+
+
+class _JSONEncoder(json.JSONEncoder):
+    def default(self, o: Any) -> Any:
+        if isinstance(o, DatetimeWithNanoseconds):
+            return {"__datetime__": o.rfc3339()}
+        if isinstance(o, datetime):
+            return {"__datetime__": o.astimezone(timezone.utc).isoformat()}
+        return super().default(o)
+
+
+def _json_object_hook(obj: Dict[str, Any]) -> Any:
+    if "__datetime__" in obj:
+        value = obj["__datetime__"]
+        if value.endswith("Z"):
+            return DatetimeWithNanoseconds.from_rfc3339(value)
+        return datetime.fromisoformat(value)
+    return obj
+
+
+class _StoredDocument:
+    def __init__(self, data: Dict[str, Any], create_time: datetime, update_time: datetime) -> None:
+        self.data = data
+        self.create_time = create_time
+        self.update_time = update_time
+
+
+class LocalWriteOption:
+    def __init__(self, last_update_time: datetime | None = None, exists: bool | None = None) -> None:
+        self.last_update_time = last_update_time
+        self.exists = exists
+
+
+class LocalWriteResult:
+    def __init__(self, update_time: datetime) -> None:
+        self.update_time = update_time
+
+
+class LocalDocumentSnapshot:
+    def __init__(
+        self,
+        reference: "LocalDocumentReference",
+        stored: _StoredDocument | None,
+        field_paths: list[str] | None = None,
+    ) -> None:
+        self.reference = reference
+        self.id = reference.id
+        self.exists = stored is not None
+        self.create_time = stored.create_time if stored else None
+        self.update_time = stored.update_time if stored else None
+        self.read_time = _now()
+        self.__data: Dict[str, Any] | None = None
+        if stored is not None:
+            if field_paths is None:
+                # Stored data is never modified in place, so it can be shared
+                # until it is handed out.
+                self.__data = stored.data
+            else:
+                self.__data = {}
+                for field_path in field_paths:
+                    value = _get_field(stored.data, field_path)
+                    if value is not MISSING:
+                        _set_field(self.__data, field_path, value)
+
+    def to_dict(self) -> Dict[str, Any] | None:
+        return _copy(self.__data)
+
+    def get(self, field_path: str) -> Any:
+        value = _get_field(self.__data or {}, field_path)
+        if value is MISSING:
+            raise KeyError(field_path)
+        return _copy(value)
+
+
+class LocalDocumentReference:
+    def __init__(self, store: "LocalDocumentStore", collection: str, id: str) -> None:
+        self._store = store
+        self._collection = collection
+        self.id = id
+        self.path = f"{collection}/{id}"
+
+    def get(self, field_paths: list[str] | None = None, **kwargs) -> LocalDocumentSnapshot:
+        return self._store._get(self, field_paths)
+
+    def set(self, document_data: Dict[str, Any], merge: bool = False) -> LocalWriteResult:
+        return self._store._commit([("set", self, document_data, merge)])[0]
+
+    def update(
+        self, field_updates: Dict[str, Any], option: LocalWriteOption | None = None
+    ) -> LocalWriteResult:
+        return self._store._commit([("update", self, field_updates, option)])[0]
+
+    def delete(self, option: LocalWriteOption | None = None) -> LocalWriteResult:
+        return self._store._commit([("delete", self, None, option)])[0]
+
+
+class LocalQuery:
+    def __init__(
+        self,
+        store: "LocalDocumentStore",
+        collection: str,
+        filters: tuple = (),
+        orders: tuple = (),
+        limit: int | None = None,
+        cursor: tuple | None = None,
+        projection: list[str] | None = None,
+    ) -> None:
+        self._store = store
+        self._collection = collection
+        self._filters = filters
+        self._orders = orders
+        self._limit = limit
+        self._cursor = cursor
+        self._projection = projection
+
+    def __copy_with(self, **kwargs) -> "LocalQuery":
+        params: Dict[str, Any] = {
+            "filters": self._filters,
+            "orders": self._orders,
+            "limit": self._limit,
+            "cursor": self._cursor,
+            "projection": self._projection,
+        }
+        params.update(kwargs)
+        return LocalQuery(self._store, self._collection, **params)
+
+    def where(
+        self,
+        field_path: str | None = None,
+        op_string: str | None = None,
+        value: Any = None,
+        *,
+        filter: Any = None,
+    ) -> "LocalQuery":
+        if filter is None:
+            filter = FieldFilter(field_path, op_string, value)
+        return self.__copy_with(filters=self._filters + (filter,))
+
+    def order_by(self, field_path: str, direction: str = "ASCENDING") -> "LocalQuery":
+        return self.__copy_with(orders=self._orders + ((field_path, direction),))
+
+    def limit(self, count: int) -> "LocalQuery":
+        return self.__copy_with(limit=count)
+
+    def select(self, field_paths: list[str]) -> "LocalQuery":
+        return self.__copy_with(projection=list(field_paths))
+
+    def start_after(self, document_fields_or_snapshot: Any) -> "LocalQuery":
+        return self.__copy_with(cursor=(document_fields_or_snapshot,))
+
+    def stream(self, **kwargs) -> Iterator[LocalDocumentSnapshot]:
+        return iter(self._store._query(self))
+
+    def get(self, **kwargs) -> list[LocalDocumentSnapshot]:
+        return self._store._query(self)
+
+    def on_snapshot(self, callback: Callable) -> "LocalWatch":
+        return self._store._watch(self, callback)
+
+    # Evaluation, called by the store while holding its lock.
+    def _run(self, documents: Dict[str, _StoredDocument]) -> list[tuple[str, _StoredDocument]]:
+        matches = [
+            (doc_id, stored)
+            for doc_id, stored in documents.items()
+            if all(_matches(stored.data, doc_id, f) for f in self._filters)
+        ]
+        orders = self.__effective_orders()
+        # Documents without a field used for ordering are not returned.
+        matches = [
+            (doc_id, stored)
+            for doc_id, stored in matches
+            if all(self.__value(doc_id, stored, f) is not MISSING for f, _ in orders)
+        ]
+        directions = {direction for _, direction in orders}
+        if len(directions) == 1:
+            matches.sort(
+                key=lambda m: tuple(_order_key(self.__value(m[0], m[1], f)) for f, _ in orders),
+                reverse=DESCENDING in directions,
+            )
+        else:
+            matches.sort(key=functools.cmp_to_key(lambda a, b: self.__compare(a, b, orders)))
+        if self._cursor is not None:
+            cursor = self.__cursor_values(orders)
+            matches = [m for m in matches if self.__compare_to_cursor(m, cursor, orders) > 0]
+        if self._limit is not None:
+            matches = matches[: self._limit]
+        return matches
+
+    def __effective_orders(self) -> list[tuple[str, str]]:
+        orders = list(self._orders)
+        # Like Firestore, order by the first range/inequality field if no
+        # explicit order is given, and always break ties by document ID.
+        if not orders:
+            for f in self._filters:
+                if isinstance(f, FieldFilter) and f.op_string in ("<", "<=", ">", ">=", "!=", "not-in"):
+                    orders.append((f.field_path, "ASCENDING"))
+                    break
+        if not any(field == "__name__" for field, _ in orders):
+            direction = orders[-1][1] if orders else "ASCENDING"
+            orders.append(("__name__", direction))
+        return orders
+
+    def __value(self, doc_id: str, stored: _StoredDocument, field: str) -> Any:
+        return doc_id if field == "__name__" else _get_field(stored.data, field)
+
+    def __compare(self, a: Any, b: Any, orders: list[tuple[str, str]]) -> int:
+        for field, direction in orders:
+            key_a = _order_key(self.__value(a[0], a[1], field))
+            key_b = _order_key(self.__value(b[0], b[1], field))
+            if key_a != key_b:
+                result = -1 if key_a < key_b else 1
+                return -result if direction == DESCENDING else result
+        return 0
+
+    def __cursor_values(self, orders: list[tuple[str, str]]) -> list[Any]:
+        cursor = self._cursor[0] if self._cursor else None
+        if isinstance(cursor, LocalDocumentSnapshot):
+            data = cursor.to_dict() or {}
+            return [
+                cursor.id if field == "__name__" else _get_field(data, field)
+                for field, _ in orders
+            ]
+        return [cursor.get(field, MISSING) for field, _ in orders] if isinstance(cursor, dict) else []
+
+    def __compare_to_cursor(self, match: tuple, cursor: list[Any], orders: list[tuple[str, str]]) -> int:
+        for (field, direction), cursor_value in zip(orders, cursor):
+            if cursor_value is MISSING:
+                break
+            key_a = _order_key(self.__value(match[0], match[1], field))
+            key_b = _order_key(cursor_value)
+            if key_a != key_b:
+                result = -1 if key_a < key_b else 1
+                return -result if direction == DESCENDING else result
+        return 0
+
+
+class LocalCollectionReference(LocalQuery):
+    def __init__(self, store: "LocalDocumentStore", collection: str) -> None:
+        super().__init__(store, collection)
+        self.id = collection
+
+    def document(self, document_id: str | None = None) -> LocalDocumentReference:
+        return LocalDocumentReference(self._store, self._collection, document_id or uuid.uuid4().hex)
+
+    def add(self, document_data: Dict[str, Any]) -> tuple[LocalWriteResult, LocalDocumentReference]:
+        ref = self.document()
+        return ref.set(document_data), ref
+
+
+class LocalWatch:
+    """
+    A query snapshot listener. Like Firestore, the callback is called on a
+    background thread with all matching documents (as ADDED changes) first,
+    and then after each commit that changes the results.
+    """
+
+    def __init__(self, store: "LocalDocumentStore", query: LocalQuery, callback: Callable) -> None:
+        self._store = store
+        self._query = query
+        self._callback = callback
+        # Matching document ID -> update time, in query order.
+        self._known: Dict[str, datetime] = {}
+
+    def unsubscribe(self) -> None:
+        self._store._unwatch(self)
+
+
+class LocalWriteBatch:
+    def __init__(self, store: "LocalDocumentStore") -> None:
+        self._store = store
+        self._writes: list[tuple] = []
+
+    def __len__(self) -> int:
+        return len(self._writes)
+
+    def set(self, reference: LocalDocumentReference, document_data: Dict[str, Any], merge: bool = False) -> None:
+        self._writes.append(("set", reference, document_data, merge))
+
+    def update(
+        self,
+        reference: LocalDocumentReference,
+        field_updates: Dict[str, Any],
+        option: LocalWriteOption | None = None,
+    ) -> None:
+        self._writes.append(("update", reference, field_updates, option))
+
+    def delete(self, reference: LocalDocumentReference, option: LocalWriteOption | None = None) -> None:
+        self._writes.append(("delete", reference, None, option))
+
+    def commit(self) -> list[LocalWriteResult]:
+        writes, self._writes = self._writes, []
+        return self._store._commit(writes)
+
+
+class LocalDocumentStore:
+    """
+    Drop-in replacement for google.cloud.firestore.Client. All documents are
+    kept in memory and written through to SQLite. `latency_ms` adds a delay to
+    every remote-call equivalent (get, query, commit) to mimic network round
+    trips in benchmarks. `stats` counts those calls and the documents read.
+    """
+
+    def __init__(self, path: str = ":memory:", latency_ms: float = 0) -> None:
+        self.__latency_s = latency_ms / 1000
+        self.__lock = threading.RLock()
+        self.__last_update_time = _now()
+        self.__watches: list[LocalWatch] = []
+        # Calls the snapshot listeners, in commit order.
+        self.__watch_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="local-watch")
+        self.stats: Counter = Counter()
+        self.__db = sqlite3.connect(path, check_same_thread=False)
+        self.__db.execute(
+            "CREATE TABLE IF NOT EXISTS documents ("
+            " collection TEXT NOT NULL, id TEXT NOT NULL, data TEXT NOT NULL,"
+            " create_time TEXT NOT NULL, update_time TEXT NOT NULL,"
+            " PRIMARY KEY (collection, id))"
+        )
+        self.__collections: Dict[str, Dict[str, _StoredDocument]] = {}
+        for collection, id, data, create_time, update_time in self.__db.execute(
+            "SELECT collection, id, data, create_time, update_time FROM documents"
+        ):
+            self.__collections.setdefault(collection, {})[id] = _StoredDocument(
+                json.loads(data, object_hook=_json_object_hook),
+                DatetimeWithNanoseconds.from_rfc3339(create_time),
+                DatetimeWithNanoseconds.from_rfc3339(update_time),
+            )
+
+    def collection(self, collection_id: str) -> LocalCollectionReference:
+        return LocalCollectionReference(self, collection_id)
+
+    def batch(self) -> LocalWriteBatch:
+        return LocalWriteBatch(self)
+
+    def write_option(self, **kwargs) -> LocalWriteOption:
+        return LocalWriteOption(**kwargs)
+
+    def close(self) -> None:
+        self.__db.close()
+
+    @property
+    def latency_s(self) -> float:
+        return self.__latency_s
+
+    def async_client(self) -> "AsyncLocalDocumentStore":
+        """Returns an asyncio version of this store, sharing the same documents."""
+        return AsyncLocalDocumentStore(self)
+
+    # With wait=False, the caller simulates the latency itself (see the async store).
+    def _get(
+        self, ref: LocalDocumentReference, field_paths: list[str] | None, wait: bool = True
+    ) -> LocalDocumentSnapshot:
+        self.__round_trip("get", wait)
+        with self.__lock:
+            stored = self.__collections.get(ref._collection, {}).get(ref.id)
+            snapshot = LocalDocumentSnapshot(ref, stored, field_paths)
+            self.stats["docs_read"] += 1
+            return snapshot
+
+    def _query(self, query: LocalQuery, wait: bool = True) -> list[LocalDocumentSnapshot]:
+        self.__round_trip("query", wait)
+        with self.__lock:
+            matches = query._run(self.__collections.get(query._collection, {}))
+            self.stats["docs_read"] += max(len(matches), 1)
+        return [
+            LocalDocumentSnapshot(
+                LocalDocumentReference(self, query._collection, doc_id),
+                stored,
+                query._projection,
+            )
+            for doc_id, stored in matches
+        ]
+
+    def _commit(self, writes: list[tuple], wait: bool = True) -> list[LocalWriteResult]:
+        self.__round_trip("commit", wait)
+        with self.__lock:
+            # Check all preconditions first, so a batch is applied completely or not at all.
+            for kind, ref, _, option in writes:
+                self.__check_precondition(kind, ref, option)
+            update_time = self.__next_update_time()
+            results = []
+            for kind, ref, data, option in writes:
+                self.__apply(kind, ref, data, option, update_time)
+                results.append(LocalWriteResult(update_time))
+            self.__db.commit()
+            self.stats["writes"] += len(writes)
+            collections = {ref._collection for _, ref, _, _ in writes}
+            for watch in self.__watches:
+                if watch._query._collection in collections:
+                    self.__notify(watch)
+            return results
+
+    def _watch(self, query: LocalQuery, callback: Callable) -> LocalWatch:
+        watch = LocalWatch(self, query, callback)
+        with self.__lock:
+            self.__watches.append(watch)
+            self.__notify(watch, initial=True)
+        return watch
+
+    def _unwatch(self, watch: LocalWatch) -> None:
+        with self.__lock:
+            if watch in self.__watches:
+                self.__watches.remove(watch)
+
+    def __notify(self, watch: LocalWatch, initial: bool = False) -> None:
+        """Sends the changes of the watched query's results, called while holding the lock."""
+        matches = watch._query._run(self.__collections.get(watch._query._collection, {}))
+        old_indexes = {doc_id: index for index, doc_id in enumerate(watch._known)}
+        new_indexes = {doc_id: index for index, (doc_id, _) in enumerate(matches)}
+        changes = [
+            DocumentChange(ChangeType.REMOVED, self.__snapshot(watch, doc_id, None), index, -1)
+            for doc_id, index in old_indexes.items()
+            if doc_id not in new_indexes
+        ]
+        for doc_id, stored in matches:
+            if doc_id not in old_indexes:
+                change_type = ChangeType.ADDED
+            elif watch._known[doc_id] != stored.update_time:
+                change_type = ChangeType.MODIFIED
+            else:
+                continue
+            changes.append(
+                DocumentChange(
+                    change_type,
+                    self.__snapshot(watch, doc_id, stored),
+                    old_indexes.get(doc_id, -1),
+                    new_indexes[doc_id],
+                )
+            )
+        watch._known = {doc_id: stored.update_time for doc_id, stored in matches}
+        if not changes and not initial:
+            return
+        docs = [self.__snapshot(watch, doc_id, stored) for doc_id, stored in matches]
+        self.__watch_executor.submit(self.__call_listener, watch, docs, changes, _now())
+
+    def __snapshot(self, watch: LocalWatch, doc_id: str, stored: _StoredDocument | None) -> LocalDocumentSnapshot:
+        ref = LocalDocumentReference(self, watch._query._collection, doc_id)
+        return LocalDocumentSnapshot(ref, stored, watch._query._projection)
+
+    def __call_listener(self, watch: LocalWatch, docs: list, changes: list, read_time: datetime) -> None:
+        with self.__lock:
+            if watch not in self.__watches:
+                return
+        try:
+            watch._callback(docs, changes, read_time)
+        except Exception as err:
+            # Firestore stops the listener when its callback raises.
+            log.error("Snapshot listener failed, stopping it: %s", err)
+            self._unwatch(watch)
+
+    def __round_trip(self, kind: str, wait: bool) -> None:
+        with self.__lock:
+            self.stats[kind] += 1
+        if wait and self.__latency_s:
+            time.sleep(self.__latency_s)
+
+    def __next_update_time(self) -> DatetimeWithNanoseconds:
+        # Strictly increasing, so update time preconditions are meaningful.
+        now = _now()
+        if now <= self.__last_update_time:
+            now = DatetimeWithNanoseconds.fromtimestamp(
+                self.__last_update_time.timestamp() + 1e-6, timezone.utc
+            )
+        self.__last_update_time = now
+        return now
+
+    def __check_precondition(self, kind: str, ref: LocalDocumentReference, option: Any) -> None:
+        stored = self.__collections.get(ref._collection, {}).get(ref.id)
+        if kind == "update" and stored is None:
+            raise NotFound(f"No document to update: {ref.path}")
+        if not isinstance(option, LocalWriteOption):
+            return
+        if option.exists is not None and option.exists != (stored is not None):
+            raise FailedPrecondition(f"Document existence precondition failed: {ref.path}")
+        if option.last_update_time is not None and (
+            stored is None or stored.update_time != option.last_update_time
+        ):
+            raise FailedPrecondition(f"Document was modified: {ref.path}")
+
+    def __apply(self, kind: str, ref: LocalDocumentReference, data: Any, option: Any, update_time: datetime) -> None:
+        documents = self.__collections.setdefault(ref._collection, {})
+        if kind == "delete":
+            documents.pop(ref.id, None)
+            self.__db.execute(
+                "DELETE FROM documents WHERE collection = ? AND id = ?",
+                (ref._collection, ref.id),
+            )
+            return
+
+        stored = documents.get(ref.id)
+        if kind == "update":
+            new_data = _copy(stored.data) if stored else {}
+            for field_path, value in data.items():
+                _set_field(new_data, field_path, _transform(_get_field(new_data, field_path), value))
+        elif option:  # set(merge=True)
+            new_data = _copy(stored.data) if stored else {}
+            _merge(new_data, data)
+        else:
+            new_data = _transform(MISSING, data)
+
+        create_time = stored.create_time if stored else update_time
+        documents[ref.id] = _StoredDocument(new_data, create_time, update_time)
+        self.__db.execute(
+            "INSERT OR REPLACE INTO documents VALUES (?, ?, ?, ?, ?)",
+            (
+                ref._collection,
+                ref.id,
+                json.dumps(new_data, cls=_JSONEncoder),
+                DatetimeWithNanoseconds.fromtimestamp(create_time.timestamp(), timezone.utc).rfc3339(),
+                DatetimeWithNanoseconds.fromtimestamp(update_time.timestamp(), timezone.utc).rfc3339(),
+            ),
+        )
+
+
+class AsyncLocalDocumentReference:
+    def __init__(self, ref: LocalDocumentReference) -> None:
+        self._ref = ref
+        self.id = ref.id
+        self.path = ref.path
+
+    async def get(self, field_paths: list[str] | None = None, **kwargs) -> LocalDocumentSnapshot:
+        await _round_trip(self._ref._store)
+        return self._ref._store._get(self._ref, field_paths, wait=False)
+
+    async def set(self, document_data: Dict[str, Any], merge: bool = False) -> LocalWriteResult:
+        await _round_trip(self._ref._store)
+        return self._ref._store._commit([("set", self._ref, document_data, merge)], wait=False)[0]
+
+    async def update(
+        self, field_updates: Dict[str, Any], option: LocalWriteOption | None = None
+    ) -> LocalWriteResult:
+        await _round_trip(self._ref._store)
+        return self._ref._store._commit([("update", self._ref, field_updates, option)], wait=False)[0]
+
+    async def delete(self, option: LocalWriteOption | None = None) -> LocalWriteResult:
+        await _round_trip(self._ref._store)
+        return self._ref._store._commit([("delete", self._ref, None, option)], wait=False)[0]
+
+
+class AsyncLocalQuery:
+    def __init__(self, query: LocalQuery) -> None:
+        self._query = query
+
+    def where(self, *args, **kwargs) -> "AsyncLocalQuery":
+        return AsyncLocalQuery(self._query.where(*args, **kwargs))
+
+    def order_by(self, *args, **kwargs) -> "AsyncLocalQuery":
+        return AsyncLocalQuery(self._query.order_by(*args, **kwargs))
+
+    def limit(self, count: int) -> "AsyncLocalQuery":
+        return AsyncLocalQuery(self._query.limit(count))
+
+    def select(self, field_paths: list[str]) -> "AsyncLocalQuery":
+        return AsyncLocalQuery(self._query.select(field_paths))
+
+    def start_after(self, document_fields_or_snapshot: Any) -> "AsyncLocalQuery":
+        return AsyncLocalQuery(self._query.start_after(document_fields_or_snapshot))
+
+    async def get(self, **kwargs) -> list[LocalDocumentSnapshot]:
+        await _round_trip(self._query._store)
+        return self._query._store._query(self._query, wait=False)
+
+    async def stream(self, **kwargs) -> AsyncIterator[LocalDocumentSnapshot]:
+        for doc in await self.get():
+            yield doc
+
+
+class AsyncLocalCollectionReference(AsyncLocalQuery):
+    def __init__(self, collection: LocalCollectionReference) -> None:
+        super().__init__(collection)
+        self._collection = collection
+        self.id = collection.id
+
+    def document(self, document_id: str | None = None) -> AsyncLocalDocumentReference:
+        return AsyncLocalDocumentReference(self._collection.document(document_id))
+
+
+class AsyncLocalWriteBatch:
+    def __init__(self, batch: LocalWriteBatch) -> None:
+        self._batch = batch
+
+    def __len__(self) -> int:
+        return len(self._batch)
+
+    def set(self, reference: AsyncLocalDocumentReference, document_data: Dict[str, Any], merge: bool = False) -> None:
+        self._batch.set(reference._ref, document_data, merge)
+
+    def update(
+        self,
+        reference: AsyncLocalDocumentReference,
+        field_updates: Dict[str, Any],
+        option: LocalWriteOption | None = None,
+    ) -> None:
+        self._batch.update(reference._ref, field_updates, option)
+
+    def delete(self, reference: AsyncLocalDocumentReference, option: LocalWriteOption | None = None) -> None:
+        self._batch.delete(reference._ref, option)
+
+    async def commit(self) -> list[LocalWriteResult]:
+        await _round_trip(self._batch._store)
+        writes, self._batch._writes = self._batch._writes, []
+        return self._batch._store._commit(writes, wait=False)
+
+
+class AsyncLocalDocumentStore:
+    """
+    Drop-in replacement for google.cloud.firestore.AsyncClient, on top of a
+    LocalDocumentStore. The simulated latency does not block the event loop.
+    """
+
+    def __init__(self, store: LocalDocumentStore) -> None:
+        self._store = store
+
+    def collection(self, collection_id: str) -> AsyncLocalCollectionReference:
+        return AsyncLocalCollectionReference(self._store.collection(collection_id))
+
+    def batch(self) -> AsyncLocalWriteBatch:
+        return AsyncLocalWriteBatch(self._store.batch())
+
+    def write_option(self, **kwargs) -> LocalWriteOption:
+        return LocalWriteOption(**kwargs)
+
+
+async def _round_trip(store: LocalDocumentStore) -> None:
+    if store.latency_s:
+        await asyncio.sleep(store.latency_s)
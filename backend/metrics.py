@@ -0,0 +1,219 @@
+"""
+In-process metrics (counters, gauges and latency histograms) rendered in the
+Prometheus text format by the /metrics endpoint.
+
+Metrics are looked up once, typically when a function is decorated, and
+recording a value only updates numbers; all string formatting happens when
+the metrics are rendered.
+"""
+
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+import threading
+from typing import Any, Dict, Generic, TypeVar
+
+# Upper bounds (in seconds) of the latency histogram buckets.
+LATENCY_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+)
+
+
+class CounterValue:
+    def __init__(self) -> None:
+        self.value = 0.0
+        self.__lock = threading.Lock()
+
+    def inc(self, amount: float = 1) -> None:
+        with self.__lock:
+            self.value += amount
+
+
+class GaugeValue:
+    def __init__(self) -> None:
+        self.value = 0.0
+        self.__lock = threading.Lock()
+
+    def inc(self, amount: float = 1) -> None:
+        with self.__lock:
+            self.value += amount
+
+    def dec(self, amount: float = 1) -> None:
+        with self.__lock:
+            self.value -= amount
+
+
+class HistogramValue:
+    def __init__(self, buckets: tuple[float, ...]) -> None:
+        self.buckets = buckets
+        # One count per bucket plus one for values above the last bound.
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.__lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        i = bisect_left(self.buckets, value)
+        with self.__lock:
+            self.counts[i] += 1
+            self.sum += value
+
+
+V = TypeVar("V", CounterValue, GaugeValue, HistogramValue)
+M = TypeVar("M", bound="Metric")
+
+
+class Metric(ABC, Generic[V]):
+    """A named metric with one value per combination of label values."""
+
+    def __init__(self, kind: str, name: str, help: str, label_names: tuple[str, ...]) -> None:
+        self.kind = kind
+        self.name = name
+        self.help = help
+        self.label_names = label_names
+        # Label values are converted to strings when rendering.
+        self.values: Dict[tuple[Any, ...], V] = {}
+        self.__lock = threading.Lock()
+
+    def labels(self, *label_values: Any) -> V:
+        value = self.values.get(label_values)
+        if value is None:
+            if len(label_values) != len(self.label_names):
+                raise ValueError(f"{self.name} expects labels {self.label_names}")
+            with self.__lock:
+                value = self.values.setdefault(label_values, self._new_value())
+        return value
+
+    @abstractmethod
+    def _new_value(self) -> V:
+        """Creates the value of a new combination of label values."""
+
+
+class Counter(Metric[CounterValue]):
+    def __init__(self, name: str, help: str, label_names: tuple[str, ...] = ()) -> None:
+        super().__init__("counter", name, help, label_names)
+
+    def _new_value(self) -> CounterValue:
+        return CounterValue()
+
+
+class Gauge(Metric[GaugeValue]):
+    def __init__(self, name: str, help: str, label_names: tuple[str, ...] = ()) -> None:
+        super().__init__("gauge", name, help, label_names)
+
+    def _new_value(self) -> GaugeValue:
+        return GaugeValue()
+
+
+class Histogram(Metric[HistogramValue]):
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        label_names: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = LATENCY_BUCKETS,
+    ) -> None:
+        super().__init__("histogram", name, help, label_names)
+        self.buckets = buckets
+
+    def _new_value(self) -> HistogramValue:
+        return HistogramValue(self.buckets)
+
+
+class Registry:
+    def __init__(self) -> None:
+        self.__metrics: Dict[str, Metric] = {}
+        self.__lock = threading.Lock()
+
+    def register(self, metric: M) -> M:
+        with self.__lock:
+            if metric.name in self.__metrics:
+                raise ValueError(f"Metric {metric.name} is already registered")
+            self.__metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        """Returns all metrics in the Prometheus text exposition format."""
+        lines = []
+        for metric in list(self.__metrics.values()):
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for label_values, value in sorted(metric.values.items(), key=lambda item: str(item[0])):
+                labels = [
+                    f'{name}="{_escape(str(label_value))}"'
+                    for name, label_value in zip(metric.label_names, label_values)
+                ]
+                if isinstance(value, HistogramValue):
+                    lines.extend(_histogram_lines(metric.name, labels, value))
+                else:
+                    lines.append(f"{metric.name}{_labels(labels)} {_number(value.value)}")
+        return "\n".join(lines) + "\n"
+
+
+def _histogram_lines(name: str, labels: list[str], value: HistogramValue) -> list[str]:
+    lines = []
+    cumulative = 0
+    counts = list(value.counts)
+    for bound, count in zip(value.buckets, counts):
+        cumulative += count
+        le = f'le="{bound}"'
+        lines.append(f"{name}_bucket{_labels(labels + [le])} {cumulative}")
+    cumulative += counts[-1]
+    le = 'le="+Inf"'
+    lines.append(f"{name}_bucket{_labels(labels + [le])} {cumulative}")
+    lines.append(f"{name}_sum{_labels(labels)} {_number(value.sum)}")
+    lines.append(f"{name}_count{_labels(labels)} {cumulative}")
+    return lines
+
+
+def _labels(labels: list[str]) -> str:
+    return "{" + ",".join(labels) + "}" if labels else ""
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _number(value: float) -> str:
+    return str(int(value)) if value == int(value) else repr(value)
+
+
+registry = Registry()
+
+route_latency = registry.register(
+    Histogram(
+        "route_handler_duration_seconds",
+        "Time spent in route handlers, after authentication.",
+        ("route",),
+    )
+)
+request_latency = registry.register(
+    Histogram(
+        "http_request_duration_seconds",
+        "Time spent handling requests, including authentication.",
+        ("endpoint",),
+    )
+)
+responses = registry.register(
+    Counter("http_responses_total", "Responses by endpoint and status code.", ("endpoint", "status"))
+)
+requests_in_flight = registry.register(
+    Gauge("http_requests_in_flight", "Requests currently being handled.")
+)
+backend_latency = registry.register(
+    Histogram(
+        "backend_call_duration_seconds",
+        "Latency of calls to Firestore, Firebase Auth, Cloud Storage and HTTP services.",
+        ("service", "operation"),
+    )
+)
+backend_errors = registry.register(
+    Counter("backend_call_errors_total", "Failed backend calls.", ("service", "operation"))
+)
+cache_lookups = registry.register(
+    Counter("cache_lookups_total", "Cache lookups by cache and result (hit or miss).", ("cache", "result"))
+)
+change_feed_subscribers = registry.register(
+    Gauge("change_feed_subscribers", "Clients connected to the household change feed.")
+)
+change_feed_listeners = registry.register(
+    Gauge("change_feed_listeners", "Households with active change feed snapshot listeners.")
+)
@@ -0,0 +1,81 @@
+import csv
+import io
+import json
+from typing import Any, Callable, Dict, Iterable, Iterator
+
+from product_manager import Product
+
+# Columns of an export. The first ones match the columns understood by the
+# product import, so an export can be imported into another household.
+EXPORT_FIELDS = (
+    "product_name",
+    "expiration_date",
+    "location",
+    "category",
+    "barcode",
+    "note",
+    "opened",
+    "product_id",
+    "creation_date",
+    "wasted",
+    "wasted_date",
+    "used",
+    "used_date",
+)
+
+# Filters for the "status" export option.
+STATUS_FILTERS: Dict[str, Callable[[Product], bool]] = {
+    "all": lambda product: True,
+    "active": lambda product: not product.wasted and not product.used,
+    "wasted": lambda product: product.wasted,
+    "used": lambda product: product.used,
+}
+
+EXPORT_MIMETYPES = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+}
+
+DATE_FORMAT = "%Y-%m-%d"
+
+
+def export_row(product: Product) -> Dict[str, Any]:
+    return {
+        "product_name": product.product_name,
+        "expiration_date": product.expiration_str(DATE_FORMAT) or "",
+        "location": product.location,
+        "category": product.category,
+        "barcode": product.barcode,
+        "note": product.note or "",
+        "opened": product.opened,
+        "product_id": product.id,
+        "creation_date": product.creation_str(DATE_FORMAT),
+        "wasted": product.wasted,
+        "wasted_date": product.wasted_date_str(DATE_FORMAT) or "",
+        "used": product.used,
+        "used_date": product.used_date_str(DATE_FORMAT) or "",
+    }
+
+
+def csv_lines(products: Iterable[Product]) -> Iterator[str]:
+    """Yields the CSV header immediately, followed by one line per product."""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_FIELDS)
+    writer.writeheader()
+    yield buffer.getvalue()
+    for product in products:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerow(export_row(product))
+        yield buffer.getvalue()
+
+
+def ndjson_lines(products: Iterable[Product]) -> Iterator[str]:
+    for product in products:
+        yield json.dumps(export_row(product)) + "\n"
+
+
+LINE_WRITERS: Dict[str, Callable[[Iterable[Product]], Iterator[str]]] = {
+    "csv": csv_lines,
+    "ndjson": ndjson_lines,
+}
@@ -0,0 +1,180 @@
+import csv
+import json
+from datetime import datetime
+from functools import lru_cache
+from typing import Any, Dict, IO, Iterator, Tuple
+
+from absl import logging as log
+
+from household_manager import Household
+from product_manager import Product, ProductManager
+
+
+class ImportRowException(Exception):
+    """Raised when an import row is invalid."""
+
+
+class ImportFileException(Exception):
+    """Raised when the rest of an import file cannot be read, e.g. it is not UTF-8."""
+
+    def __init__(self, line_num: int, message: str) -> None:
+        super().__init__(message)
+        self.line_num = line_num
+
+
+@lru_cache(maxsize=4096)
+def parse_import_date_cached(date_str: str) -> int:
+    # Spreadsheets repeat the same dates over and over, so avoid re-running
+    # strptime for each row.
+    return ProductManager.parse_import_date(date_str)
+
+
+def iter_decoded_lines(stream: IO[bytes], encoding: str) -> Iterator[str]:
+    """Yields the decoded lines of a file. Raises ImportFileException."""
+    for line_num, line in enumerate(stream, 1):
+        try:
+            yield line.decode(encoding)
+        except UnicodeDecodeError as err:
+            raise ImportFileException(line_num, f"Line is not UTF-8 encoded: {err}")
+
+
+def iter_csv_rows(stream: IO[bytes]) -> Iterator[Tuple[int, Dict[str, Any]]]:
+    """
+    Yields (line number, row) for each data row of a CSV file with a header.
+    Raises ImportFileException.
+    """
+    reader = csv.DictReader(iter_decoded_lines(stream, "utf-8-sig"))
+    try:
+        for row in reader:
+            yield reader.line_num, row
+    except csv.Error as err:
+        # line_num does not count the line that failed to parse yet.
+        raise ImportFileException(reader.line_num + 1, f"Invalid CSV: {err}")
+
+
+def iter_ndjson_rows(stream: IO[bytes]) -> Iterator[Tuple[int, Dict[str, Any]]]:
+    """
+    Yields (line number, row) for each non-empty line of a NDJSON file.
+    Raises ImportFileException.
+    """
+    for line_num, line in enumerate(iter_decoded_lines(stream, "utf-8"), 1):
+        if line.strip():
+            yield line_num, ndjson_row(line)
+
+
+def ndjson_row(line: str) -> Dict[str, Any]:
+    try:
+        row = json.loads(line)
+    except ValueError as err:
+        return {"__error__": f"Invalid JSON: {err}"}
+    if not isinstance(row, dict):
+        return {"__error__": "Expected a JSON object"}
+    return row
+
+
+# Maps the supported file formats to their row readers.
+ROW_READERS = {
+    "csv": iter_csv_rows,
+    "ndjson": iter_ndjson_rows,
+    "jsonl": iter_ndjson_rows,
+}
+
+
+def parse_bool(value: Any) -> bool:
+    if isinstance(value, bool):
+        return value
+    return str(value or "").strip().lower() in ("1", "true", "yes", "y")
+
+
+class ProductImporter:
+    """
+    Validates import rows against a household and stores them in chunks of at
+    most ProductManager.BATCH_LIMIT products. Only one chunk is held in memory
+    at a time.
+    """
+
+    def __init__(
+        self,
+        product_mgr: ProductManager,
+        household: Household,
+        chunk_size: int = ProductManager.BATCH_LIMIT,
+    ) -> None:
+        self.__product_mgr = product_mgr
+        self.__household = household
+        self.__chunk_size = min(chunk_size, ProductManager.BATCH_LIMIT)
+        self.__locations = set(household.locations)
+        self.__categories = set(household.categories)
+
+    def run(self, rows: Iterator[Tuple[int, Dict[str, Any]]]) -> Iterator[dict]:
+        """
+        Imports the given rows and yields progress events: one "error" event per
+        rejected row, one "progress" event per committed chunk and a final "done"
+        event with the totals. If the rest of the file cannot be read, the rows
+        before are still imported and a "fatal" error event precedes "done".
+        """
+        totals = {"processed": 0, "imported": 0, "failed": 0}
+        chunk: list[Product] = []
+        try:
+            for line_num, row in rows:
+                totals["processed"] += 1
+                try:
+                    chunk.append(self.product_from_row(row))
+                except ImportRowException as err:
+                    totals["failed"] += 1
+                    yield {"type": "error", "line": line_num, "error": str(err)}
+                if len(chunk) >= self.__chunk_size:
+                    yield from self.__flush(chunk, totals)
+                    chunk = []
+        except ImportFileException as err:
+            log.error("[%s] Import stopped at line %d, %s", self.__household.id, err.line_num, err)
+            yield {"type": "error", "line": err.line_num, "error": str(err), "fatal": True}
+        if chunk:
+            yield from self.__flush(chunk, totals)
+        log.info(
+            "[%s] Imported %d of %d products",
+            self.__household.id,
+            totals["imported"],
+            totals["processed"],
+        )
+        yield {"type": "done", **totals}
+
+    def product_from_row(self, row: Dict[str, Any]) -> Product:
+        if "__error__" in row:
+            raise ImportRowException(row["__error__"])
+        product_name = str(row.get("product_name") or "").strip()
+        if not product_name:
+            raise ImportRowException("product_name is required")
+        location = str(row.get("location") or "").strip()
+        if location and location not in self.__locations:
+            raise ImportRowException(f"Unknown location '{location}'")
+        category = str(row.get("category") or "").strip()
+        if category and category not in self.__categories:
+            raise ImportRowException(f"Unknown category '{category}'")
+        expiration_date = str(row.get("expiration_date") or "").strip()
+        try:
+            expires = parse_import_date_cached(expiration_date) if expiration_date else 0
+        except ValueError:
+            raise ImportRowException(f"Invalid expiration_date '{expiration_date}'")
+
+        return Product(
+            "",  # Generated when stored.
+            barcode=str(row.get("barcode") or "").strip(),
+            category=category,
+            created=int(datetime.utcnow().timestamp() * 1000),
+            expires=expires,
+            location=location,
+            product_name=product_name,
+            household_id=self.__household.id,
+            wasted=False,
+            wasted_timestamp=0,
+            note=str(row.get("note") or ""),
+            opened=parse_bool(row.get("opened")),
+        )
+
+    def __flush(self, chunk: list[Product], totals: Dict[str, int]) -> Iterator[dict]:
+        if self.__product_mgr.add_products(chunk):
+            totals["imported"] += len(chunk)
+        else:
+            totals["failed"] += len(chunk)
+            yield {"type": "error", "error": f"Unable to store {len(chunk)} products"}
+        yield {"type": "progress", **totals}
@@ -1,12 +1,23 @@
 from datetime import datetime
+import heapq
 import uuid
-from typing import Any, Dict
+from typing import Any, Dict, Iterator, Protocol
 
 from absl import logging as log
+from google.api_core.datetime_helpers import DatetimeWithNanoseconds
+from google.api_core.exceptions import FailedPrecondition, NotFound
 from google.cloud.firestore_v1 import Query, DocumentSnapshot
 from google.cloud.firestore_v1.base_query import FieldFilter
 
 
+class ProductNotFoundException(Exception):
+    """Raised when a product to be patched does not exist."""
+
+
+class ProductConflictException(Exception):
+    """Raised when a product was modified after the expected update time."""
+
+
 class Product:
     def __init__(
         self,
@@ -25,6 +36,8 @@ class Product:
         opened: bool = False,
         used: bool = False,
         used_timestamp: int = 0,
+        update_time: datetime | None = None,
+        thumbnail_url: str | None = None,
     ) -> None:
         self.id = id
         self.barcode = barcode
@@ -41,6 +54,10 @@ class Product:
         self.opened = opened
         self.used = used
         self.used_timestamp = used_timestamp
+        # Server-side time of the last write, only set for products read from the DB.
+        self.update_time = update_time
+        # Small version of the image for list views.
+        self.thumbnail_url = thumbnail_url
 
     @property
     def does_expire(self) -> bool:
@@ -59,6 +76,7 @@ class Product:
         yield "wasted_timestamp", self.wasted_timestamp
         yield "note", self.note
         yield "image_url", self.image_url
+        yield "thumbnail_url", self.thumbnail_url
         yield "opened", self.opened
         yield "used", self.used
         yield "used_timestamp", self.used_timestamp
@@ -86,36 +104,76 @@ class Product:
             return None
         return datetime.utcfromtimestamp(self.used_timestamp / 1000).strftime(format)
 
+    def update_time_str(self) -> str | None:
+        return ProductManager.format_update_time(self.update_time)
+
+
+class ProductListener(Protocol):
+    """Gets notified about successful product writes, see ProductManager.add_listener()."""
+
+    def on_product_added(self, product: Product) -> None: ...
+
+    def on_product_patched(self, product_id: str, fields: Dict[str, Any]) -> None: ...
+
+    def on_product_deleted(self, product_id: str) -> None: ...
+
 
 class ProductManager:
+    # Maximum number of writes Firestore accepts in a single batch.
+    BATCH_LIMIT = 500
+    # Moving a product to the archive takes two writes (set + delete).
+    ARCHIVE_BATCH_SIZE = BATCH_LIMIT // 2
+
     def __init__(self, firestore) -> None:
         self.__db = firestore
+        self.__listeners: list[ProductListener] = []
+
+    def add_listener(self, listener: ProductListener) -> None:
+        self.__listeners.append(listener)
 
     def get_product(self, id: str) -> Product | None:
+        """Returns a live or archived product, None if it does not exist."""
         if id is None or id.isspace():
             log.error("get_product(): id must not be empty")
             return None
         try:
-            data = self.__collection().document(id).get()
-            if data is None:
-                log.error("[%s] Cannot find product", id)
-                return None
-            return self.__product_from_dict(data)
+            for collection in (self.__collection(), self.__archive_collection()):
+                doc = collection.document(id).get()
+                if doc.exists:
+                    return self.product_from_dict(doc)
+            log.error("[%s] Cannot find product", id)
+            return None
         except Exception as err:
             log.error("[%s] Unable to fetch product data, %s", id, err)
             return None
 
+    def get_image_url(self, id: str) -> tuple[str | None, datetime] | None:
+        """
+        Returns the image URL and update time of a product, reading only the
+        image_url field. Returns None if the product does not exist.
+        """
+        if id is None or id.isspace():
+            log.error("get_image_url(): id must not be empty")
+            return None
+        try:
+            for collection in (self.__collection(), self.__archive_collection()):
+                doc = collection.document(id).get(field_paths=["image_url"])
+                if doc.exists:
+                    return (doc.to_dict() or {}).get("image_url"), doc.update_time
+            log.error("[%s] Cannot find product", id)
+            return None
+        except Exception as err:
+            log.error("[%s] Unable to fetch product image url, %s", id, err)
+            return None
+
     def get_household_products(self, household_id: str) -> list[Product]:
         if household_id is None or household_id.isspace():
             log.error("get_household_products(): uid must not be empty")
             return []
         try:
             results = []
-            query: Query = self.__collection().where(
-                filter=FieldFilter("household_id", "==", household_id)
-            )
-            for product in query.stream():
-                results.append(self.__product_from_dict(product))
+            for product in self.household_products_query(household_id).stream():
+                results.append(self.product_from_dict(product))
             return results
         except Exception as err:
             log.error(
@@ -123,6 +181,65 @@ class ProductManager:
             )
             return []
 
+    def household_products_query(self, household_id: str) -> Query:
+        """The active products of a household (archived ones are in another collection)."""
+        return self.__collection().where(
+            filter=FieldFilter("household_id", "==", household_id)
+        )
+
+    def stream_household_products(
+        self,
+        household_id: str,
+        created_from: int | None = None,
+        created_to: int | None = None,
+        page_size: int = 500,
+    ) -> Iterator[Product]:
+        """
+        Yields the live and archived products of a household ordered by
+        creation time, fetching one page at a time with query cursors so only
+        a single page per collection is held in memory. The optional bounds
+        (epoch millis) are inclusive. The queries need a composite index on
+        household_id and created in both collections, with or without the
+        bounds.
+        """
+        if household_id is None or household_id.isspace():
+            log.error("stream_household_products(): household_id must not be empty")
+            return
+        yield from heapq.merge(
+            self.__stream_pages(self.__collection(), household_id, created_from, created_to, page_size),
+            self.__stream_pages(
+                self.__archive_collection(), household_id, created_from, created_to, page_size
+            ),
+            key=lambda product: product.created,
+        )
+
+    def __stream_pages(
+        self,
+        collection: Any,
+        household_id: str,
+        created_from: int | None,
+        created_to: int | None,
+        page_size: int,
+    ) -> Iterator[Product]:
+        query: Query = collection.where(
+            filter=FieldFilter("household_id", "==", household_id)
+        )
+        if created_from is not None:
+            query = query.where(filter=FieldFilter("created", ">=", created_from))
+        if created_to is not None:
+            query = query.where(filter=FieldFilter("created", "<=", created_to))
+        query = query.order_by("created").limit(page_size)
+
+        last_doc: DocumentSnapshot | None = None
+        while True:
+            page = query.start_after(last_doc) if last_doc is not None else query
+            docs = list(page.stream())
+            for doc in docs:
+                yield self.product_from_dict(doc)
+            if len(docs) < page_size:
+                return
+            last_doc = docs[-1]
+
     def add_product(self, product: Product) -> bool:
         if product is None:
             log.error("add_product(): product is missing")
@@ -133,19 +250,171 @@ class ProductManager:
         except Exception as err:
             log.error("[%s] Unable to store new product: %s", product.product_name, err)
             return False
+        product.id = pid
+        for listener in self.__listeners:
+            listener.on_product_added(product)
+        return True
+
+    def add_products(self, products: list[Product]) -> bool:
+        """Stores up to BATCH_LIMIT new products with a single batched commit."""
+        if not products:
+            return True
+        if len(products) > self.BATCH_LIMIT:
+            log.error("add_products(): at most %d products per batch", self.BATCH_LIMIT)
+            return False
+        batch = self.__db.batch()
+        for product in products:
+            product.id = str(uuid.uuid4()) if not product.id else product.id
+            batch.set(self.__collection().document(product.id), dict(product))
+        try:
+            batch.commit()
+        except Exception as err:
+            log.error("Unable to store %d products: %s", len(products), err)
+            return False
+        for listener in self.__listeners:
+            for product in products:
+                listener.on_product_added(product)
         return True
 
+    def patch(
+        self, id: str, fields: Dict[str, Any], update_time: datetime | None = None
+    ) -> datetime | None:
+        """
+        Updates only the given fields of a product with a single write. If
+        update_time is given, the write only succeeds if the product was not
+        modified since then (optimistic concurrency).
+        Returns the new update time, or None if the write failed.
+        Raises ProductNotFoundException or ProductConflictException.
+        """
+        if id is None or id.isspace():
+            log.error("patch(): id must not be empty")
+            return None
+        if not fields:
+            log.error("patch(): fields must not be empty")
+            return None
+        option = (
+            self.__db.write_option(last_update_time=update_time)
+            if update_time is not None
+            else None
+        )
+        try:
+            try:
+                result = self.__collection().document(id).update(fields, option=option)
+            except NotFound:
+                # Archived products can still be edited from the wasted/used lists.
+                result = self.__archive_collection().document(id).update(
+                    fields, option=option
+                )
+        except NotFound:
+            raise ProductNotFoundException(id)
+        except FailedPrecondition:
+            raise ProductConflictException(id)
+        except Exception as err:
+            log.error("[%s] Unable to patch product: %s", id, err)
+            return None
+        for listener in self.__listeners:
+            listener.on_product_patched(id, fields)
+        return result.update_time
+
     def delete_product(self, id: str) -> bool:
         if id is None or id.isspace():
             log.error("delete_product(): id must not be empty")
             return False
         try:
-            self.__collection().document(id).delete()
+            # The product may live in either collection, deleting a missing
+            # document is a no-op.
+            batch = self.__db.batch()
+            batch.delete(self.__collection().document(id))
+            batch.delete(self.__archive_collection().document(id))
+            batch.commit()
         except Exception as err:
             log.error("Unable to delete product: %s", err)
             return False
+        for listener in self.__listeners:
+            listener.on_product_deleted(id)
         return True
 
+    def archive_products(self, cutoff: int, limit: int = ARCHIVE_BATCH_SIZE) -> int:
+        """
+        Moves up to `limit` products that were wasted or used before `cutoff`
+        (epoch millis) from the live collection to the archive collection with
+        a single batch. Returns the number of archived products.
+        """
+        limit = min(limit, self.ARCHIVE_BATCH_SIZE)
+        try:
+            docs: list[DocumentSnapshot] = []
+            for flag, timestamp in (
+                ("wasted", "wasted_timestamp"),
+                ("used", "used_timestamp"),
+            ):
+                if len(docs) >= limit:
+                    break
+                query: Query = (
+                    self.__collection()
+                    .where(filter=FieldFilter(flag, "==", True))
+                    .where(filter=FieldFilter(timestamp, "<", cutoff))
+                    .limit(limit - len(docs))
+                )
+                docs.extend(query.stream())
+            if not docs:
+                return 0
+
+            # A product can be both wasted and used, only move it once.
+            unique_docs = {doc.id: doc for doc in docs}
+            batch = self.__db.batch()
+            for doc in unique_docs.values():
+                batch.set(self.__archive_collection().document(doc.id), doc.to_dict())
+                # Fails the batch if the product was modified since the query,
+                # the next run archives the current version (or not at all).
+                batch.delete(
+                    doc.reference,
+                    option=self.__db.write_option(last_update_time=doc.update_time),
+                )
+            batch.commit()
+            return len(unique_docs)
+        except Exception as err:
+            log.error("archive_products(): Unable to archive products: %s", err)
+            return 0
+
+    def get_archived_products(
+        self,
+        household_id: str,
+        status: str,
+        page_size: int = 100,
+        cursor: str | None = None,
+    ) -> tuple[list[Product], str | None]:
+        """
+        Returns a page of archived "wasted" or "used" products of a household,
+        newest first, and the cursor for the next page (None on the last page).
+        """
+        if household_id is None or household_id.isspace():
+            log.error("get_archived_products(): household_id must not be empty")
+            return [], None
+        if status not in ("wasted", "used"):
+            log.error("get_archived_products(): unknown status '%s'", status)
+            return [], None
+        try:
+            query: Query = (
+                self.__archive_collection()
+                .where(filter=FieldFilter("household_id", "==", household_id))
+                .where(filter=FieldFilter(status, "==", True))
+                .order_by("created", direction=Query.DESCENDING)
+                .limit(page_size)
+            )
+            if cursor:
+                last_doc = self.__archive_collection().document(cursor).get()
+                if last_doc.exists:
+                    query = query.start_after(last_doc)
+            docs = list(query.stream())
+            products = [self.product_from_dict(doc) for doc in docs]
+            next_cursor = docs[-1].id if len(docs) == page_size else None
+            return products, next_cursor
+        except Exception as err:
+            log.error(
+                "[%s] Unable to fetch archived products, %s", household_id, err
+            )
+            return [], None
+
     def num_products(self) -> int:
         try:
             products = self.__collection().get()
@@ -157,7 +426,13 @@ class ProductManager:
     def __collection(self):
         return self.__db.collection("products")
 
-    def __product_from_dict(self, doc: DocumentSnapshot) -> Product:
+    def __archive_collection(self):
+        # Wasted and used products that are old enough to be moved out of the
+        # live collection, see archive_products().
+        return self.__db.collection("products_archive")
+
+    @staticmethod
+    def product_from_dict(doc: DocumentSnapshot) -> Product:
         dict_data: Dict[str, Any] | None = doc.to_dict()
         if dict_data is None:
             raise ValueError(f"Document {doc.id} has no data")
@@ -185,6 +460,8 @@ class ProductManager:
             opened,
             used,
             used_timestamp,
+            doc.update_time,
+            dict_data.get("thumbnail_url"),
         )
 
     @classmethod
@@ -197,3 +474,23 @@ class ProductManager:
 
         epoch_obj = datetime.utcfromtimestamp(0)
         return int((date_obj - epoch_obj).total_seconds() * 1000)
+
+    @classmethod
+    def format_update_time(cls, update_time: datetime | None) -> str | None:
+        if update_time is None:
+            return None
+        if isinstance(update_time, DatetimeWithNanoseconds):
+            return update_time.rfc3339()
+        return update_time.isoformat()
+
+    @classmethod
+    def parse_update_time(cls, time_str: str | None) -> datetime | None:
+        """
+        Parses an RFC 3339 update time as returned by Product.update_time_str().
+        Raises ValueError if it is malformed.
+        """
+        if not time_str:
+            return None
+        if not isinstance(time_str, str):
+            raise ValueError(f"Invalid update time {time_str!r}")
+        return DatetimeWithNanoseconds.from_rfc3339(time_str)
@@ -0,0 +1,198 @@
+"""
+Opt-in request profiling. Every `sample_every`-th request runs under cProfile,
+and requests taking longer than `slow_ms` are captured with a stack sampler
+(a background thread that periodically records the stacks of the requests in
+flight). The top frames of captured requests are kept, together with the
+route and the backend call breakdown, in a bounded ring buffer.
+
+Unsampled requests only pay for a counter increment and, if slow request
+capture is enabled, a dict insert and delete.
+
+Only one request is profiled with cProfile at a time: since Python 3.12 a
+second enabled profiler raises ValueError. A sampled request that arrives
+while another one is profiled is handled like an unsampled one.
+"""
+
+from collections import Counter, deque
+import cProfile
+from datetime import datetime
+import itertools
+import os
+import pstats
+import sys
+import threading
+import time
+from typing import Any, Dict
+
+from absl import logging as log
+
+
+class RequestProfile:
+    def __init__(self, profiler: cProfile.Profile | None) -> None:
+        self.start_time = time.perf_counter()
+        self.thread_id = threading.get_ident()
+        self.profiler = profiler
+        # Stack sampler results: frame -> number of samples it was on the stack.
+        self.samples: Counter = Counter()
+        self.num_samples = 0
+
+
+class RequestProfiler:
+    # Number of frames stored per captured request.
+    TOP_FRAMES = 25
+
+    def __init__(
+        self,
+        sample_every: int = 0,
+        slow_ms: float = 0,
+        max_entries: int = 50,
+        sample_interval_ms: float = 10,
+    ) -> None:
+        self.__sample_every = sample_every
+        self.__slow_s = slow_ms / 1000
+        self.__sample_interval_s = sample_interval_ms / 1000
+        self.__counter = itertools.count(1)
+        self.__entries: deque[Dict[str, Any]] = deque(maxlen=max_entries)
+        # Thread ID -> profile of the request handled by that thread.
+        self.__active: Dict[int, RequestProfile] = {}
+        self.__lock = threading.Lock()
+        # Held while a request runs under cProfile.
+        self.__cprofile_lock = threading.Lock()
+        self.__sampler: threading.Thread | None = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.__sample_every > 0 or self.__slow_s > 0
+
+    def start(self) -> RequestProfile | None:
+        """Call at the start of a request; returns None if it is not tracked."""
+        if not self.enabled:
+            return None
+        profiler = None
+        if self.__sample_every > 0 and next(self.__counter) % self.__sample_every == 0:
+            profiler = self.__enable_cprofile()
+        profile = RequestProfile(profiler)
+        if profiler is not None:
+            return profile
+        if self.__slow_s <= 0:
+            return None
+        self.__ensure_sampler()
+        with self.__lock:
+            self.__active[profile.thread_id] = profile
+        return profile
+
+    def finish(
+        self,
+        profile: RequestProfile | None,
+        route: str | None,
+        path: str,
+        status: int | None,
+        backend_calls: Dict[str, Any] | None,
+    ) -> None:
+        """Call at the end of a request with the profile returned by start()."""
+        if profile is None:
+            return
+        duration_s = time.perf_counter() - profile.start_time
+        if profile.profiler is not None:
+            profile.profiler.disable()
+            self.__cprofile_lock.release()
+            reason = "sampled"
+            top_frames = self.__profiler_frames(profile.profiler)
+        else:
+            with self.__lock:
+                self.__active.pop(profile.thread_id, None)
+            if duration_s < self.__slow_s:
+                return
+            reason = "slow"
+            top_frames = [
+                {"frame": frame, "samples": num}
+                for frame, num in profile.samples.most_common(self.TOP_FRAMES)
+            ]
+        entry = {
+            "time": datetime.utcnow().isoformat() + "Z",
+            "reason": reason,
+            "route": route,
+            "path": path,
+            "status": status,
+            "duration_ms": round(duration_s * 1000, 2),
+            "backend_calls": backend_calls,
+            "top_frames": top_frames,
+        }
+        if reason == "slow":
+            entry["stack_samples"] = profile.num_samples
+            entry["sample_interval_ms"] = self.__sample_interval_s * 1000
+        self.__entries.append(entry)
+
+    def entries(self) -> list[Dict[str, Any]]:
+        """Returns the captured requests, most recent first."""
+        return list(reversed(self.__entries))
+
+    def __enable_cprofile(self) -> cProfile.Profile | None:
+        """Returns an enabled profiler, None if another request is being profiled."""
+        if not self.__cprofile_lock.acquire(blocking=False):
+            return None
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError as err:
+            # Another profiler (e.g. a debugger) is active.
+            self.__cprofile_lock.release()
+            log.warning("Unable to profile request: %s", err)
+            return None
+        return profiler
+
+    def __profiler_frames(self, profiler: cProfile.Profile) -> list[Dict[str, Any]]:
+        stats = pstats.Stats(profiler).stats  # type: ignore[attr-defined]
+        # (file, line, function) -> (primitive calls, calls, own time, cumulative time, callers)
+        by_cumulative = sorted(stats.items(), key=lambda item: item[1][3], reverse=True)
+        return [
+            {
+                "frame": _frame_name(filename, line, function),
+                "calls": calls,
+                "own_ms": round(own_time * 1000, 3),
+                "cumulative_ms": round(cumulative_time * 1000, 3),
+            }
+            for (filename, line, function), (_, calls, own_time, cumulative_time, _) in by_cumulative[
+                : self.TOP_FRAMES
+            ]
+        ]
+
+    def __ensure_sampler(self) -> None:
+        if self.__sampler is not None:
+            return
+        with self.__lock:
+            if self.__sampler is None:
+                self.__sampler = threading.Thread(
+                    target=self.__sample_loop, name="request-sampler", daemon=True
+                )
+                self.__sampler.start()
+
+    def __sample_loop(self) -> None:
+        while True:
+            time.sleep(self.__sample_interval_s)
+            if not self.__active:
+                continue
+            try:
+                frames = sys._current_frames()
+                with self.__lock:
+                    active = list(self.__active.values())
+                for profile in active:
+                    frame = frames.get(profile.thread_id)
+                    if frame is None:
+                        continue
+                    # Count each function once per sample, like a cumulative time.
+                    seen = set()
+                    while frame is not None:
+                        code = frame.f_code
+                        seen.add(_frame_name(code.co_filename, code.co_firstlineno, code.co_name))
+                        frame = frame.f_back
+                    profile.samples.update(seen)
+                    profile.num_samples += 1
+            except Exception as err:
+                log.error("Request stack sampling failed: %s", err)
+
+
+def _frame_name(filename: str, line: int, function: str) -> str:
+    # Shorten the paths of installed packages to their last two components.
+    short = os.sep.join(filename.split(os.sep)[-2:])
+    return f"{short}:{line}({function})"
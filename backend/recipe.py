@@ -1,9 +1,12 @@
-from openai import OpenAI
 from secrets_manager import SecretsManager
 
 
 class RecipeGenerator:
     def __init__(self, secrets: SecretsManager) -> None:
+        # Importing openai takes most of the app's import time, so it is only
+        # imported once a recipe is requested.
+        from openai import OpenAI
+
         self.__client = OpenAI(api_key=secrets.get_openai_api_key())
 
     def generate_recipe(self, product_names):
@@ -0,0 +1,70 @@
+"""
+Values memoized for the duration of a request, e.g. the household read by the
+membership check and read again by the route. Like the request stats (see
+request_stats.py) the cache lives in a context variable; /batch sub-requests
+share the cache of the batch request. Outside of a request nothing is cached.
+
+Managers must discard the entries of the documents they write.
+"""
+
+from contextvars import ContextVar
+import threading
+from typing import Any, Callable, Dict, Hashable, TypeVar
+
+import metrics
+
+T = TypeVar("T")
+
+_hits = metrics.cache_lookups.labels("request", "hit")
+_misses = metrics.cache_lookups.labels("request", "miss")
+
+
+class RequestCache:
+    def __init__(self) -> None:
+        self.__values: Dict[Hashable, Any] = {}
+        self.__lock = threading.Lock()
+
+    def get_or_load(self, key: Hashable, load: Callable[[], T]) -> T:
+        with self.__lock:
+            if key in self.__values:
+                _hits.inc()
+                return self.__values[key]
+        _misses.inc()
+        # Loaded outside of the lock, concurrent calls may both load.
+        value = load()
+        with self.__lock:
+            self.__values[key] = value
+        return value
+
+    def discard(self, key: Hashable) -> None:
+        with self.__lock:
+            self.__values.pop(key, None)
+
+
+_current: ContextVar[RequestCache | None] = ContextVar("request_cache", default=None)
+
+
+def start(cache: RequestCache | None = None) -> RequestCache:
+    """Starts caching for the current request, in the given cache or a new one."""
+    cache = cache if cache is not None else RequestCache()
+    _current.set(cache)
+    return cache
+
+
+def stop() -> None:
+    _current.set(None)
+
+
+def current() -> RequestCache | None:
+    return _current.get()
+
+
+def memoize(key: Hashable, load: Callable[[], T]) -> T:
+    cache = _current.get()
+    return load() if cache is None else cache.get_or_load(key, load)
+
+
+def discard(key: Hashable) -> None:
+    cache = _current.get()
+    if cache is not None:
+        cache.discard(key)
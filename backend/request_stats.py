@@ -0,0 +1,244 @@
+"""
+Per-request accounting of the calls made to backend services (Firestore,
+Firebase Auth, Cloud Storage and outgoing HTTP): number of calls per operation,
+documents read and time spent per service.
+
+The stats of the request being handled live in a context variable, so code
+deep inside the managers does not need to pass anything around. Calls made
+outside of a request (e.g. scheduled jobs) only show up in the backend
+latency metrics.
+"""
+
+from collections import Counter, defaultdict
+from contextvars import ContextVar
+import functools
+import json
+import threading
+import time
+from typing import Any, Callable, Dict, Iterator
+
+import metrics
+
+
+class RequestStats:
+    def __init__(self) -> None:
+        self.calls: Counter = Counter()  # "service.operation" -> count
+        self.docs_read = 0
+        self.time_ms: Dict[str, float] = defaultdict(float)  # service -> time
+        self.__lock = threading.Lock()
+
+    def record(self, service: str, operation: str, elapsed_s: float, docs_read: int = 0) -> None:
+        with self.__lock:
+            self.calls[f"{service}.{operation}"] += 1
+            self.docs_read += docs_read
+            self.time_ms[service] += elapsed_s * 1000
+
+    def service_calls(self, service: str) -> int:
+        prefix = f"{service}."
+        return sum(num for name, num in self.calls.items() if name.startswith(prefix))
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "calls": dict(sorted(self.calls.items())),
+            "docs_read": self.docs_read,
+            "time_ms": {service: round(ms, 2) for service, ms in sorted(self.time_ms.items())},
+        }
+
+    def to_json(self) -> str:
+        return json.dumps(self.to_dict(), separators=(",", ":"))
+
+
+_current: ContextVar[RequestStats | None] = ContextVar("request_stats", default=None)
+
+
+def start(stats: RequestStats | None = None) -> RequestStats:
+    """Starts counting the calls of the current request, in the given stats or new ones."""
+    stats = stats if stats is not None else RequestStats()
+    _current.set(stats)
+    return stats
+
+
+def stop() -> RequestStats | None:
+    stats = _current.get()
+    _current.set(None)
+    return stats
+
+
+def current() -> RequestStats | None:
+    return _current.get()
+
+
+def record(
+    service: str, operation: str, elapsed_s: float, docs_read: int = 0, failed: bool = False
+) -> None:
+    metrics.backend_latency.labels(service, operation).observe(elapsed_s)
+    if failed:
+        metrics.backend_errors.labels(service, operation).inc()
+    stats = _current.get()
+    if stats is not None:
+        stats.record(service, operation, elapsed_s, docs_read)
+
+
+def tracked(service: str, operation: str, func: Callable) -> Callable:
+    """Wraps a function so each call is recorded as one `service.operation` call."""
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        start_time = time.perf_counter()
+        failed = True
+        try:
+            result = func(*args, **kwargs)
+            failed = False
+            return result
+        finally:
+            record(service, operation, time.perf_counter() - start_time, failed=failed)
+
+    wrapper.__request_stats_tracked__ = True  # type: ignore[attr-defined]
+    return wrapper
+
+
+def instrument(owner: Any, names: list[str], service: str) -> None:
+    """Replaces the named functions (or methods) of a module (or class) with tracked ones."""
+    for name in names:
+        func = getattr(owner, name, None)
+        if func is None or getattr(func, "__request_stats_tracked__", False):
+            continue
+        setattr(owner, name, tracked(service, name, func))
+
+
+def instrument_google_services() -> None:
+    """Tracks the Firebase Auth, Cloud Storage and `requests` HTTP calls."""
+    import requests
+    from firebase_admin import auth
+    from google.cloud.storage import Blob, Bucket
+
+    instrument(
+        auth,
+        [
+            "verify_id_token",
+            "get_user",
+            "get_users",
+            "get_user_by_email",
+            "list_users",
+            "create_user",
+            "update_user",
+            "delete_user",
+        ],
+        "auth",
+    )
+    instrument(
+        Blob,
+        [
+            "upload_from_file",
+            "upload_from_string",
+            "upload_from_filename",
+            "download_as_bytes",
+            "exists",
+            "reload",
+            "delete",
+            "make_public",
+        ],
+        "storage",
+    )
+    instrument(Bucket, ["get_blob", "delete_blob", "list_blobs"], "storage")
+    instrument(requests.Session, ["request"], "http")
+
+
+class InstrumentedFirestore:
+    """
+    Wraps a Firestore client (or anything implementing the same API) and
+    records document reads, queries, writes and batch commits. Collections,
+    queries, references and batches derived from it are wrapped as well.
+    """
+
+    # Methods that return another object to wrap.
+    BUILDERS = frozenset(
+        (
+            "collection",
+            "document",
+            "where",
+            "order_by",
+            "limit",
+            "limit_to_last",
+            "select",
+            "offset",
+            "start_at",
+            "start_after",
+            "end_at",
+            "end_before",
+            "batch",
+        )
+    )
+    WRITES = frozenset(("set", "update", "delete", "create", "add"))
+
+    def __init__(self, target: Any) -> None:
+        self._target = target
+
+    def __getattr__(self, name: str) -> Any:
+        attr = getattr(self._target, name)
+        if not callable(attr):
+            return attr
+        if name in self.BUILDERS:
+            return lambda *args, **kwargs: InstrumentedFirestore(attr(*_unwrap(args), **kwargs))
+        if name == "stream":
+            return lambda *args, **kwargs: self.__stream(attr(*args, **kwargs))
+        if name == "get":
+            return lambda *args, **kwargs: self.__get(attr, *args, **kwargs)
+        if name == "commit":
+            return lambda *args, **kwargs: self.__call("commit", attr, *args, **kwargs)
+        if name in self.WRITES and hasattr(self._target, "commit"):
+            # Batched writes are sent by commit().
+            return lambda *args, **kwargs: attr(*_unwrap(args), **kwargs)
+        if name in self.WRITES:
+            return lambda *args, **kwargs: self.__call("write", attr, *args, **kwargs)
+        return attr
+
+    def __get(self, get: Callable, *args, **kwargs) -> Any:
+        start_time = time.perf_counter()
+        try:
+            result = get(*args, **kwargs)
+        except Exception:
+            record("firestore", "get", time.perf_counter() - start_time, failed=True)
+            raise
+        if isinstance(result, list):
+            # Query.get() returns all matching documents.
+            record("firestore", "query", time.perf_counter() - start_time, len(result))
+        else:
+            record("firestore", "get", time.perf_counter() - start_time, 1)
+        return result
+
+    def __stream(self, docs: Iterator) -> Iterator:
+        # Results are fetched while iterating, so time the iteration.
+        elapsed = 0.0
+        num = 0
+        failed = False
+        try:
+            while True:
+                start_time = time.perf_counter()
+                try:
+                    doc = next(docs)
+                except StopIteration:
+                    return
+                except Exception:
+                    failed = True
+                    raise
+                finally:
+                    elapsed += time.perf_counter() - start_time
+                num += 1
+                yield doc
+        finally:
+            record("firestore", "query", elapsed, num, failed)
+
+    def __call(self, operation: str, func: Callable, *args, **kwargs) -> Any:
+        start_time = time.perf_counter()
+        failed = True
+        try:
+            result = func(*_unwrap(args), **kwargs)
+            failed = False
+            return result
+        finally:
+            record("firestore", operation, time.perf_counter() - start_time, failed=failed)
+
+
+def _unwrap(args: tuple) -> list:
+    return [arg._target if isinstance(arg, InstrumentedFirestore) else arg for arg in args]
@@ -24,6 +24,13 @@ run_mypy() {
     return $?
 }
 
+# Checks that the hot routes stay within their backend call budgets.
+run_budgets() {
+    echo "Running backend call budget checks..."
+    python benchmarks/check_budgets.py 2>/dev/null
+    return $?
+}
+
 show_success() {
     echo -e "\n${GREEN}==========================================${NC}"
     echo -e "${GREEN}✅ All selected tests passed successfully!${NC}"
@@ -46,6 +53,7 @@ show_usage() {
     echo "  -b, --basic-flake8    Run basic flake8 checks"
     echo "  -c, --complex-flake8  Run complex flake8 checks"
     echo "  -m, --mypy           Run mypy type checks"
+    echo "  -r, --budgets        Run backend call budget checks"
     echo "  -a, --all            Run all tests (default if no options provided)"
     echo "  -h, --help           Show this help message"
     exit 1
@@ -60,6 +68,7 @@ if [ $# -eq 0 ]; then
     run_basic_flake8 || FAILED=1
     run_complex_flake8 || FAILED=1
     run_mypy || FAILED=1
+    run_budgets || FAILED=1
 else
     # Process arguments
     while [ $# -gt 0 ]; do
@@ -73,10 +82,14 @@ else
             -m|--mypy)
                 run_mypy || FAILED=1
                 ;;
+            -r|--budgets)
+                run_budgets || FAILED=1
+                ;;
             -a|--all)
                 run_basic_flake8 || FAILED=1
                 run_complex_flake8 || FAILED=1
                 run_mypy || FAILED=1
+                run_budgets || FAILED=1
                 ;;
             -h|--help)
                 show_usage
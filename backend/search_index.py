@@ -0,0 +1,213 @@
+from bisect import bisect_left
+from collections import OrderedDict
+import threading
+import time
+from typing import Any, Callable, Dict
+
+from absl import logging as log
+from rapidfuzz import fuzz, process
+
+import metrics
+from product_manager import Product
+
+_index_hits = metrics.cache_lookups.labels("household_search_index", "hit")
+_index_misses = metrics.cache_lookups.labels("household_search_index", "miss")
+
+
+class HouseholdSearchIndex:
+    """
+    Product names of a single household, searchable by prefix (of the name or
+    any of its words) and by fuzzy matching. Each name keeps the barcodes of
+    its products so suggestions can prefer a name's barcode.
+    """
+
+    # Minimum RapidFuzz ratio (0-100) of a fuzzy match.
+    FUZZY_SCORE_CUTOFF = 70
+
+    def __init__(self) -> None:
+        # product ID -> (name, barcode)
+        self.__products: Dict[str, tuple[str, str]] = {}
+        # name -> {barcode: number of products}
+        self.__names: Dict[str, Dict[str, int]] = {}
+        # Lookup tables derived from __names, rebuilt lazily after changes.
+        self.__dirty = True
+        self.__tokens: list[tuple[str, str]] = []  # sorted (lower token, name)
+        self.__sorted_names: list[str] = []
+        self.__fuzzy_keys: list[str] = []  # distinct lower tokens
+        self.__fuzzy_names: list[list[str]] = []  # names for each fuzzy key
+
+    def __len__(self) -> int:
+        return len(self.__products)
+
+    def has_product(self, product_id: str) -> bool:
+        return product_id in self.__products
+
+    def add(self, product_id: str, name: str, barcode: str) -> None:
+        self.remove(product_id)
+        if not name:
+            return
+        self.__products[product_id] = (name, barcode)
+        barcodes = self.__names.setdefault(name, {})
+        barcodes[barcode] = barcodes.get(barcode, 0) + 1
+        self.__dirty = True
+
+    def update(self, product_id: str, name: str | None, barcode: str | None) -> None:
+        if product_id not in self.__products:
+            return
+        old_name, old_barcode = self.__products[product_id]
+        self.add(
+            product_id,
+            name if name is not None else old_name,
+            barcode if barcode is not None else old_barcode,
+        )
+
+    def remove(self, product_id: str) -> None:
+        entry = self.__products.pop(product_id, None)
+        if entry is None:
+            return
+        name, barcode = entry
+        barcodes = self.__names[name]
+        barcodes[barcode] -= 1
+        if barcodes[barcode] == 0:
+            del barcodes[barcode]
+        if not barcodes:
+            del self.__names[name]
+        self.__dirty = True
+
+    def search(self, query: str, limit: int) -> list[Dict[str, str]]:
+        """
+        Returns up to `limit` suggestions: prefix matches in alphabetical order
+        first, followed by fuzzy matches ranked by score.
+        """
+        self.__rebuild()
+        query = query.strip().lower()
+        if not query:
+            return [self.__suggestion(name) for name in self.__sorted_names[:limit]]
+
+        matches: Dict[str, None] = {}  # Ordered set.
+        i = bisect_left(self.__tokens, (query, ""))
+        while (
+            i < len(self.__tokens)
+            and self.__tokens[i][0].startswith(query)
+            and len(matches) < limit
+        ):
+            matches[self.__tokens[i][1]] = None
+            i += 1
+
+        if len(matches) < limit:
+            # Match whole names and single words, so a typo in any word of a
+            # longer name is still found. The plain ratio is fast enough to
+            # scan thousands of keys per keystroke.
+            for _, _, idx in process.extract(
+                query,
+                self.__fuzzy_keys,
+                scorer=fuzz.ratio,
+                limit=limit,
+                score_cutoff=self.FUZZY_SCORE_CUTOFF,
+            ):
+                for name in self.__fuzzy_names[idx]:
+                    matches.setdefault(name, None)
+        return [self.__suggestion(name) for name in list(matches)[:limit]]
+
+    def __suggestion(self, name: str) -> Dict[str, str]:
+        # Prefer a barcode if any product with this name has one.
+        barcode = next((code for code in self.__names[name] if code), "")
+        return {"name": name, "barcode": barcode}
+
+    def __rebuild(self) -> None:
+        if not self.__dirty:
+            return
+        self.__sorted_names = sorted(self.__names)
+        tokens = []
+        for name in self.__sorted_names:
+            lower_name = name.lower()
+            tokens.append((lower_name, name))
+            tokens.extend((word, name) for word in lower_name.split()[1:])
+        tokens.sort()
+        self.__tokens = tokens
+
+        fuzzy: Dict[str, list[str]] = {}
+        for token, name in tokens:
+            fuzzy.setdefault(token, []).append(name)
+        self.__fuzzy_keys = list(fuzzy)
+        self.__fuzzy_names = list(fuzzy.values())
+        self.__dirty = False
+
+
+class ProductSearchIndex:
+    """
+    LRU cache of HouseholdSearchIndex instances. A household's index is built
+    from its products on the first search and then kept up to date through the
+    ProductManager listener callbacks. Indexes are rebuilt after MAX_AGE_S so
+    writes made through other server instances show up eventually.
+    """
+
+    MAX_AGE_S = 10 * 60
+
+    def __init__(
+        self,
+        load_products: Callable[[str], list[Product]],
+        max_households: int = 256,
+    ) -> None:
+        self.__load_products = load_products
+        self.__max_households = max_households
+        self.__lock = threading.Lock()
+        # household ID -> (build time, index), least recently used first.
+        self.__indexes: OrderedDict[str, tuple[float, HouseholdSearchIndex]] = (
+            OrderedDict()
+        )
+
+    def search(self, household_id: str, query: str, limit: int = 50) -> list[Dict[str, str]]:
+        index = self.__get_index(household_id)
+        with self.__lock:
+            return index.search(query, limit)
+
+    def on_product_added(self, product: Product) -> None:
+        with self.__lock:
+            entry = self.__indexes.get(product.household_id)
+            if entry is not None:
+                entry[1].add(product.id, product.product_name, product.barcode)
+
+    def on_product_patched(self, product_id: str, fields: Dict[str, Any]) -> None:
+        if "product_name" not in fields and "barcode" not in fields:
+            return
+        with self.__lock:
+            for _, index in self.__indexes.values():
+                if index.has_product(product_id):
+                    index.update(
+                        product_id, fields.get("product_name"), fields.get("barcode")
+                    )
+                    return
+
+    def on_product_deleted(self, product_id: str) -> None:
+        with self.__lock:
+            for _, index in self.__indexes.values():
+                index.remove(product_id)
+
+    def __get_index(self, household_id: str) -> HouseholdSearchIndex:
+        with self.__lock:
+            entry = self.__indexes.get(household_id)
+            if entry is not None and time.monotonic() - entry[0] < self.MAX_AGE_S:
+                self.__indexes.move_to_end(household_id)
+                _index_hits.inc()
+                return entry[1]
+        _index_misses.inc()
+
+        # Build outside of the lock, loading the products is a remote call.
+        start = time.monotonic()
+        index = HouseholdSearchIndex()
+        for product in self.__load_products(household_id):
+            index.add(product.id, product.product_name, product.barcode)
+        log.info(
+            "[%s] Built search index of %d products in %.1fms",
+            household_id,
+            len(index),
+            (time.monotonic() - start) * 1000,
+        )
+
+        with self.__lock:
+            self.__indexes[household_id] = (start, index)
+            self.__indexes.move_to_end(household_id)
+            while len(self.__indexes) > self.__max_households:
+                self.__indexes.popitem(last=False)
+        return index
@@ -1,9 +1,9 @@
 from absl import logging as log
+from concurrent.futures import Future, ThreadPoolExecutor
 import os
+import threading
 from dotenv import load_dotenv
 
-from google.cloud import secretmanager
-
 
 class SecretNotFoundException(Exception):
     """Raised when a secret was not found."""
@@ -11,6 +11,11 @@ class SecretNotFoundException(Exception):
 
 class SecretsManager:
     __cache: dict[str, str] = {}
+    # Secrets being resolved by prefetch().
+    __pending: dict[str, Future] = {}
+    __lock = threading.Lock()
+    __dotenv_loaded = False
+    __gcloud_client = None
 
     def __init__(self) -> None:
         self.__mapping = {
@@ -24,7 +29,21 @@ class SecretsManager:
                 "/run/secrets/firebase_web_api_key",
             ),
         }
-        pass
+
+    def prefetch(self, *ids: str) -> None:
+        """
+        Starts resolving the given secrets (all by default) in parallel, so
+        the later lookups do not wait for the Secret Manager one by one.
+        """
+        ids = ids or tuple(self.__mapping)
+        with self.__lock:
+            ids = tuple(id for id in ids if id not in self.__cache and id not in self.__pending)
+            if not ids:
+                return
+            executor = ThreadPoolExecutor(max_workers=len(ids), thread_name_prefix="secrets")
+            for id in ids:
+                self.__pending[id] = executor.submit(self.__get_internal, id)
+        executor.shutdown(wait=False)
 
     def get_openai_api_key(self) -> str:
         return self.__get_internal_cached("openai")
@@ -38,7 +57,14 @@ class SecretsManager:
     def __get_internal_cached(self, id: str) -> str:
         if id in self.__cache:
             return self.__cache[id]
-        value = self.__get_internal(id)
+        with self.__lock:
+            pending = self.__pending.get(id)
+        try:
+            value = pending.result() if pending is not None else self.__get_internal(id)
+        finally:
+            if pending is not None:
+                with self.__lock:
+                    self.__pending.pop(id, None)
         self.__cache[id] = value
         return value
 
@@ -85,7 +111,7 @@ class SecretsManager:
     def __get_from_env_file(self, env_name: str) -> str | None:
         """Attempts to load a secret from a .env file."""
         try:
-            load_dotenv()
+            self.__load_dotenv()
             key = os.environ.get(env_name)
             if key is not None and not key.isspace():
                 return key
@@ -93,9 +119,32 @@ class SecretsManager:
             log.info("Unable to read secret from .env file: %s", err)
         return None
 
+    def __load_dotenv(self) -> None:
+        # The .env file is only read once, by the first lookup.
+        if SecretsManager.__dotenv_loaded:
+            return
+        with self.__lock:
+            if not SecretsManager.__dotenv_loaded:
+                load_dotenv()
+                SecretsManager.__dotenv_loaded = True
+
+    def __get_gcloud_client(self):
+        # Created on first use and shared by all lookups; importing and
+        # creating the client is slow and not needed if no secret is in GCloud.
+        if SecretsManager.__gcloud_client is None:
+            with self.__lock:
+                if SecretsManager.__gcloud_client is None:
+                    from google.cloud import secretmanager
+
+                    SecretsManager.__gcloud_client = secretmanager.SecretManagerServiceClient()
+        return SecretsManager.__gcloud_client
+
     def __get_from_gcloud(self, secret_id) -> str | None:
-        # Create the Secret Manager client.
-        client = secretmanager.SecretManagerServiceClient()
+        try:
+            client = self.__get_gcloud_client()
+        except Exception as err:
+            log.warning(f"Unable to create the GCloud secrets client: {err}")
+            return None
 
         name = f"projects/pantryguardian-f8381/secrets/{secret_id}/versions/latest"
 
@@ -63,7 +63,7 @@ class ShoppingListManager:
             if data is None:
                 log.error("[%s] Cannot find shopping list item", id)
                 return None
-            return self.__item_from_dict(data)
+            return self.item_from_dict(data)
         except Exception as err:
             log.error("[%s] Unable to fetch shopping list item data, %s", id, err)
             return None
@@ -74,13 +74,8 @@ class ShoppingListManager:
             return []
         try:
             results = []
-            query: Query = self.__collection().where(
-                filter=FieldFilter("household_id", "==", household_id)
-            ).where(
-                filter=FieldFilter("completed", "==", False)
-            )
-            for item in query.stream():
-                results.append(self.__item_from_dict(item))
+            for item in self.household_shopping_list_query(household_id).stream():
+                results.append(self.item_from_dict(item))
             return results
         except Exception as err:
             log.error(
@@ -88,6 +83,14 @@ class ShoppingListManager:
             )
             return []
 
+    def household_shopping_list_query(self, household_id: str) -> Query:
+        """The open items of a household's shopping list."""
+        return self.__collection().where(
+            filter=FieldFilter("household_id", "==", household_id)
+        ).where(
+            filter=FieldFilter("completed", "==", False)
+        )
+
     def add_shopping_list_item(self, item: ShoppingListItem) -> bool:
         if item is None:
             log.error("add_shopping_list_item(): item is missing")
@@ -134,7 +137,8 @@ class ShoppingListManager:
     def __collection(self):
         return self.__db.collection("shopping_list")
 
-    def __item_from_dict(self, doc: DocumentSnapshot) -> ShoppingListItem:
+    @staticmethod
+    def item_from_dict(doc: DocumentSnapshot) -> ShoppingListItem:
         dict_data: Dict[str, Any] | None = doc.to_dict()
         if dict_data is None:
             raise ValueError(f"Document {doc.id} has no data")
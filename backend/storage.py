@@ -0,0 +1,83 @@
+"""
+Selects the document store the managers talk to. The managers only use the
+subset of the Firestore client API described by DocumentStore, which is
+implemented by google.cloud.firestore.Client and by LocalDocumentStore.
+"""
+
+import threading
+from typing import Any, Callable, Protocol
+
+from absl import logging as log
+
+from config import local_storage_latency_ms, local_storage_path, storage_backend
+
+
+class DocumentStore(Protocol):
+    def collection(self, collection_id: str) -> Any: ...
+
+    def batch(self) -> Any: ...
+
+    def write_option(self, **kwargs) -> Any: ...
+
+
+def uses_local_storage() -> bool:
+    return storage_backend in ("memory", "sqlite")
+
+
+def create_document_store() -> DocumentStore:
+    """
+    Returns the configured document store. For "firestore", firebase_admin
+    must already be initialized.
+    """
+    if storage_backend == "memory":
+        from local_store import LocalDocumentStore
+
+        log.info("Using in-memory document store")
+        return LocalDocumentStore(":memory:", local_storage_latency_ms)
+    if storage_backend == "sqlite":
+        from local_store import LocalDocumentStore
+
+        log.info("Using SQLite document store at %s", local_storage_path)
+        return LocalDocumentStore(local_storage_path, local_storage_latency_ms)
+    if storage_backend != "firestore":
+        raise ValueError(f"Unknown STORAGE_BACKEND '{storage_backend}'")
+
+    from firebase_admin import firestore
+
+    return LazyDocumentStore(firestore.client)
+
+
+class LazyDocumentStore:
+    """
+    Creates the wrapped client when it is first used rather than at startup,
+    so a new instance can start serving (e.g. health checks) sooner.
+    """
+
+    def __init__(self, factory: Callable[[], DocumentStore]) -> None:
+        self.__factory = factory
+        self.__client: DocumentStore | None = None
+        self.__lock = threading.Lock()
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.__get_client(), name)
+
+    def __get_client(self) -> DocumentStore:
+        if self.__client is None:
+            with self.__lock:
+                if self.__client is None:
+                    log.info("Creating the Firestore client")
+                    self.__client = self.__factory()
+        return self.__client
+
+
+def create_async_document_store(store: DocumentStore) -> Any:
+    """
+    Returns an asyncio client (google.cloud.firestore.AsyncClient or
+    AsyncLocalDocumentStore) for the same database as `store`.
+    """
+    if uses_local_storage():
+        return store.async_client()  # type: ignore[attr-defined]
+
+    from firebase_admin import firestore_async
+
+    return firestore_async.client()
@@ -1,31 +1,35 @@
 import time
+from contextlib import contextmanager
 import functools
-import logging
-from typing import Callable, Any
-from colorama import Fore, Style, init
+from typing import Callable, Any, Dict, Iterator
 
-# Initialize colorama
-init()
+import metrics
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
-logger = logging.getLogger(__name__)
+# Name -> seconds spent in each startup_phase(), in the order they ran.
+startup_phases: Dict[str, float] = {}
 
 
 def measure_time(func: Callable) -> Callable:
+    """Records the execution time of each call in the route latency histogram."""
+    # Look up the histogram once, so recording a call only updates numbers.
+    histogram = metrics.route_latency.labels(func.__name__)
+
     @functools.wraps(func)
     def wrapper(*args, **kwargs) -> Any:
         start_time = time.perf_counter()
         try:
-            result = func(*args, **kwargs)
-            return result
+            return func(*args, **kwargs)
         finally:
-            end_time = time.perf_counter()
-            execution_time_ms = (
-                end_time - start_time
-            ) * 1000  # Convert to milliseconds
-            logger.info(
-                f"Function {Fore.YELLOW}{func.__name__}{Style.RESET_ALL} took {Fore.RED}{execution_time_ms:.2f}ms{Style.RESET_ALL} to execute"  # noqa: E501
-            )
+            histogram.observe(time.perf_counter() - start_time)
 
     return wrapper
+
+
+@contextmanager
+def startup_phase(name: str) -> Iterator[None]:
+    """Records how long a step of the app initialization takes (see bench_startup.py)."""
+    start_time = time.perf_counter()
+    try:
+        yield
+    finally:
+        startup_phases[name] = time.perf_counter() - start_time
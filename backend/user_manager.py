@@ -30,6 +30,9 @@ class User:
 
 
 class UserManager:
+    # Maximum number of users auth.get_users() accepts.
+    MAX_BATCH_LOOKUP = 100
+
     def __init__(self) -> None:
         pass
 
@@ -43,6 +46,23 @@ class UserManager:
             log.error(f"Error retrieving user information: {e}")
             return None
 
+    def get_users(self, uids: list[str]) -> dict[str, User]:
+        """Looks up several users with one call per MAX_BATCH_LOOKUP; unknown ones are left out."""
+        users: dict[str, User] = {}
+        uids = list(dict.fromkeys(uids))
+        for start in range(0, len(uids), self.MAX_BATCH_LOOKUP):
+            identifiers = [
+                auth.UidIdentifier(uid) for uid in uids[start:start + self.MAX_BATCH_LOOKUP]
+            ]
+            try:
+                result = auth.get_users(identifiers)
+            except Exception as e:
+                log.error(f"Error retrieving information of {len(identifiers)} users: {e}")
+                continue
+            for record in result.users:
+                users[record.uid] = User(record)
+        return users
+
     def num_users(self) -> int:
         try:
             page = auth.list_users()
@@ -22,6 +22,7 @@ export interface Product {
   opened?: boolean;
   used?: boolean;
   used_timestamp?: string;
+  update_time?: string;
 }
 
 interface ProductProps {
@@ -1,6 +1,6 @@
 
 import React, { useState, useMemo } from 'react';
-import { View, Text, ScrollView, TouchableOpacity, Image, Animated } from 'react-native';
+import { View, Text, ScrollView, TouchableOpacity, Image, Animated, NativeScrollEvent } from 'react-native';
 import { Modal as PaperModal, Button, IconButton, Menu } from 'react-native-paper';
 import { parse, isValid } from 'date-fns';
 import Icon from 'react-native-vector-icons/MaterialCommunityIcons';
@@ -42,8 +42,16 @@ interface ProductListProps {
     setHideExpired: (hide: boolean) => void;
     viewMode: ViewMode;
     onViewModeChange: (mode: ViewMode) => void;
+    // Called when the list is scrolled close to its end, e.g. to load the next page.
+    onEndReached?: () => void;
 }
 
+// Distance from the end of the list (in pixels) at which onEndReached is called.
+const END_REACHED_THRESHOLD = 400;
+
+const isCloseToEnd = ({ layoutMeasurement, contentOffset, contentSize }: NativeScrollEvent) =>
+    layoutMeasurement.height + contentOffset.y >= contentSize.height - END_REACHED_THRESHOLD;
+
 interface LocationItem {
     id: string;
     name: string;
@@ -74,6 +82,7 @@ const ProductList: React.FC<ProductListProps> = ({
     setHideExpired,
     viewMode,
     onViewModeChange,
+    onEndReached,
 }) => {
     const setViewMode = (mode: ViewMode) => onViewModeChange(mode);
 
@@ -641,7 +650,14 @@ const ProductList: React.FC<ProductListProps> = ({
     return (
         <>
             <View style={GlobalStyles.containerWithHeader}>
-                <ScrollView>
+                <ScrollView
+                    onScroll={(event) => {
+                        if (onEndReached && isCloseToEnd(event.nativeEvent)) {
+                            onEndReached();
+                        }
+                    }}
+                    scrollEventThrottle={200}
+                >
                     <View style={GlobalStyles.headerContainer}>
                         <View style={GlobalStyles.iconContainer}>
                             <Menu
@@ -103,6 +103,28 @@ class Requests {
     }
   }
 
+  // Returns one page of archived wasted or used products and the cursor of the next page.
+  async listArchivedProducts(
+    householdId: string,
+    status: 'wasted' | 'used',
+    cursor: string | null = null
+  ): Promise<{ products: Product[]; nextCursor: string | null }> {
+    try {
+      const response = await this._make_request(this.sessionData.idToken, 'list_archived_products', { householdId, status, cursor });
+
+      if (response.status >= 200 && response.status < 300) {
+        console.log(`Listing archived products successful. Got ${response.data.products.length} products.`);
+        return { products: response.data.products, nextCursor: response.data.next_cursor };
+      } else {
+        console.error('Request failed');
+        return { products: [], nextCursor: null };
+      }
+    } catch (error) {
+      console.error('Request failed.', error);
+      return { products: [], nextCursor: null };
+    }
+  }
+
   async addProduct(product: Product, householdId: string): Promise<boolean> {
     console.log(">>>> Adding product:", product, householdId);
     try {
@@ -172,6 +194,10 @@ class Requests {
     try {
       const response = await this._make_request(this.sessionData.idToken, `update_product/${product.product_id}`, product);
       if (response.status >= 200 && response.status < 300) {
+        // Keep the server's write time so the next update is checked against it.
+        if (response.data.update_time) {
+          product.update_time = response.data.update_time;
+        }
         console.log('Product updated successfully');
         return true;
       } else {
@@ -18,6 +18,10 @@ const UsedProductScreen = () => {
   const [searchTerm, setSearchTerm] = useState('');
   const [sortMenuVisible, setSortMenuVisible] = useState(false);
   const [menuVisible, setMenuVisible] = useState(false);
+  const [householdId, setHouseholdId] = useState<string | null>(null);
+  // Cursor of the next page of archived products, null once all are loaded.
+  const [archiveCursor, setArchiveCursor] = useState<string | null>(null);
+  const loadingArchive = React.useRef(false);
 
   const requests = new Requests();
   const householdManager = new HouseholdManager(requests);
@@ -77,6 +81,27 @@ const UsedProductScreen = () => {
     setSearchTerm('');
   };
 
+  const loadArchivedPage = (hid: string, cursor: string | null) => {
+    if (loadingArchive.current) {
+      return;
+    }
+    loadingArchive.current = true;
+    requests.listArchivedProducts(hid, 'used', cursor).then((page) => {
+      setProducts((current) => [...current, ...page.products]);
+      setArchiveCursor(page.nextCursor);
+    }).catch((error) => {
+      console.error('Error fetching archived products on UsedProductScreen:', error);
+    }).finally(() => {
+      loadingArchive.current = false;
+    });
+  };
+
+  const handleEndReached = () => {
+    if (householdId && archiveCursor) {
+      loadArchivedPage(householdId, archiveCursor);
+    }
+  };
+
   useFocusEffect(
     React.useCallback(() => {
       householdManager.getActiveHouseholdId().then((hid) => {
@@ -85,9 +110,13 @@ const UsedProductScreen = () => {
           return;
         }
         console.log('Active Household ID (UsedProductScreen):', hid);
+        setHouseholdId(hid);
+        setArchiveCursor(null);
         requests.listProducts(hid).then((products) => {
-          const usedProducts = products.filter((product) => product.used);
-          setProducts(usedProducts);
+          setProducts(products.filter((product) => product.used));
+          // Older used products are archived, the first page is appended
+          // now and the others when scrolling to the end of the list.
+          loadArchivedPage(hid, null);
         }).catch((error) => {
           console.error('Error fetching products on UsedProductScreen:', error);
         });
@@ -151,6 +180,7 @@ const UsedProductScreen = () => {
         setActiveFilter={setActiveFilter}
         hideExpired={hideExpired}
         setHideExpired={setHideExpired}
+        onEndReached={handleEndReached}
       />
     </View>
   );
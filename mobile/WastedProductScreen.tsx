@@ -18,6 +18,10 @@ const WastedProductScreen = () => {
   const [searchTerm, setSearchTerm] = useState('');
   const [sortMenuVisible, setSortMenuVisible] = useState(false);
   const [menuVisible, setMenuVisible] = useState(false);
+  const [householdId, setHouseholdId] = useState<string | null>(null);
+  // Cursor of the next page of archived products, null once all are loaded.
+  const [archiveCursor, setArchiveCursor] = useState<string | null>(null);
+  const loadingArchive = React.useRef(false);
 
   const requests = new Requests();
   const householdManager = new HouseholdManager(requests);
@@ -73,6 +77,27 @@ const WastedProductScreen = () => {
     setSearchTerm('');
   };
 
+  const loadArchivedPage = (hid: string, cursor: string | null) => {
+    if (loadingArchive.current) {
+      return;
+    }
+    loadingArchive.current = true;
+    requests.listArchivedProducts(hid, 'wasted', cursor).then((page) => {
+      setProducts((current) => [...current, ...page.products]);
+      setArchiveCursor(page.nextCursor);
+    }).catch((error) => {
+      console.error('Error fetching archived products on WastedProductScreen:', error);
+    }).finally(() => {
+      loadingArchive.current = false;
+    });
+  };
+
+  const handleEndReached = () => {
+    if (householdId && archiveCursor) {
+      loadArchivedPage(householdId, archiveCursor);
+    }
+  };
+
   useFocusEffect(
     React.useCallback(() => {
       householdManager.getActiveHouseholdId().then((hid) => {
@@ -81,9 +106,13 @@ const WastedProductScreen = () => {
           return;
         }
         console.log('Active Household ID (WastedProductScreen):', hid);
+        setHouseholdId(hid);
+        setArchiveCursor(null);
         requests.listProducts(hid).then((products) => {
-          const wastedProducts = products.filter((product) => product.wasted);
-          setProducts(wastedProducts);
+          setProducts(products.filter((product) => product.wasted));
+          // Older wasted products are archived, the first page is appended
+          // now and the others when scrolling to the end of the list.
+          loadArchivedPage(hid, null);
         }).catch((error) => {
           console.error('Error fetching products on WastedProductScreen:', error);
         });
@@ -145,6 +174,7 @@ const WastedProductScreen = () => {
         setActiveFilter={setActiveFilter}
         hideExpired={hideExpired}
         setHideExpired={setHideExpired}
+        onEndReached={handleEndReached}
       />
     </View>
   );